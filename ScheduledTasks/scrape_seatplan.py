@@ -1,12 +1,24 @@
 import os
 import sys
 from collections import defaultdict
+from itertools import chain, zip_longest
 import time
+import asyncio
+import argparse
 import concurrent.futures
 from hkmovie import SeatplanToolkit
-import threading
+from hkmovie.SeatplanBatch import process_seatplans
+from hkmovie.BrowserPool import BrowserPool
+from hkmovie.PageReadiness import PacingPolicy, WAIT_STATS
+from hkmovie.Instrumentation import METRICS
+from hkmovie.ScrapeJournal import ScrapeJournal
+from hkmovie.ExportPipeline import ExportPipeline
+from hkmovie.SeatplanHttpFetcher import SeatplanHttpFetcher, SeatplanDecodeError, BASE_URL
+from hkmovie.AsyncOrchestrator import AsyncOrchestrator, host_of
+from hkmovie.ConcurrencyController import AdaptiveConcurrency
 import sqlite3
-from data.db_management import HousesTable, SeatsTable, SalesHistoryTable
+from data.db_management import HousesTable, SeatsTable, SalesBitmapsTable, SalesDeltasTable, HouseLayoutsTable, \
+    DB_PATH, SeatRegistry, SvgBlobStore, encode_seat_bitmap, merge_seat_bitmaps, diff_seat_bitmaps, count_seat_bitmap
 from hkmovie.SeatplanFirefoxScraper import SeatplanScraper, Terminator
 
 
@@ -18,9 +30,14 @@ from hkmovie.SeatplanFirefoxScraper import SeatplanScraper, Terminator
 # assumptions:
 #   1) svg <rect> element's fill color to identify  availability of the seat (red = taken, else not taken)
 #   2) seats that are marked in red due to social distancing measure are considered taken
+#   3) a database of an older schema has been migrated once: python data/db_management.py --migrate
 #
 # flow:
-#   1) create three threads and run selenium driver
+#   1) create three threads (or asyncio tasks under a per-host rate limit, --rate) sharing one queue of the shows
+#       of every movie (--interleave to alternate between movies),
+#       scrape showtime pages by selenium drivers leased from a BrowserPool
+#       a) --fetch-mode http: fetch showtime pages over pooled HTTP connections (SeatplanHttpFetcher),
+#           pages that cannot be decoded without a browser are scraped by the drivers
 #   2) scrape show datetime, ticket price, house, seatplan svg
 #   3) process seatplan svg using hkmovie\SeatplanToolkit.py SeatplanAnalyzer
 #   4) get occupied_seats' info, parse Seat Number (if found), x coordinate (mandatory), y coordinate (mandatory)
@@ -124,96 +141,213 @@ def query_showtimes(top: int = 1500, by=None):
     return _results
 
 
-def get_scraper():
-    _scraper = getattr(threadLocal, 'scraper', None)
-    if _scraper is None:
-        # print(f'driver created')
-        _scraper = SeatplanScraper(headless=True)
-        print(f'\t\tlocal thread has no driver')
-        print(f'created new driver: {_scraper.driver.session_id}')
-        setattr(threadLocal, 'scraper', _scraper)
-        scraper_log.append(_scraper)
-    return _scraper
+def create_pool(size=3, max_pages=200, max_age=30 * 60, pacing=None, lean=False):
+    """
+    :param size: number of Firefox processes kept warm
+    :param max_pages: number of pages a driver serves before it is recycled
+    :param max_age: seconds a driver lives before it is recycled
+    :param pacing: PacingPolicy shared by the scrapers, no politeness delay if None
+    :param lean: block images, media, fonts and third-party domains (see hkmovie/LeanProfile.py)
+    :return: BrowserPool of SeatplanScraper
+    """
+    return BrowserPool(lambda: SeatplanScraper(headless=True, pacing=pacing, lean=lean),
+                       size=size, max_pages=max_pages, max_age=max_age)
 
 
-def automate_scrape(hkmovie6_code, showtime_code):
+def automate_scrape(hkmovie6_code, showtime_code, pool, fetcher=None, slot=None):
     """
-    A wrapper to create threads to scrape seatplan data.
+    A wrapper to fetch seatplan data over HTTP, or to lease a warm driver from the pool to scrape it.
 
-    When a driver in a thread fails, that driver will be removed and re-created,
+    When the page cannot be decoded without a browser, the show is scraped by a driver from the pool.
+    When a driver fails, that driver will be torn down and replaced by the pool,
     the scrape function will then resume
     :param hkmovie6_code:
     :param showtime_code:
+    :param pool: BrowserPool of SeatplanScraper
+    :param fetcher: SeatplanHttpFetcher, None to always scrape with selenium
+    :param slot: SlotOutcome of AdaptiveConcurrency.slot(), a Terminator makes the page count as an error
     :return: a dictionary containing show info, e.g. movie start time, house, ticket price, seatplan svg
     """
-    local_scraper = get_scraper()
+    if fetcher is not None:
+        try:
+            return fetcher.fetch(hkmovie6_code, showtime_code)
+        except SeatplanDecodeError as err:
+            METRICS.increment('http_fallbacks_total')
+            print(f'falling back to SeatplanScraper: {str(err)}')
+
+    local_scraper = pool.lease()
     try:
         # raise Exception('intentional Exception raised')
         _profile = local_scraper.scrape(hkmovie6_code, showtime_code)
-        return _profile
     except Terminator as terminator:
-        print(f'calling SeatplanScraper._tear_down function: driver: {local_scraper.driver.session_id}')
-        local_scraper.tear_down()
-        scraper_index = [i for i, _s in enumerate(scraper_log)
-                         if _s.driver.session_id == local_scraper.driver.session_id][0]
-
-        del scraper_log[scraper_index]
-
-        setattr(threadLocal, 'scraper', None)
+        print(f'tearing down SeatplanScraper: driver: {local_scraper.driver.session_id}')
+        pool.release(local_scraper, broken=True)
+        if slot is not None:
+            slot.fail(type(terminator).__name__)
+        METRICS.increment('retries_total', stage='show')
         print(f'\t\t==> initiating another scraper for {showtime_code}')
         time.sleep(1)
-        return automate_scrape(hkmovie6_code=hkmovie6_code, showtime_code=showtime_code)
+        return automate_scrape(hkmovie6_code=hkmovie6_code, showtime_code=showtime_code, pool=pool, slot=slot)
+    except BaseException:
+        pool.release(local_scraper, broken=True)
+        raise
+    pool.release(local_scraper)
+    return _profile
+
+
+def flatten_shows(content, interleave=False):
+    """
+    :param content: {hkmovie6_code: [showtime_code...]}
+    :param interleave: take one show of each movie in turn, so that consecutive pages are of different movies
+    :return: list of (hkmovie6_code, showtime_code)
+    """
+    _per_movie = [[(_movie, _show) for _show in content[_movie]] for _movie in content]
+    if not interleave:
+        return list(chain.from_iterable(_per_movie))
+    return [_pair for _round in zip_longest(*_per_movie) for _pair in _round if _pair is not None]
 
 
-def threads_work(content, threader: int = 2):
+def threads_work(content, threader: int = 2, pool=None, fetcher=None, controller=None, journal=None, sink=None,
+                 interleave=False):
+    """
+    every show of every movie is submitted to one work queue, and profiles are collected as they complete,
+    so that no worker waits for the slowest page of a movie before starting on the next movie
+    :param content: {hkmovie6_code: [showtime_code...]}
+    :param threader: number of threads, replaced by controller.max_workers if controller is given
+    :param controller: AdaptiveConcurrency, grows or shrinks the number of active threads at runtime
+    :param pool: BrowserPool shared across runs, a pool of `threader` drivers is created and closed if None
+    :param fetcher: SeatplanHttpFetcher tried before the pool, None to always scrape with selenium
+    :param journal: ScrapeJournal, every profile is journaled as soon as it is scraped
+    :param sink: ExportPipeline, profiles are put on it as soon as they are scraped instead of being returned
+    :param interleave: alternate between movies in the work queue (see flatten_shows)
+    :return: list of profiles, empty with a sink
+    """
     # try:
     t0 = time.time()
+    if controller is not None:
+        threader = controller.max_workers
+    _own_pool = pool is None
+    if _own_pool:
+        pool = create_pool(size=threader)
+
+    def _scrape(_show):
+        if controller is None:
+            _profile = automate_scrape(*_show, pool=pool, fetcher=fetcher)
+        else:
+            with controller.slot() as _slot:
+                _profile = automate_scrape(*_show, pool=pool, fetcher=fetcher, slot=_slot)
+        if journal is not None and _profile is not None:
+            journal.append(_show[0], _profile)
+        if sink is not None and _profile is not None:
+            # ! - handed over to the export pipeline, not kept in memory
+            sink.put(_profile)
+            return True
+        return _profile
 
     _show_container = list()
     # ||| Multi-threading
     with concurrent.futures.ThreadPoolExecutor(max_workers=threader) as executor:
-        for _movie in content:
-            args = ((_movie, _show) for _show in content[_movie])
-            _show_profiles = list(executor.map(lambda p: automate_scrape(*p), args))
-            # print(f'_show_profiles:\ttype={type(_show_profiles)}\tlen={len(_show_profiles)}')
-            _show_container.extend(_show_profiles)
+        _futures = [executor.submit(_scrape, _show) for _show in flatten_shows(content, interleave=interleave)]
+        for _future in concurrent.futures.as_completed(_futures):
+            _show_container.append(_future.result())
 
     _show_container = [__s for __s in _show_container if __s is not None]
             # _showtimes = list(executor.map(automate_scrape, hkmovie6_codes))
     t1 = time.time()
+    METRICS.observe('threads_work', t1 - t0)
     print(f"Multi-threading: {t1 - t0} seconds to download {len(_show_container)} urls.")
+    if fetcher is not None:
+        print(f'SeatplanHttpFetcher: {fetcher.decoded} decoded, {fetcher.failed} fell back to SeatplanScraper')
 
-    for _s in scraper_log:
-        # print(f'tearing down')
-        _s.tear_down()
-    return _show_container
+    if _own_pool:
+        pool.close()
+    return _show_container if sink is None else list()
     # except Exception as err:
     #     print(f'threads_work() error: {str(err)}')
     #     pass
 
 
-def export_profile_to_db(_profiles):
+def async_work(content, orchestrator, pool, fetcher=None, journal=None, sink=None, interleave=False):
+    """
+    scrape shows as asyncio tasks under the per-host token bucket of orchestrator (see hkmovie/AsyncOrchestrator.py),
+    pages are fetched over http first, then by a driver leased from the pool
+    :param content: {hkmovie6_code: [showtime_code...]}
+    :param orchestrator: AsyncOrchestrator, browser_workers should be the size of the pool
+    :param pool: BrowserPool of SeatplanScraper
+    :param fetcher: SeatplanHttpFetcher tried before the pool, None to always scrape with selenium
+    :param journal: ScrapeJournal, every profile is journaled as soon as it is scraped
+    :param sink: ExportPipeline, profiles are put on it as soon as they are scraped instead of being returned
+    :param interleave: alternate between movies in the order tasks are started (see flatten_shows)
+    :return: list of profiles, empty with a sink
+    """
+    t0 = time.time()
+    _host = host_of(fetcher.base_url if fetcher is not None else BASE_URL)
+    # ! - pages are awaited over aiohttp on the loop; without aiohttp, the blocking fetch() runs on the http threads
+    _fetch, _finalize = None, None
+    if fetcher is not None:
+        _fetch = fetcher.fetch_async if fetcher.async_capable else fetcher.fetch
+        _finalize = fetcher.close_async if fetcher.async_capable else None
+
+    async def _scrape(_orchestrator, _show):
+        _profile = None
+        if fetcher is not None:
+            try:
+                _profile = await _orchestrator.http(_host, _fetch, *_show)
+            except SeatplanDecodeError as err:
+                print(f'falling back to SeatplanScraper: {str(err)}')
+        if _profile is None:
+            _profile = await _orchestrator.browser(_host, automate_scrape, *_show, pool=pool)
+        if journal is not None and _profile is not None:
+            journal.append(_show[0], _profile)
+        if sink is not None and _profile is not None:
+            # ! - put() may block (backpressure), so it runs off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, sink.put, _profile)
+            return True
+        return _profile
+
+    _shows = flatten_shows(content, interleave=interleave)
+    _show_container = [__s for __s in orchestrator.run(_scrape, _shows, finalize=_finalize) if __s is not None]
+    t1 = time.time()
+    METRICS.observe('async_work', t1 - t0)
+    print(f"AsyncOrchestrator: {t1 - t0} seconds to download {len(_show_container)} urls.")
+    orchestrator.print_summary()
+    if fetcher is not None:
+        print(f'SeatplanHttpFetcher: {fetcher.decoded} decoded, {fetcher.failed} fell back to SeatplanScraper')
+    return _show_container if sink is None else list()
+
+
+def export_profile_to_db(_profiles, max_workers=None, db_path=None):
     """
     flow:
-    1) DROP INDEX SalesHistory_indices to improve INSERT performance
-    2) get all Houses' names from profiles and create House record if not exists
-    3) UPDATE Showtimes SET start_time, ticket_price
+    0) process all seatplans with SeatplanBatch.process_seatplans, across worker processes for large runs;
+        this is done before any write, as worker processes re-import this module (and data.db_management)
+    1) get all Houses' names from profiles and create House record if not exists
+    2) UPDATE Showtimes SET start_time, ticket_price
+    3) load Houses, Seats of the houses (SeatRegistry), Showtimes and SalesBitmaps of the shows once
     4) for each show in profiles, do:
-    5) UPDATE Houses SET svg, capacity
-    6) UPDATE Showtimes SET houseID
-    7) INSERT INTO Seats (seat_number, houseID, x, y)
-    8) INSERT INTO SalesHistory (seatID)
-    9) CREATE INDEX SalesHistory_indices
+        (seatplans of known layout fingerprints are read from HouseLayouts instead of being parsed,
+        the clean svg of a new layout is written to SvgBlobs once, HouseLayouts only keeps its svg_hash)
+    5) UPDATE Houses SET svg_hash, capacity, if the hash of the clean svg or the capacity changed
+        (the clean svg is stored once per hash in SvgBlobs, compressed)
+    6) UPDATE Showtimes SET houseID, if changed; the bitmap and SalesDeltas of the show in its former house
+        are dropped, as their bits are seat_index of the former house's seats
+    7) INSERT INTO Seats (seat_number, houseID, x, y, seat_index), only seats missing from SeatRegistry
+    8) UPSERT SalesBitmaps (bitmap of taken seats' seat_index, OR-ed with the bitmap of the previous scrape),
+        all changed shows in one executemany; shows whose bitmap is unchanged are not written
+    9) INSERT INTO SalesDeltas the seats taken since the previous scrape (first-seen time)
     :param _profiles:
+    :param max_workers: number of processes used to process seatplans, defaults to os.cpu_count()
+    :param db_path: defaults to data.db_management.DB_PATH
     :return:
     """
-    _db = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, r'data\hk-movies.db'))
-    _conn = sqlite3.connect(_db)
+    _conn = sqlite3.connect(db_path or DB_PATH)
     _cursor = _conn.cursor()
 
-    saleshistory_table = SalesHistoryTable()
+    salesbitmaps_table = SalesBitmapsTable()
+    salesdeltas_table = SalesDeltasTable()
     seats_table = SeatsTable()
     houses_table = HousesTable()
+    house_layouts_table = HouseLayoutsTable()
 
     # ! - create tables if not exist
     # try:
@@ -233,8 +367,24 @@ def export_profile_to_db(_profiles):
                     print(f'{_key}: {_p[_key]}')
             print('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
 
-    # ! - drop index to increase UPDATE/INSERT speed
-    _cursor.executescript("DROP INDEX IF EXISTS SalesHistory_indices;")
+    _cursor.executescript(house_layouts_table.create_table_statement())
+    svg_store = SvgBlobStore(_cursor)
+    layout_cache = SeatplanToolkit.LayoutCache(_cursor, svg_store)
+
+    # ! - process seatplans, shows of the same house are kept together so that they share a worker's layout cache
+    _house_names = list({_p['house'] for _p in _profiles if _p.get('house') is not None})
+    layout_cache.preload(_r[0] for _r in _cursor.execute(
+        f"SELECT HouseID FROM Houses WHERE name IN ({', '.join('?' * len(_house_names))})", _house_names))
+    _seatplans = process_seatplans(
+        ((_p['showtime_code'], _p['seatplan']) for _p in sorted(_profiles, key=lambda _p: str(_p.get('house')))),
+        layout_cache=layout_cache, max_workers=max_workers)
+    # ! - layouts are resolved before any show is assigned to its house below, so that assign_house() replacing
+    # ! - the layout of a house (e.g., fingerprints A, B, then A again) cannot take a layout of this run away
+    _layouts = {_r.fingerprint: layout_cache.get(_r.fingerprint) for _r in _seatplans.values()}
+    _missing = [_fingerprint for _fingerprint, _layout in _layouts.items() if _layout is None]
+    if _missing:
+        raise RuntimeError(f'export_profile_to_db(): layouts of {len(_missing)} fingerprints are not cached, '
+                           f'e.g., {_missing[0]}')
 
     # ! - create House records if not exist
     _houses = {_r['house'] for _r in _profiles if _r.get('house') is not None}
@@ -247,45 +397,91 @@ def export_profile_to_db(_profiles):
             print(f'received error when inserting record ({_h}) to Houses table: {repr(err)}')
 
 
-    # ! - update Showtimes.start_time, price
+    # ! - update Showtimes.start_time, price, rows that are already up to date are not rewritten
     _cursor.executemany("UPDATE Showtimes SET start_time = :start_time, price = :price"
-                        " WHERE showtime_code = :showtime_code", _profiles)
+                        " WHERE showtime_code = :showtime_code"
+                        " AND (start_time IS NOT :start_time OR price IS NOT :price)", _profiles)
+
+    # ! - Houses, Seats of every touched house, Showtimes and bitmaps of every show are read once
+    _house_state = {_name: [_house_id, _svg_hash, _capacity] for _name, _house_id, _svg_hash, _capacity in
+                    _cursor.execute("SELECT name, HouseID, svg_hash, capacity FROM Houses"
+                                    f" WHERE name IN ({', '.join('?' * len(_house_names))})", _house_names)}
+    seat_registry = SeatRegistry(_cursor)
+    seat_registry.load(_h[0] for _h in _house_state.values())
+    _showtime_codes = [_p['showtime_code'] for _p in _profiles]
+    _show_state = dict()
+    for _i in range(0, len(_showtime_codes), 500):
+        _chunk = _showtime_codes[_i:_i + 500]
+        _show_state.update((_code, [_showtime_id, _house_id, _bitmap]) for _code, _showtime_id, _house_id, _bitmap in
+                           _cursor.execute(
+            "SELECT s.showtime_code, s.ShowtimeID, s.HouseID, b.bitmap FROM Showtimes AS s LEFT JOIN SalesBitmaps AS b"
+            f" ON b.ShowtimeID = s.ShowtimeID WHERE s.showtime_code IN ({', '.join('?' * len(_chunk))})", _chunk))
+    _sales, _deltas = dict(), list()
+    _houses_written, _shows_unchanged = set(), 0
 
     for _show in _profiles:
-        _sp = SeatplanToolkit.SeatplanProcessor(_show["seatplan"])
+        _house = _house_state[_show['house']]
+        _house_id = _house[0]
+
+        _sp = _seatplans[_show['showtime_code']]
+        _layout = _layouts[_sp.fingerprint]
+        layout_cache.assign_house(_house_id, _sp.fingerprint)
 
         _op = _sp.get_occupied_seats()
 
         _op = list(_op)
 
-        _house_id = int(_cursor.execute('SELECT HouseID FROM Houses WHERE name = ?', [_show['house']]).fetchone()[0])
-
-        _cursor.execute(
-            f"UPDATE Houses SET svg = ?, capacity = ? WHERE HouseID = {_house_id};",
-            [_sp.export_clean_svg(), _sp.get_house_capacity()]
-        )
-
-        _cursor.executemany("INSERT INTO Seats (seat_number, HouseID, x, y) "
-                            f"SELECT :seat_number, {_house_id}, :x, :y "
-                            f"WHERE NOT EXISTS"
-                            f" (SELECT 1 FROM Seats"
-                            f" WHERE Seats.x = :x AND Seats.y = :y AND Seats.HouseID = {_house_id})", list(_op))
-
-        _showtime_id = int(_cursor.execute('SELECT ShowtimeID FROM Showtimes WHERE showtime_code = ?',
-                                           [_show['showtime_code']]).fetchone()[0])
-
-        _cursor.execute(f"UPDATE Showtimes SET HouseID = {_house_id} WHERE ShowtimeID = {_showtime_id};")
-
-        try:
-            _cursor.executemany("INSERT OR IGNORE INTO SalesHistory (SeatID, ShowtimeID) "
-                                f"SELECT SeatID, {_showtime_id} FROM Seats WHERE seat_number = :seat_number"
-                                f" AND x = :x AND y = :y"
-                                f" AND HouseID = {_house_id}", list(_op))
-        except Exception as err:
-            print(f'received error when inserting record to SalesHistory table: {str(err)}')
-
+        # ! - Houses.svg_hash and capacity are only written when the clean svg (by hash) or capacity changes,
+        # ! - the svg itself was written to SvgBlobs by layout_cache, once per hash
+        if _house[1:] != [_layout.svg_hash, _sp.get_house_capacity()]:
+            _house[1:] = [_layout.svg_hash, _sp.get_house_capacity()]
+            svg_store.claim(_layout.svg_hash, _house_id)
+            _cursor.execute(
+                f"UPDATE Houses SET svg = NULL, svg_hash = ?, capacity = ? WHERE HouseID = {_house_id};",
+                [_house[1], _house[2]]
+            )
+            _houses_written.add(_house_id)
+
+        # ! - seat_index numbers the seats of a house in insertion order, i.e., the bit position in SalesBitmaps
+        _seats = seat_registry.resolve(_house_id, _op)
+
+        _state = _show_state[_show['showtime_code']]
+        _showtime_id, _previous = _state[0], _state[2]
+
+        if _state[1] != _house_id:
+            _state[1] = _house_id
+            _cursor.execute(f"UPDATE Showtimes SET HouseID = {_house_id} WHERE ShowtimeID = {_showtime_id};")
+            # ! - bits of the former house's bitmap are not seats of this house, the show starts over in this house
+            if _previous is not None:
+                _previous = None
+                _cursor.execute(f"DELETE FROM SalesDeltas WHERE ShowtimeID = {_showtime_id};")
+
+        _bitmap = encode_seat_bitmap(_seat_index for _seat_id, _seat_index in _seats)
+        # ! - seats sold in a previous scrape stay sold, as INSERT OR IGNORE INTO SalesHistory used to do
+        if _previous is not None:
+            _bitmap = merge_seat_bitmaps(_previous, _bitmap)
+            if _bitmap == _previous:
+                _shows_unchanged += 1
+                continue
+        # ! - only seats that were not taken in the previous scrape are recorded, with their first-seen time
+        _new_seats = diff_seat_bitmaps(_bitmap, _previous or b'')
+        if _new_seats:
+            _deltas.append((_showtime_id, _new_seats, count_seat_bitmap(_new_seats), None))
+        _state[2] = _bitmap
+        _sales[_showtime_id] = (_showtime_id, _house_id, _bitmap, count_seat_bitmap(_bitmap), None)
 
-    _cursor.executescript("CREATE INDEX IF NOT EXISTS SalesHistory_indices ON SalesHistory (ShowtimeID);")
+    try:
+        _cursor.executemany(salesbitmaps_table.upsert_statement(), list(_sales.values()))
+        _cursor.executemany(salesdeltas_table.insert_statement(), _deltas)
+    except Exception as err:
+        print(f'received error when inserting record to SalesBitmaps table: {str(err)}')
+
+    _parsed = sum(1 for _r in _seatplans.values() if _r.parsed)
+    print(f'seatplans: {len(_seatplans) - _parsed} read from cached layouts, {_parsed} parsed')
+    print(f'seats: {seat_registry.created} created, {seat_registry.renumbered} renumbered '
+          f'in {len(seat_registry.houses)} houses')
+    print(f'shows: {_shows_unchanged} unchanged, {len(_sales)} written ({len(_deltas)} with newly sold seats); '
+          f'houses: {len(_houses_written)} written, {svg_store.written} new svg blobs')
 
     _conn.commit()
     _conn.close()
@@ -294,26 +490,119 @@ def export_profile_to_db(_profiles):
 
 
 if __name__ == "__main__":
-    # ! - query_by accepts: "last_n_hour", "unknown_date"
-    print(f'Begin: {time.ctime(time.time())}\n******************************************')
-    try:
-        query_by = sys.argv[1]
-    except IndexError:
-        query_by = "last_n_hour"
-
-    if query_by == "last_n_hour":
-        results = query_last_n_hour(last_n_hour=5)
-    elif query_by == "unknown_date":
-        results = query_unknown_date()
-    else:
-        results = query_showtimes(top=1000, by="timeslot")
-
-    if results is not None and len(results) > 0:
-        threadLocal = threading.local()
-        scraper_log = []
-
-        # ! - starts mutli-threads scraping
-        shows = threads_work(results, 3)
-        export_profile_to_db(_profiles=shows)
+    # ! - query_by accepts: "last_n_hour", "unknown_date", several of them are run in turn on the same warm pool
+    parser = argparse.ArgumentParser(description='scrape seat plans of shows and export them to the database')
+    parser.add_argument('query_by', nargs='*', default=['last_n_hour'])
+    parser.add_argument('--threads', type=int, default=3)
+    parser.add_argument('--pool-size', type=int, default=None, help='number of warm drivers, defaults to --threads')
+    parser.add_argument('--max-pages', type=int, default=200, help='pages served by a driver before it is recycled')
+    parser.add_argument('--max-age', type=int, default=30 * 60, help='seconds before a driver is recycled')
+    parser.add_argument('--pace-min', type=float, default=1.0, help='minimum politeness delay (seconds) per page')
+    parser.add_argument('--pace-max', type=float, default=3.0, help='maximum politeness delay (seconds) per page')
+    parser.add_argument('--fetch-mode', choices=['http', 'browser'], default='browser',
+                        help='browser: selenium only; http: fetch pages without a browser, falling back to selenium '
+                             '(only verified on generated pages so far)')
+    parser.add_argument('--record-dir', default=None, help='save fetched pages, to be replayed by a stand-in server')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='requests per second to the site, runs the asyncio orchestrator instead of threads')
+    parser.add_argument('--burst', type=int, default=4, help='requests sent at once after idling, with --rate')
+    parser.add_argument('--http-workers', type=int, default=10,
+                        help='http fetches in flight (threads without aiohttp), with --rate')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='adapt active threads (--min-threads to --max-threads) to latency and errors')
+    parser.add_argument('--min-threads', type=int, default=1)
+    parser.add_argument('--max-threads', type=int, default=8)
+    parser.add_argument('--target-latency', type=float, default=None,
+                        help='seconds per page above which threads are reduced, learned if omitted')
+    parser.add_argument('--lean', action='store_true',
+                        help='experimental, not measured yet (see benchmarks/page_load_benchmark.py): '
+                             'lean Firefox profile, block images, media, fonts and third-party domains')
+    parser.add_argument('--metrics-dir', default=os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'metrics'),
+                        help='directory of the json run report and the Prometheus text file')
+    parser.add_argument('--no-resume', action='store_true',
+                        help='scrape again the shows journaled by an interrupted run (their journaled profiles are '
+                             'still exported), instead of skipping them')
+    parser.add_argument('--journal-dir', default=os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'journal'),
+                        help='directory of the journals, one per query_by')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='export profiles in micro-batches on a writer thread while scraping, not at the end')
+    parser.add_argument('--queue-size', type=int, default=200,
+                        help='profiles waiting for the writer, scrapers block beyond it (with --pipeline)')
+    parser.add_argument('--batch-size', type=int, default=50, help='profiles per commit (with --pipeline)')
+    parser.add_argument('--interleave', action='store_true',
+                        help='alternate between movies in the work queue, instead of one movie after another')
+    args = parser.parse_args()
+
+    fetcher = None
+    if args.fetch_mode == 'http':
+        # ! - the site (or a stand-in server) is set for every scraper by HKMOVIE6_BASE_URL, see hkmovie/SiteConfig.py
+        fetcher = SeatplanHttpFetcher(pool_size=max(args.threads, args.http_workers), record_dir=args.record_dir)
+
+    controller = None
+    if args.adaptive:
+        controller = AdaptiveConcurrency(min_workers=args.min_threads, max_workers=args.max_threads,
+                                         initial=args.threads, target_latency=args.target_latency)
 
+    print(f'Begin: {time.ctime(time.time())}\n******************************************')
+    pipeline_stats = dict()
+    pool_size = args.pool_size or (controller.max_workers if controller is not None else args.threads)
+    with create_pool(size=pool_size, max_pages=args.max_pages, max_age=args.max_age,
+                     pacing=PacingPolicy(args.pace_min, args.pace_max), lean=args.lean) as pool:
+        for query_by in args.query_by:
+            if query_by == "last_n_hour":
+                results = query_last_n_hour(last_n_hour=5)
+            elif query_by == "unknown_date":
+                results = query_unknown_date()
+            else:
+                results = query_showtimes(top=1000, by="timeslot")
+
+            # ! - every scraped profile is journaled, the journal is removed once the run is exported;
+            # ! - the journal left by an interrupted run is resumed, its shows are not scraped again
+            journal = ScrapeJournal(os.path.join(args.journal_dir, f'seatplan-{query_by}.jsonl'))
+            if not args.no_resume and results is not None:
+                results = journal.pending(results)
+            shows = journal.profiles()
+
+            # ! - pipelined: a writer thread exports micro-batches while the shows are being scraped
+            pipeline = None
+            if args.pipeline:
+                pipeline = ExportPipeline(lambda _batch: export_profile_to_db(_profiles=_batch, max_workers=1),
+                                          max_queue=args.queue_size, batch_size=args.batch_size).start()
+                for profile in shows:
+                    pipeline.put(profile)
+                shows = list()
+
+            if results is not None and len(results) > 0:
+                # ! - in http mode, drivers are only started when a page falls back to selenium
+                if fetcher is None:
+                    pool.warm()
+                if args.rate is not None:
+                    orchestrator = AsyncOrchestrator(rate=args.rate, burst=args.burst,
+                                                     browser_workers=pool_size,
+                                                     http_workers=args.http_workers)
+                    shows += async_work(results, orchestrator, pool=pool, fetcher=fetcher, journal=journal,
+                                        sink=pipeline, interleave=args.interleave)
+                else:
+                    # ! - starts mutli-threads scraping
+                    shows += threads_work(results, args.threads, pool=pool, fetcher=fetcher, controller=controller,
+                                          journal=journal, sink=pipeline, interleave=args.interleave)
+            failed_batches = 0
+            if pipeline is not None:
+                pipeline.close()
+                pipeline.print_summary()
+                pipeline_stats[query_by] = pipeline.summary()
+                failed_batches = pipeline.failed
+            elif len(shows) > 0:
+                export_profile_to_db(_profiles=shows)
+            # ! - the journal is kept for the next run if a batch failed to export
+            journal.close(remove=failed_batches == 0)
+
+    if fetcher is not None:
+        fetcher.close()
+    WAIT_STATS.print_summary()
+    METRICS.print_summary()
+    report_paths = METRICS.write_report(args.metrics_dir, 'seatplan', extra={
+        "query_by": args.query_by, "threads": args.threads, "fetch_mode": args.fetch_mode,
+        "waits": WAIT_STATS.summary(), "export_pipeline": pipeline_stats})
+    print(f'run report: {", ".join(report_paths)}')
     print(f'******************************************\nEnd: {time.ctime(time.time())}')
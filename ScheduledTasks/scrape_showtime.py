@@ -2,12 +2,18 @@ import os
 import sqlite3
 import orjson
 import time
+import argparse
 import concurrent.futures
-import threading
 from urllib.parse import urljoin
 from data.db_management import ShowtimesTable
 # from hkmovie.ShowtimeScraper import ShowtimeScraper
 from hkmovie.ShowtimeFirefoxScraper import ShowtimeScraper
+from hkmovie.BrowserPool import BrowserPool
+from hkmovie.PageReadiness import PacingPolicy, WAIT_STATS
+from hkmovie.Instrumentation import METRICS
+from hkmovie.AsyncOrchestrator import AsyncOrchestrator
+from hkmovie.ConcurrencyController import AdaptiveConcurrency
+from hkmovie.SiteConfig import HOST
 
 # =====================================================================================================================|
 # =====================================================================================================================|
@@ -15,10 +21,13 @@ from hkmovie.ShowtimeFirefoxScraper import ShowtimeScraper
 # Runs at 10:15am, 08:15pm
 # flow:
 #   1) select top 20 movies with at least 50 likes
-#   2) create three threads and run selenium-wire driver
+#   2) create three threads (or asyncio tasks under a per-host rate limit, --rate)
+#       and lease selenium-wire drivers from a warm BrowserPool
 #   3) go to https://hkmovie6.com/movie/{hkmovie6_code}/showtime
 #   4) navigate through all the showing dates (simulate button click event)
-#   5) read driver.requests.response.body and extract showtime_code using regular expression
+#   5) decode gRPC-web responses into showtime_code as they arrive (see hkmovie/GrpcWebDecoder.py)
+#       (scoped capture: only POST requests to hkmovie6 are recorded, capped per scrape)
+#   6) insert new showtimes; start_time, price and HouseID are filled by the seatplan runs
 # =====================================================================================================================|
 # =====================================================================================================================|
 
@@ -44,47 +53,98 @@ def get_target_movies(minimum_like: int = 50, top: int = 15):
         _conn.close()
 
 
-def get_scraper():
-    _scraper = getattr(threadLocal, 'scraper', None)
-    if _scraper is None:
-        # print(f'driver created')
-        _scraper = ShowtimeScraper(headless=True)
-        setattr(threadLocal, 'scraper', _scraper)
-        scraper_log.append(_scraper)
-    return _scraper
-
-
-def automate_scrape(hkmovie6_code):
-    local_scraper = get_scraper()
+def create_pool(size=3, max_pages=50, max_age=30 * 60, pacing=None, lean=False, record_dir=None):
+    """
+    :param size: number of Firefox processes kept warm
+    :param max_pages: number of movies a driver serves before it is recycled
+    :param max_age: seconds a driver lives before it is recycled
+    :param pacing: PacingPolicy shared by the scrapers, no politeness delay if None
+    :param lean: block images, media, fonts and third-party domains (see hkmovie/LeanProfile.py)
+    :param record_dir: directory where the scrapers save every gRPC response body, not saved if None
+    :return: BrowserPool of ShowtimeScraper
+    """
+    return BrowserPool(lambda: ShowtimeScraper(headless=True, pacing=pacing, lean=lean, record_dir=record_dir),
+                       size=size, max_pages=max_pages, max_age=max_age)
+
+
+def automate_scrape(hkmovie6_code, pool, slot=None):
+    """
+    :param slot: SlotOutcome of AdaptiveConcurrency.slot(), a failed scrape makes the movie count as an error
+    """
+    local_scraper = pool.lease()
     try:
         secret_codes = local_scraper.scrape(hkmovie6_code)
         local_scraper.shuffle_user_agent()
-        return secret_codes
     except Exception as err:
         print(f'-automate_scrape error: {str(err)}')
-        local_scraper.tear_down()
+        pool.release(local_scraper, broken=True)
+        if slot is not None:
+            slot.fail(type(err).__name__)
         print('local scraper tore down')
-        scraper_index = [i for i, _s in enumerate(scraper_log)
-                         if _s.driver.session_id == local_scraper.driver.session_id][0]
-
-        del scraper_log[scraper_index]
-
-        setattr(threadLocal, 'scraper', None)
+        METRICS.increment('retries_total', stage='movie')
         time.sleep(1)
-        return automate_scrape(hkmovie6_code=hkmovie6_code)
-
-
-def threads_work(hkmovie6_codes, threader: int = 2):
+        return automate_scrape(hkmovie6_code=hkmovie6_code, pool=pool, slot=slot)
+    except BaseException:
+        pool.release(local_scraper, broken=True)
+        raise
+    pool.release(local_scraper)
+    # ! - ShowtimeScraper.scrape() returns None when a Terminator is raised
+    if secret_codes is None and slot is not None:
+        slot.fail('Terminator')
+    return secret_codes
+
+
+def threads_work(hkmovie6_codes, threader: int = 2, pool=None, controller=None):
+    """
+    :param hkmovie6_codes: list of hkmovie6_code
+    :param threader: number of threads, replaced by controller.max_workers if controller is given
+    :param pool: BrowserPool shared across runs, a pool of `threader` drivers is created and closed if None
+    :param controller: AdaptiveConcurrency, grows or shrinks the number of active threads at runtime
+    :return:
+    """
     t0 = time.time()
+    if controller is not None:
+        threader = controller.max_workers
+    _own_pool = pool is None
+    if _own_pool:
+        pool = create_pool(size=threader)
+
+    def _scrape(_code):
+        if controller is None:
+            return automate_scrape(_code, pool=pool)
+        with controller.slot() as _slot:
+            return automate_scrape(_code, pool=pool, slot=_slot)
 
     # ||| Multi-threading
     with concurrent.futures.ThreadPoolExecutor(max_workers=threader) as executor:
-        _showtimes = list(executor.map(automate_scrape, hkmovie6_codes))
+        _showtimes = list(executor.map(_scrape, hkmovie6_codes))
     t1 = time.time()
+    METRICS.observe('threads_work', t1 - t0)
     print(f"Multi-threading: {t1 - t0} seconds to download {len(hkmovie6_codes)} urls.")
 
-    for s in scraper_log:
-        s.tear_down()
+    if _own_pool:
+        pool.close()
+    return _showtimes
+
+
+def async_work(hkmovie6_codes, orchestrator, pool):
+    """
+    scrape movies as asyncio tasks under the per-host token bucket of orchestrator (see hkmovie/AsyncOrchestrator.py)
+    :param hkmovie6_codes: list of hkmovie6_code
+    :param orchestrator: AsyncOrchestrator, browser_workers should be the size of the pool
+    :param pool: BrowserPool of ShowtimeScraper
+    :return:
+    """
+    t0 = time.time()
+
+    async def _scrape(_orchestrator, _code):
+        return await _orchestrator.browser(HOST, automate_scrape, _code, pool=pool)
+
+    _showtimes = orchestrator.run(_scrape, hkmovie6_codes)
+    t1 = time.time()
+    METRICS.observe('async_work', t1 - t0)
+    print(f"AsyncOrchestrator: {t1 - t0} seconds to download {len(hkmovie6_codes)} urls.")
+    orchestrator.print_summary()
     return _showtimes
 
 
@@ -124,12 +184,55 @@ def export_showtime_to_db(results):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='scrape showtime codes of movies in theatre')
+    parser.add_argument('--threads', type=int, default=3)
+    parser.add_argument('--pool-size', type=int, default=None, help='number of warm drivers, defaults to --threads')
+    parser.add_argument('--max-pages', type=int, default=50, help='movies served by a driver before it is recycled')
+    parser.add_argument('--max-age', type=int, default=30 * 60, help='seconds before a driver is recycled')
+    parser.add_argument('--pace-min', type=float, default=0.0, help='minimum politeness delay (seconds) per date click')
+    parser.add_argument('--pace-max', type=float, default=3.0, help='maximum politeness delay (seconds) per date click')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='movies per second, runs the asyncio orchestrator instead of threads')
+    parser.add_argument('--burst', type=int, default=2, help='movies started at once after idling, with --rate')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='adapt active threads (--min-threads to --max-threads) to latency and errors')
+    parser.add_argument('--min-threads', type=int, default=1)
+    parser.add_argument('--max-threads', type=int, default=6)
+    parser.add_argument('--target-latency', type=float, default=None,
+                        help='seconds per movie above which threads are reduced, learned if omitted')
+    parser.add_argument('--lean', action='store_true',
+                        help='experimental, not measured yet (see benchmarks/page_load_benchmark.py): '
+                             'lean Firefox profile, block images, media, fonts and third-party domains')
+    parser.add_argument('--metrics-dir', default=os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'metrics'),
+                        help='directory of the json run report and the Prometheus text file')
+    parser.add_argument('--record-dir', default=None,
+                        help='save every gRPC response body, to pin the fields of hkmovie/GrpcWebDecoder.py')
+    args = parser.parse_args()
+
+    controller = None
+    if args.adaptive:
+        # ! - a run covers ~20 movies, so decisions are made every 4 movies
+        controller = AdaptiveConcurrency(min_workers=args.min_threads, max_workers=args.max_threads,
+                                         initial=args.threads, target_latency=args.target_latency, window=4)
+
     target_movies = get_target_movies(minimum_like=50, top=20)
     if target_movies is not None and len(target_movies) > 0:
-        threadLocal = threading.local()
-        scraper_log = []
-
-        showtimes = threads_work(target_movies, 3)
+        pool_size = args.pool_size or (controller.max_workers if controller is not None else args.threads)
+        with create_pool(size=pool_size, max_pages=args.max_pages, max_age=args.max_age,
+                         pacing=PacingPolicy(args.pace_min, args.pace_max), lean=args.lean,
+                         record_dir=args.record_dir) as pool:
+            pool.warm()
+            if args.rate is not None:
+                orchestrator = AsyncOrchestrator(rate=args.rate, burst=args.burst,
+                                                 browser_workers=pool_size, http_workers=1)
+                showtimes = async_work(target_movies, orchestrator, pool=pool)
+            else:
+                showtimes = threads_work(target_movies, args.threads, pool=pool, controller=controller)
         showtimes = [s for s in showtimes if s is not None]
+        WAIT_STATS.print_summary()
+        METRICS.print_summary()
 
         export_showtime_to_db(results=showtimes)
+        report_paths = METRICS.write_report(args.metrics_dir, 'showtime', extra={
+            "movies": len(target_movies), "threads": args.threads, "waits": WAIT_STATS.summary()})
+        print(f'run report: {", ".join(report_paths)}')
@@ -0,0 +1,149 @@
+import os
+import re
+import sys
+import time
+import sqlite3
+import argparse
+from lxml import etree
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from hkmovie.SeatplanToolkit import SeatplanProcessor
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Benchmark - export_clean_svg |}
+#
+# Compares the regex based export_clean_svg (serialize the whole tree, then two re.sub passes)
+# with the tree-level recoloring done by SeatplanProcessor while it parses the seat plan.
+#
+# columns:
+#   legacy: serialize the parsed tree + regex
+#   parse+clean: SeatplanProcessor end to end, i.e., parsing seats, recoloring and serializing rows
+#   clean: parse+clean minus a parse-only run (recoloring and serializing disabled)
+# speedup is legacy / clean
+#
+# corpus:
+#   a) a directory of seat plan svg files, as scraped by SeatplanScraper (profile["seatplan"])
+#   b) clean svg of the houses (SvgBlobs) from data\hk-movies.db
+#
+# usage:
+#   python benchmarks/clean_svg_benchmark.py --svg-dir <directory> --repeat 20
+#   python benchmarks/clean_svg_benchmark.py --from-db 50
+#
+# results:
+#   generated corpus (python benchmarks/seatplan_generator.py --out-dir <directory>, --repeat 20,
+#   python 3.11, 1 x86_64 core):
+#       seatplan            size (KB)  legacy (ms)  parse+clean (ms)  clean (ms)  speedup
+#       grand_800.svg           161.4        30.35             18.01        2.94    10.3x
+#       imax_600.svg            122.8        14.40             13.29        2.05     7.0x
+#       large_400.svg            82.1         7.72              9.97        2.62     2.9x
+#       medium_250.svg           52.0         2.58              6.21        0.88     2.9x
+#       small_120.svg            24.6         1.99              2.94        0.55     3.6x
+#       studio_50.svg            10.6         0.62              1.41        0.21     3.0x
+#       TOTAL                                57.65             51.84        9.26     6.2x
+#   scraped corpus (--svg-dir of SeatplanScraper's seat plans, or --from-db): not measured yet
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+
+def legacy_export_clean_svg(tree):
+    """
+    export_clean_svg as it was before seats are recolored during parsing
+    :param tree: lxml tree of the seat plan
+    :return: str
+    """
+    _svg = etree.tostring(tree, encoding='unicode', pretty_print=False)
+    _svg = re.sub(
+        r'(<rect.*?\()255, 0, 0(\).*?stroke: ?rgb\()255, 0, 0(\).*?/>|\).+></rect>)',
+        r"\g<1>0, 255, 0\g<2>0, 255, 0\g<3>", _svg)
+    _svg = re.sub(
+        r'(<text.*?; ??fill ??: ??rgb\()255, 0, 0(\).*?\">)',
+        r"\g<1>0, 0, 0\g<2>", _svg)
+    return _svg
+
+
+class ParseOnlyProcessor(SeatplanProcessor):
+    """SeatplanProcessor without recoloring and serializing rows, used as a baseline"""
+    def clean_element(self, element):
+        pass
+
+    def serialize_fragment(self, element, nsmap):
+        return ''
+
+
+def load_corpus_from_dir(svg_dir):
+    _corpus = list()
+    for _f in sorted(os.listdir(svg_dir)):
+        if str(_f).endswith('.svg'):
+            with open(os.path.join(svg_dir, _f), 'r', encoding='utf-8') as f:
+                _corpus.append((_f, f.read()))
+    return _corpus
+
+
+def load_corpus_from_db(limit):
+    from data.db_management import SvgBlobStore
+
+    _db = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'hk-movies.db'))
+    _conn = sqlite3.connect(_db)
+    _store = SvgBlobStore(_conn.cursor())
+    _corpus = [(f'{_name}.svg', _svg.text) for _, _name, _svg in _store.house_svgs()][:limit]
+    _conn.close()
+    return _corpus
+
+
+def run_benchmark(corpus, repeat=10):
+    """
+    :param corpus: list of (name, svg string)
+    :param repeat: number of runs per seat plan
+    :return: tuple of total seconds (legacy, clean)
+    """
+    _legacy_total, _new_total, _clean_total = 0, 0, 0
+    print(f'{"seatplan":<32}{"size (KB)":>10}{"legacy (ms)":>13}{"parse+clean (ms)":>18}{"clean (ms)":>12}'
+          f'{"speedup":>9}')
+    for _name, _svg in corpus:
+        _tree = etree.fromstring(_svg)
+
+        _t0 = time.perf_counter()
+        for _ in range(repeat):
+            _legacy_svg = legacy_export_clean_svg(_tree)
+        _t1 = time.perf_counter()
+        for _ in range(repeat):
+            _new_svg = SeatplanProcessor(_svg).export_clean_svg()
+        _t2 = time.perf_counter()
+        for _ in range(repeat):
+            ParseOnlyProcessor(_svg)
+        _t3 = time.perf_counter()
+
+        if _legacy_svg != _new_svg:
+            print(f'!! output of {_name} differs from legacy export_clean_svg')
+
+        _legacy, _new = (_t1 - _t0) / repeat, (_t2 - _t1) / repeat
+        _clean = max(_new - (_t3 - _t2) / repeat, 1e-6)
+        _legacy_total += _legacy
+        _new_total += _new
+        _clean_total += _clean
+        print(f'{_name[:31]:<32}{len(_svg) / 1024:>10.1f}{_legacy * 1000:>13.2f}{_new * 1000:>18.2f}'
+              f'{_clean * 1000:>12.2f}{_legacy / _clean:>8.1f}x')
+
+    if corpus:
+        print(f'{"TOTAL":<42}{_legacy_total * 1000:>13.2f}{_new_total * 1000:>18.2f}{_clean_total * 1000:>12.2f}'
+              f'{_legacy_total / _clean_total:>8.1f}x')
+    return _legacy_total, _clean_total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='benchmark export_clean_svg on a corpus of seat plans')
+    parser.add_argument('--svg-dir', help='directory of scraped seat plan svg files')
+    parser.add_argument('--from-db', type=int, default=0, help='number of Houses.svg to load from the database')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    seatplans = list()
+    if args.svg_dir:
+        seatplans.extend(load_corpus_from_dir(args.svg_dir))
+    if args.from_db:
+        seatplans.extend(load_corpus_from_db(args.from_db))
+    if not seatplans:
+        parser.error('no seat plan found, use --svg-dir and/or --from-db')
+
+    run_benchmark(seatplans, repeat=args.repeat)
@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from benchmarks.standin_server import start_server, FaultProfile, FAULT_PROFILES
+from benchmarks.http_fetch_benchmark import write_synthetic_pages, list_recorded_pages
+
+try:
+    import resource
+except ImportError:
+    # ! - Windows: no rusage, CPU comes from os.times() and RSS is not reported
+    resource = None
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Benchmark - End to End, against the stand-in server |}
+#
+# Runs the three ScheduledTasks stages against a local stand-in server (benchmarks/standin_server.py)
+# and reports per stage: pages/sec (pages served by the stand-in, scripts and styles excluded), CPU seconds
+# (the stage's process and its browsers) and peak RSS (the largest single process, i.e., the scraper or a Firefox).
+#
+# stages (each in its own process, with HKMOVIE6_BASE_URL set to the stand-in, nothing is exported to the database):
+#   hkmovie6_code: MovieSpider (scrapy + requests_html) over /showing and the movie pages
+#   showtime: scrape_showtime.threads_work over the movies recorded in --dir
+#   seatplan: scrape_seatplan.threads_work over the showtime pages recorded in --dir (--fetch-mode http / browser)
+#
+# recordings:
+#   a) --dir: recorded with benchmarks/standin_server.py --upstream https://hkmovie6.com, while running the stages
+#       against the stand-in once
+#   b) none: synthetic showtime pages (benchmarks/seatplan_generator.py), the seatplan stage only
+#
+# usage:
+#   python benchmarks/e2e_benchmark.py --dir recordings --profile wan --threads 3
+#   python benchmarks/e2e_benchmark.py --stage seatplan --shows 500 --profile flaky
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+STAGES = ('hkmovie6_code', 'showtime', 'seatplan')
+PAGE_KINDS = ('showing', 'movie', 'showtimes', 'seatplan', 'grpc')
+# ! - the last line a stage prints, followed by its json report
+REPORT_PREFIX = 'E2E-REPORT '
+
+
+def list_recorded_movies(directory):
+    """:return: hkmovie6_codes whose showtime page is recorded (standin_server.py layout)"""
+    _dir = os.path.join(directory, 'GET', 'movie')
+    if not os.path.isdir(_dir):
+        return list()
+    return sorted(_code for _code in os.listdir(_dir) if os.path.isfile(os.path.join(_dir, _code, 'SHOWTIME.body')))
+
+
+def list_recorded_shows(directory):
+    """:return: {hkmovie6_code: [showtime_code...]} of the recorded showtime pages with a seatplan"""
+    _content = dict()
+    for _code in list_recorded_movies(directory):
+        _dir = os.path.join(directory, 'GET', 'movie', _code, 'SHOWTIME')
+        if os.path.isdir(_dir):
+            _content[_code] = sorted(_f[:-len('.body')] for _f in os.listdir(_dir) if _f.endswith('.body'))
+    for _code, _showtime_code, _, _ in list_recorded_pages(directory):
+        if _code not in ('GET', 'POST'):
+            _content.setdefault(_code, list()).append(_showtime_code)
+    return {_code: _shows for _code, _shows in _content.items() if _shows}
+
+
+def usage():
+    """:return: (CPU seconds, peak RSS in MB or None) of this process and its waited-for children"""
+    if resource is None:
+        _times = os.times()
+        return _times.user + _times.system + _times.children_user + _times.children_system, None
+    _self, _children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ! - ru_maxrss is in bytes on macOS, in KB elsewhere
+    _unit = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return (_self.ru_utime + _self.ru_stime + _children.ru_utime + _children.ru_stime,
+            max(_self.ru_maxrss, _children.ru_maxrss) / _unit)
+
+
+def run_stage(stage, directory, threads, fetch_mode, lean):
+    """
+    run one stage in this process, the stand-in is given by HKMOVIE6_BASE_URL
+    :return: number of items scraped
+    """
+    if stage == 'hkmovie6_code':
+        from scrapy import signals
+        from scrapy.crawler import CrawlerProcess
+        from hkmovie.hkmovie.spiders import MovieSpider
+        _items = list()
+        _process = CrawlerProcess(settings={
+            "BOT_NAME": "hkmovie",
+            "SPIDER_MODULES": ["hkmovie.hkmovie.spiders"],
+            "ROBOTSTXT_OBEY": False,
+            "LOG_LEVEL": "WARNING",
+        })
+        _crawler = _process.create_crawler(MovieSpider.MoviespiderSpider)
+        _crawler.signals.connect(lambda item, response, spider: _items.append(item), signal=signals.item_scraped)
+        _process.crawl(_crawler)
+        _process.start()
+        return len(_items)
+
+    if stage == 'showtime':
+        from ScheduledTasks import scrape_showtime
+        _codes = list_recorded_movies(directory)
+        with scrape_showtime.create_pool(size=threads, lean=lean) as _pool:
+            _pool.warm()
+            _results = scrape_showtime.threads_work(_codes, threads, pool=_pool)
+        return sum(1 for _r in _results if _r is not None)
+
+    from ScheduledTasks import scrape_seatplan
+    from hkmovie.SeatplanHttpFetcher import SeatplanHttpFetcher
+    _fetcher = SeatplanHttpFetcher(pool_size=threads) if fetch_mode == 'http' else None
+    with scrape_seatplan.create_pool(size=threads, lean=lean) as _pool:
+        if _fetcher is None:
+            _pool.warm()
+        _profiles = scrape_seatplan.threads_work(list_recorded_shows(directory), threads, pool=_pool, fetcher=_fetcher)
+    if _fetcher is not None:
+        _fetcher.close()
+    return len(_profiles)
+
+
+def spawn_stage(stage, base_url, directory, threads, fetch_mode, lean):
+    """
+    run a stage in a child process
+    :return: the child's report (dict), None if it failed
+    """
+    _command = [sys.executable, os.path.abspath(__file__), '--run-stage', stage, '--dir', directory,
+                '--threads', str(threads), '--fetch-mode', fetch_mode] + (['--lean'] if lean else [])
+    _env = dict(os.environ, HKMOVIE6_BASE_URL=base_url)
+    _root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+    _env["PYTHONPATH"] = os.pathsep.join(filter(None, [_root, _env.get("PYTHONPATH")]))
+    _completed = subprocess.run(_command, env=_env, cwd=_root, stdout=subprocess.PIPE, text=True)
+    _reports = [_l[len(REPORT_PREFIX):] for _l in _completed.stdout.splitlines() if _l.startswith(REPORT_PREFIX)]
+    if _completed.returncode != 0 or not _reports:
+        print(f'{stage}: failed with exit code {_completed.returncode}\n{_completed.stdout[-2000:]}')
+        return None
+    return json.loads(_reports[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='run the ScheduledTasks stages against a local stand-in server')
+    parser.add_argument('--dir', default=None, help='directory of recordings, synthetic showtime pages if omitted')
+    parser.add_argument('--stage', action='append', choices=STAGES, default=None, help='repeatable, all by default')
+    parser.add_argument('--threads', type=int, default=3)
+    parser.add_argument('--fetch-mode', choices=['http', 'browser'], default='http', help='of the seatplan stage')
+    parser.add_argument('--lean', action='store_true', help='lean Firefox profile')
+    parser.add_argument('--profile', choices=FAULT_PROFILES, default='none', help='fault profile of the stand-in')
+    parser.add_argument('--shows', type=int, default=300, help='number of synthetic showtime pages, without --dir')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--run-stage', choices=STAGES, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # ! - child process: run the stage and print its report
+    if args.run_stage:
+        t0, (cpu0, _) = time.perf_counter(), usage()
+        items = run_stage(args.run_stage, args.dir, args.threads, args.fetch_mode, args.lean)
+        seconds, (cpu1, rss) = time.perf_counter() - t0, usage()
+        print(REPORT_PREFIX + json.dumps({"items": items, "seconds": seconds, "cpu": cpu1 - cpu0, "rss": rss}))
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        directory, stages = args.dir, args.stage or list(STAGES)
+        if directory is None:
+            directory, stages = tmp_dir, ['seatplan']
+            write_synthetic_pages(tmp_dir, args.shows, args.seed)
+
+        server, url = start_server(directory, faults=FaultProfile(seed=args.seed, **FAULT_PROFILES[args.profile]))
+        print(f'stand-in on {url}, faults: {server.faults}')
+        reports = dict()
+        try:
+            for stage in stages:
+                before = server.snapshot()
+                report = spawn_stage(stage, url, directory, args.threads, args.fetch_mode, args.lean)
+                served = server.snapshot() - before
+                if report is not None:
+                    report.update(pages=sum(served[_kind] for _kind in PAGE_KINDS),
+                                  errors=served['error'], missing=served['missing'])
+                    reports[stage] = report
+        finally:
+            server.shutdown()
+
+    print(f'{"stage":<15}{"items":>7}{"pages":>8}{"errors":>8}{"missing":>9}{"seconds":>10}{"pages/s":>10}'
+          f'{"CPU (s)":>10}{"RSS (MB)":>10}')
+    for stage, report in reports.items():
+        print(f'{stage:<15}{report["items"]:>7}{report["pages"]:>8}{report["errors"]:>8}{report["missing"]:>9}'
+              f'{report["seconds"]:>10.2f}{report["pages"] / report["seconds"]:>10.1f}{report["cpu"]:>10.2f}'
+              f'{report["rss"] if report["rss"] is not None else float("nan"):>10.1f}')
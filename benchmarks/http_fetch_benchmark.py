@@ -0,0 +1,112 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+import concurrent.futures
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from hkmovie.SeatplanHttpFetcher import SeatplanHttpFetcher, SeatplanDecodeError
+from benchmarks.seatplan_generator import generate_corpus, render_showtime_page
+from benchmarks.standin_server import start_server
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Benchmark - SeatplanHttpFetcher |}
+#
+# Fetches showtime pages from a local stand-in server (benchmarks/standin_server.py) over pooled HTTP connections,
+# checks the decoded profiles, and reports shows/sec, i.e., the throughput of the path without Selenium.
+#
+# corpus:
+#   a) synthetic showtime pages of benchmarks/seatplan_generator.py (default), written to a temporary directory
+#   b) pages recorded by SeatplanHttpFetcher(record_dir=...), i.e., {record-dir}/{hkmovie6_code}/{showtime_code}.html
+#
+# usage:
+#   python benchmarks/http_fetch_benchmark.py --shows 500 --threads 8
+#   python benchmarks/http_fetch_benchmark.py --record-dir <directory>
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+MOVIE_CODE = 'synthetic'
+
+
+def write_synthetic_pages(directory, shows, seed=0):
+    """
+    write `shows` showtime pages, cycling through the synthetic layouts
+    :return: list of (hkmovie6_code, showtime_code, expected house, expected capacity)
+    """
+    _corpus = generate_corpus(seed=seed)
+    _dir = os.path.join(directory, MOVIE_CODE)
+    os.makedirs(_dir, exist_ok=True)
+    _expected = list()
+    for i in range(shows):
+        _name, _capacity, _svg = _corpus[i % len(_corpus)]
+        _showtime_code = f'S{i:06d}'
+        _house = f'House {_name}'
+        with open(os.path.join(_dir, f'{_showtime_code}.html'), 'w', encoding='utf-8') as f:
+            f.write(render_showtime_page(_svg, _house, start_time=1600000000 + i * 60, price=100))
+        _expected.append((MOVIE_CODE, _showtime_code, _house, _capacity))
+    return _expected
+
+
+def list_recorded_pages(directory):
+    """:return: list of (hkmovie6_code, showtime_code, None, None), nothing to check against"""
+    return [(_code, _file[:-len('.html')], None, None)
+            for _code in sorted(os.listdir(directory)) if os.path.isdir(os.path.join(directory, _code))
+            for _file in sorted(os.listdir(os.path.join(directory, _code))) if _file.endswith('.html')]
+
+
+def run_benchmark(base_url, shows, threads=4):
+    """
+    :param shows: list of (hkmovie6_code, showtime_code, expected house or None, expected capacity or None)
+    :return: (seconds, number decoded, number failed, number mismatched)
+    """
+    _fetcher = SeatplanHttpFetcher(base_url=base_url, pool_size=threads)
+
+    def _fetch(_show):
+        _code, _showtime_code, _house, _capacity = _show
+        try:
+            _profile = _fetcher.fetch(_code, _showtime_code)
+        except SeatplanDecodeError as err:
+            print(repr(err))
+            return False
+        if _house is not None and _profile['house'] != _house:
+            print(f'{_showtime_code}: house {_profile["house"]} != {_house}')
+            return False
+        if _capacity is not None and _profile['seatplan'].count('<rect') - 1 > _capacity:
+            print(f'{_showtime_code}: seat plan has more seats than {_capacity}')
+            return False
+        return True
+
+    _t0 = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        _ok = list(executor.map(_fetch, shows))
+    _seconds = time.perf_counter() - _t0
+    _fetcher.close()
+    return _seconds, _fetcher.decoded, _fetcher.failed, _ok.count(False) - _fetcher.failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='benchmark SeatplanHttpFetcher against a local stand-in server')
+    parser.add_argument('--record-dir', help='directory of recorded pages, replaces the synthetic pages')
+    parser.add_argument('--shows', type=int, default=300, help='number of synthetic showtime pages')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.record_dir:
+            directory, show_list = args.record_dir, list_recorded_pages(args.record_dir)
+        else:
+            directory, show_list = tmp_dir, write_synthetic_pages(tmp_dir, args.shows, args.seed)
+        if not show_list:
+            parser.error('no page found')
+
+        server, url = start_server(directory)
+        try:
+            seconds, decoded, failed, mismatched = run_benchmark(url, show_list, threads=args.threads)
+        finally:
+            server.shutdown()
+
+    print(f'{len(show_list)} shows in {seconds:.2f}s with {args.threads} threads: {len(show_list) / seconds:,.1f} shows/s, '
+          f'{decoded} decoded, {failed} failed, {mismatched} mismatched')
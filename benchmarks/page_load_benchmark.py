@@ -0,0 +1,138 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import platform
+import orjson
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from hkmovie.SeatplanFirefoxScraper import SeatplanScraper
+from hkmovie.PageReadiness import wait_until, stable_count, ReadinessTimeout
+from hkmovie.SiteConfig import BASE_URL
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Benchmark - Page Load, default vs lean Firefox profile |}
+#
+# Loads the same showtime pages with a SeatplanScraper of the default profile and one of the lean profile
+# (hkmovie/LeanProfile.py), alternating between the two for every page, and reports per profile:
+#   load: seconds of driver.get() (page load timeouts are counted, not retried)
+#   ready: seconds until the seatplan <svg> has a stable number of seats
+#   resources / KB: number and transfer size of the resources loaded (Resource Timing API)
+#
+# pages:
+#   a) --url <showtime page url>, repeatable
+#   b) the latest --from-db N shows in data\hk-movies.db
+#
+# usage:
+#   python benchmarks/page_load_benchmark.py --from-db 20 --repeat 2 --output data/metrics/page_load.json
+#
+# results:
+#   none recorded yet, the lean profile is not the default until this benchmark has been run against hkmovie6.com;
+#   --output writes the per-page results and the summary of each profile, to attach to the change
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+PROFILES = ('default', 'lean')
+RESOURCES_SCRIPT = "var r = performance.getEntriesByType('resource'); " \
+                   "return [r.length, r.reduce(function(s, e) { return s + (e.transferSize || 0); }, 0)];"
+
+
+def load_urls_from_db(n, base_url=BASE_URL):
+    _db = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, r'data\hk-movies.db'))
+    _conn = sqlite3.connect(_db)
+    try:
+        return [f'{base_url}/movie/{_code}/SHOWTIME/{_showtime}' for _code, _showtime in _conn.execute(
+            "SELECT b.hkmovie6_code, a.showtime_code FROM Showtimes AS a INNER JOIN Movies AS b"
+            " ON a.MovieID = b.MovieID ORDER BY a.ShowtimeID DESC LIMIT ?", [n])]
+    finally:
+        _conn.close()
+
+
+def measure_page(scraper, url, timeout=10):
+    """
+    :return: dict of load (seconds, None on timeout), ready (seconds, None on timeout), resources, bytes
+    """
+    _result = {"load": None, "ready": None, "resources": 0, "bytes": 0}
+    # ! - a blank page in between, so that the next load starts from scratch
+    scraper.driver.get('about:blank')
+    _t0 = time.perf_counter()
+    try:
+        scraper.driver.get(url)
+        _result["load"] = time.perf_counter() - _t0
+    except TimeoutException:
+        return _result
+    try:
+        wait_until(stable_count(scraper._count_seats), timeout=timeout, recorder=None)
+        _result["ready"] = time.perf_counter() - _t0
+    except ReadinessTimeout:
+        pass
+    try:
+        _result["resources"], _result["bytes"] = scraper.driver.execute_script(RESOURCES_SCRIPT)
+    except WebDriverException:
+        pass
+    return _result
+
+
+def summarize(results):
+    """
+    :return: dict of pages, median load and ready (seconds, None without any), mean resources and KB per page,
+                timeouts (page load) and not_ready (loaded, but the seatplan never settled)
+    """
+    _loads = sorted(_r["load"] for _r in results if _r["load"] is not None)
+    _ready = sorted(_r["ready"] for _r in results if _r["ready"] is not None)
+    _median = (lambda _v: _v[len(_v) // 2] if _v else None)
+    return {"pages": len(results), "load": _median(_loads), "ready": _median(_ready),
+            "resources": sum(_r["resources"] for _r in results) / max(len(results), 1),
+            "kb": sum(_r["bytes"] for _r in results) / max(len(results), 1) / 1024,
+            "timeouts": len(results) - len(_loads), "not_ready": len(_loads) - len(_ready)}
+
+
+def print_summary(name, summary):
+    _seconds = (lambda _v: f'{_v:.2f}' if _v is not None else 'n/a')
+    print(f'{name:<10}{summary["pages"]:>7}{_seconds(summary["load"]):>12}{_seconds(summary["ready"]):>12}'
+          f'{summary["resources"]:>12.1f}{summary["kb"]:>12.1f}{summary["timeouts"]:>10}{summary["not_ready"]:>12}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='compare page loads of the default and the lean Firefox profile')
+    parser.add_argument('--url', action='append', default=[], help='showtime page url, repeatable')
+    parser.add_argument('--from-db', type=int, default=0, help='number of the latest shows in the database')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--timeout', type=int, default=10, help='seconds to wait for the seatplan')
+    parser.add_argument('--headful', action='store_true')
+    parser.add_argument('--output', default=None, help='json file of the results, e.g., to attach to a change')
+    args = parser.parse_args()
+
+    urls = args.url + (load_urls_from_db(args.from_db) if args.from_db else [])
+    if not urls:
+        parser.error('give --url or --from-db')
+
+    scrapers = {_name: SeatplanScraper(headless=not args.headful, lean=_name == 'lean') for _name in PROFILES}
+    results = {_name: list() for _name in PROFILES}
+    try:
+        for _ in range(args.repeat):
+            for i, url in enumerate(urls):
+                # ! - alternate which profile goes first, so that neither always gets a warm server cache
+                for name in (PROFILES if i % 2 == 0 else PROFILES[::-1]):
+                    results[name].append(measure_page(scrapers[name], url, timeout=args.timeout))
+    finally:
+        for scraper in scrapers.values():
+            scraper.tear_down()
+
+    print(f'{"profile":<10}{"pages":>7}{"load (s)":>12}{"ready (s)":>12}{"resources":>12}{"KB":>12}'
+          f'{"timeouts":>10}{"not ready":>12}')
+    summaries = {_name: summarize(results[_name]) for _name in PROFILES}
+    for name in PROFILES:
+        print_summary(name, summaries[name])
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'wb') as f:
+            f.write(orjson.dumps({"started": time.strftime('%Y-%m-%d %H:%M:%S'), "platform": platform.platform(),
+                                  "repeat": args.repeat, "timeout": args.timeout, "headless": not args.headful,
+                                  "urls": urls, "summary": summaries, "results": results},
+                                 option=orjson.OPT_INDENT_2))
+        print(f'results: {args.output}')
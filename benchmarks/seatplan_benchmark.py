@@ -0,0 +1,139 @@
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from hkmovie.SeatplanToolkit import SeatplanProcessor, LayoutCache
+from benchmarks.seatplan_generator import generate_corpus, DEFAULT_LAYOUTS
+from benchmarks.clean_svg_benchmark import load_corpus_from_dir
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Benchmark - SeatplanToolkit |}
+#
+# Runs every stage of SeatplanToolkit over a corpus of seat plans,
+# so that parser changes can be compared before they are rolled out.
+#
+# stages:
+#   parse: SeatplanProcessor(svg), i.e., streaming the svg, reading seats and recoloring rows
+#   occupied: list(get_occupied_seats())
+#   clean_svg: export_clean_svg()
+#   capacity: get_house_capacity()
+#   cached: LayoutCache.process(svg) of a known layout (fast path, no parsing)
+#
+# reported per seat plan: median ms per stage, seats/sec of parse and cached, peak memory (KB) of parse
+#
+# corpus:
+#   a) synthetic seat plans of benchmarks/seatplan_generator.py (default, 50 to 800 seats)
+#   b) a directory of seat plan svg files, as scraped by SeatplanScraper (profile["seatplan"])
+#
+# usage:
+#   python benchmarks/seatplan_benchmark.py --repeat 20
+#   python benchmarks/seatplan_benchmark.py --svg-dir <directory>
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+STAGES = ('parse', 'occupied', 'clean_svg', 'capacity', 'cached')
+
+
+def median(values):
+    _values = sorted(values)
+    _mid = len(_values) // 2
+    return _values[_mid] if len(_values) % 2 else (_values[_mid - 1] + _values[_mid]) / 2
+
+
+def measure_peak_memory(svg):
+    """
+    :return: peak memory (bytes) allocated while parsing svg, as traced by tracemalloc
+    """
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    _sp = SeatplanProcessor(svg)
+    _peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del _sp
+    return _peak
+
+
+def benchmark_seatplan(svg, repeat=10):
+    """
+    :param svg: seat plan svg (str)
+    :param repeat: number of runs, the median of each stage is reported
+    :return: dict of stage -> median seconds, plus capacity and peak_memory
+    """
+    _timings = {_stage: list() for _stage in STAGES}
+    _capacity = 0
+    for _ in range(repeat):
+        _t0 = time.perf_counter()
+        _sp = SeatplanProcessor(svg)
+        _t1 = time.perf_counter()
+        list(_sp.get_occupied_seats())
+        _t2 = time.perf_counter()
+        _sp.export_clean_svg()
+        _t3 = time.perf_counter()
+        _capacity = _sp.get_house_capacity()
+        _t4 = time.perf_counter()
+        _timings['parse'].append(_t1 - _t0)
+        _timings['occupied'].append(_t2 - _t1)
+        _timings['clean_svg'].append(_t3 - _t2)
+        _timings['capacity'].append(_t4 - _t3)
+
+    _cache = LayoutCache()
+    _cache.process(svg)
+    for _ in range(repeat):
+        _t0 = time.perf_counter()
+        _cache.process(svg)
+        _timings['cached'].append(time.perf_counter() - _t0)
+
+    _result = {_stage: median(_timings[_stage]) for _stage in STAGES}
+    _result['capacity'] = _capacity
+    _result['capacity_time'] = median(_timings['capacity'])
+    _result['peak_memory'] = measure_peak_memory(svg)
+    return _result
+
+
+def run_benchmark(corpus, repeat=10):
+    """
+    :param corpus: list of (name, svg string)
+    :param repeat: number of runs per seat plan
+    :return: list of (name, result of benchmark_seatplan)
+    """
+    _results = list()
+    print(f'{"seatplan":<24}{"seats":>7}{"parse (ms)":>12}{"occupied":>10}{"clean_svg":>11}{"capacity":>10}'
+          f'{"cached":>9}{"parse seats/s":>15}{"cached seats/s":>16}{"peak (KB)":>11}')
+    for _name, _svg in corpus:
+        _r = benchmark_seatplan(_svg, repeat=repeat)
+        _results.append((_name, _r))
+        _seats = max(_r['capacity'], 1)
+        print(f'{_name[:23]:<24}{_r["capacity"]:>7}{_r["parse"] * 1000:>12.2f}{_r["occupied"] * 1000:>10.3f}'
+              f'{_r["clean_svg"] * 1000:>11.3f}{_r["capacity_time"] * 1000:>10.4f}{_r["cached"] * 1000:>9.2f}'
+              f'{_seats / _r["parse"]:>15,.0f}{_seats / _r["cached"]:>16,.0f}{_r["peak_memory"] / 1024:>11.1f}')
+
+    if _results:
+        _seats = sum(_r['capacity'] for _, _r in _results)
+        _parse = sum(_r['parse'] for _, _r in _results)
+        _cached = sum(_r['cached'] for _, _r in _results)
+        print(f'TOTAL: {_seats} seats, parse {_seats / _parse:,.0f} seats/s, cached {_seats / _cached:,.0f} seats/s, '
+              f'max peak {max(_r["peak_memory"] for _, _r in _results) / 1024:.1f} KB')
+    return _results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='benchmark SeatplanToolkit on synthetic and/or scraped seat plans')
+    parser.add_argument('--svg-dir', help='directory of scraped seat plan svg files, replaces the synthetic corpus')
+    parser.add_argument('--taken-ratio', type=float, default=0.4, help='share of taken seats in synthetic seat plans')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.svg_dir:
+        seatplans = load_corpus_from_dir(args.svg_dir)
+    else:
+        seatplans = [(f'{_name}.svg', _svg)
+                     for _name, _, _svg in generate_corpus(DEFAULT_LAYOUTS, args.taken_ratio, args.seed)]
+    if not seatplans:
+        parser.error('no seat plan found')
+
+    run_benchmark(seatplans, repeat=args.repeat)
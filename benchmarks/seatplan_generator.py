@@ -0,0 +1,162 @@
+import os
+import random
+import argparse
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Synthetic Seatplan Generator |}
+#
+# Generates seat plan svg in the structure SeatplanProcessor.parse_row_elements expects,
+# so that the toolkit can be benchmarked without scraping.
+#
+# structure:
+#   <svg>
+#       <g> "SCREEN": <a><rect/><text>SCREEN</text></a> (no <text> directly under <g>, skipped by the parser)
+#       <g> one per row: <text>row label</text>
+#           a) single seat: <a><rect width="10" style="fill..."/><text>column number</text></a>
+#           b) accessible seat: <a><rect width="10" style="fill..."/></a> (no column number)
+#           c) double seat: <a transform="rotate(...)"><rect width="25"/><text>col</text><text>col + 1</text></a>
+#               (availability of each half is the fill color of its <text>)
+#   </svg>
+#
+# usage:
+#   python benchmarks/seatplan_generator.py --out-dir <directory>
+#   (then e.g. python benchmarks/clean_svg_benchmark.py --svg-dir <directory>)
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+TAKEN_COLOR = 'rgb(255, 0, 0)'
+FREE_COLOR = 'rgb(0, 255, 0)'
+TEXT_COLOR = 'rgb(0, 0, 0)'
+SCREEN_COLOR = 'rgb(200, 200, 200)'
+
+SEAT_PITCH, DOUBLE_PITCH, ROW_PITCH = 15, 30, 15
+
+# ! - (name, capacity, double seat rows, accessible seats), from a small studio to the largest houses
+DEFAULT_LAYOUTS = [
+    ('studio_50', 50, 0, 2),
+    ('small_120', 120, 1, 2),
+    ('medium_250', 250, 1, 4),
+    ('large_400', 400, 2, 4),
+    ('imax_600', 600, 2, 6),
+    ('grand_800', 800, 3, 8),
+]
+
+
+def row_label(index):
+    """A, B, ..., Z, AA, AB, ..."""
+    _label = ''
+    index += 1
+    while index:
+        index, _r = divmod(index - 1, 26)
+        _label = chr(65 + _r) + _label
+    return _label
+
+
+def seat_style(taken):
+    _color = TAKEN_COLOR if taken else FREE_COLOR
+    return f'fill: {_color}; stroke: {_color}; stroke-width: 1;'
+
+
+def single_seat(x, y, col, taken):
+    """:param col: column number, None for an accessible (unlabelled) seat"""
+    _rect = f'<rect x="{x:.1f}" y="{y:.1f}" width="10" height="10" style="{seat_style(taken)}"></rect>'
+    if col is None:
+        return f'<a>{_rect}</a>'
+    _text_color = TAKEN_COLOR if taken else TEXT_COLOR
+    return (f'<a>{_rect}<text x="{x + 2:.1f}" y="{y + 8:.1f}" style="font-size: 6px; fill: {_text_color};">'
+            f'{col}</text></a>')
+
+
+def double_seat(x, y, col, taken, rotation=0):
+    """:param taken: tuple of 2 bools, availability of the left and right seat"""
+    _texts = ''.join(
+        f'<text x="{x + 2 + 12 * i:.1f}" y="{y + 8:.1f}" '
+        f'style="font-size: 6px; fill: {TAKEN_COLOR if taken[i] else TEXT_COLOR};">{col + i}</text>'
+        for i in range(2))
+    return (f'<a transform="rotate({rotation}, {x:.1f}, {y:.1f})">'
+            f'<rect x="{x:.1f}" y="{y:.1f}" width="25" height="10" style="{seat_style(False)}"></rect>{_texts}</a>')
+
+
+def generate_seatplan(capacity, double_rows=1, accessible=2, taken_ratio=0.4, seed=0):
+    """
+    :param capacity: number of seats (a double seat counts as 2)
+    :param double_rows: number of rows of double seats, at the back of the house
+    :param accessible: number of unlabelled seats, at the start of the first row
+    :param taken_ratio: probability that a seat is taken
+    :param seed: seed of random, the same arguments always generate the same seat plan
+    :return: svg (str)
+    """
+    _random = random.Random(seed)
+    _cols = max(int((capacity * 2) ** 0.5), 4)
+    _rows = -(-capacity // _cols)
+    _width = _cols * SEAT_PITCH + 40
+    _height = (_rows + 2) * ROW_PITCH + 40
+    _svg = [f'<svg xmlns:xlink="http://www.w3.org/1999/xlink" width="{_width}" height="{_height}" '
+            f'viewBox="0 0 {_width} {_height}">',
+            f'<g><a><rect x="20" y="5" width="{_width - 40}" height="10" style="fill: {SCREEN_COLOR};"></rect>'
+            f'<text x="{_width / 2 - 15:.1f}" y="13">SCREEN</text></a></g>']
+
+    _remaining = capacity
+    _row_index = 0
+    while _remaining > 0:
+        _y = 30 + _row_index * ROW_PITCH
+        _label = row_label(_row_index)
+        _is_double_row = _rows - _row_index <= double_rows
+        _row = [f'<g><text x="5" y="{_y + 8}" style="fill: {TEXT_COLOR};">{_label}</text>']
+        _x, _col, _seats = 20.0, 1, 0
+        while _seats < _cols and _remaining > 0:
+            if _is_double_row and _remaining >= 2 and _seats + 2 <= _cols:
+                _row.append(double_seat(_x, _y, _col,
+                                        (_random.random() < taken_ratio, _random.random() < taken_ratio)))
+                _x, _col, _seats, _remaining = _x + DOUBLE_PITCH, _col + 2, _seats + 2, _remaining - 2
+                continue
+            _unlabelled = _row_index == 0 and _col <= accessible
+            _row.append(single_seat(_x, _y, None if _unlabelled else _col, _random.random() < taken_ratio))
+            _x, _col, _seats, _remaining = _x + SEAT_PITCH, _col + 1, _seats + 1, _remaining - 1
+        _row.append('</g>')
+        _svg.append(''.join(_row))
+        _row_index += 1
+    _svg.append('</svg>')
+    return '\n'.join(_svg)
+
+
+def render_showtime_page(svg, house, start_time=None, price=None):
+    """
+    :return: html of a showtime page in the structure SeatplanHttpFetcher.decode_page expects,
+                i.e., the seat plan under div.seatplanWrapper and the show state in window.__NUXT__
+    """
+    _house = house.replace('"', '\\"')
+    _start_time = '' if start_time is None else start_time
+    _price = '' if price is None else price
+    return (f'<!doctype html><html><head><title>hkmovie6</title></head><body><div id="__layout"><div>'
+            f'<div class="mainWrapper"><div><div><div class="seatplanWrapper">'
+            f'<div class="showDetail"><div class="name f row wrap"><div>{house}</div></div>'
+            f'<div class="timePrice"><div class="text dispDesktop">${_price}</div></div></div>'
+            f'{svg}</div></div></div></div></div></div>'
+            f'<script>window.__NUXT__={{layout:"default",data:[{{response:{{show:{{house:"{_house}",'
+            f'starttime:{_start_time},price:{_price},seats:[]}}}}}}]}};</script></body></html>')
+
+
+def generate_corpus(layouts=None, taken_ratio=0.4, seed=0):
+    """
+    :param layouts: list of (name, capacity, double_rows, accessible), defaults to DEFAULT_LAYOUTS
+    :return: list of (name, capacity, svg)
+    """
+    return [(_name, _capacity,
+             generate_seatplan(_capacity, _double_rows, _accessible, taken_ratio=taken_ratio, seed=seed + i))
+            for i, (_name, _capacity, _double_rows, _accessible) in enumerate(layouts or DEFAULT_LAYOUTS)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='write synthetic seat plans to a directory')
+    parser.add_argument('--out-dir', required=True)
+    parser.add_argument('--taken-ratio', type=float, default=0.4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    for name, capacity, svg in generate_corpus(taken_ratio=args.taken_ratio, seed=args.seed):
+        with open(os.path.join(args.out_dir, f'{name}.svg'), 'w', encoding='utf-8') as f:
+            f.write(svg)
+        print(f'{name}.svg: {capacity} seats')
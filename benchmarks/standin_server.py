@@ -0,0 +1,321 @@
+import os
+import re
+import time
+import json
+import random
+import hashlib
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from collections import Counter
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Stand-in Server |}
+#
+# Records and replays hkmovie6, so that every ScheduledTasks stage can run offline against a local server
+# (set HKMOVIE6_BASE_URL, see hkmovie/SiteConfig.py), with injectable latency and errors.
+#
+# replays:
+#   /showing                                            showing page (MovieSpider.get_movie_links)
+#   /movie/{hkmovie6_code}                              movie page (MovieSpider.parse_info)
+#   /movie/{hkmovie6_code}/SHOWTIME                     showtime page (ShowtimeScraper)
+#   /movie/{hkmovie6_code}/SHOWTIME/{showtime_code}     showtime page with the seatplan <svg> (SeatplanScraper)
+#   POST (gRPC-web)                                     responses of the calls made by the pages, keyed by request body
+#   anything else (scripts, styles)                     as recorded
+#
+# recordings, in --dir:
+#   {METHOD}{path}[__{sha1 of query + body}].body       response body
+#   {METHOD}{path}[__{sha1 of query + body}].meta       status and headers (json)
+#   {hkmovie6_code}/{showtime_code}.html                showtime pages of SeatplanHttpFetcher(record_dir=...)
+#                                                       and benchmarks/http_fetch_benchmark.py
+#
+# flow:
+#   1) a request is looked up in the recordings, the origin (--upstream or ORIGIN) in text bodies is replaced
+#       by the server's, so that absolute links of a recorded page stay on the stand-in
+#   2) not recorded: with --upstream, the request is forwarded, the response recorded and served (record mode),
+#       else 404
+#   3) pages (anything but scripts, styles, images, fonts) go through the fault profile first:
+#       latency (+ jitter), then an error status, or a stall (no response for `stall` seconds) at the given rates
+#
+# usage:
+#   python benchmarks/standin_server.py --dir recordings --upstream https://hkmovie6.com     # record
+#   python benchmarks/standin_server.py --dir recordings --profile flaky --port 8606        # replay
+#   (then HKMOVIE6_BASE_URL=http://127.0.0.1:8606, see benchmarks/e2e_benchmark.py)
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+SHOWTIME_PATH_PATTERN = re.compile(r'^/movie/([^/]+)/SHOWTIME/([^/?#]+)')
+# ! - origin of the recorded site, replaced by the stand-in's in text bodies
+ORIGIN = 'https://hkmovie6.com'
+TEXT_CONTENT_TYPES = ('text/', 'application/javascript', 'application/json')
+# ! - headers kept in a recording, the rest (date, cookies, encodings) are not replayed
+RECORDED_HEADERS = ('content-type', 'grpc-status', 'grpc-message', 'cache-control')
+FORWARDED_HEADERS = ('content-type', 'accept', 'user-agent', 'x-grpc-web', 'x-user-agent', 'authorization')
+
+
+class FaultProfile:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, stall_rate=0.0, stall=30.0,
+                 seed=None):
+        """
+        :param latency: seconds added to every page
+        :param jitter: up to this many seconds added at random on top of latency
+        :param error_rate: share of pages answered with error_status
+        :param error_status: e.g., 503, 429
+        :param stall_rate: share of pages answered after `stall` seconds only, i.e., client timeouts
+        :param seed: seed of the random draws, for repeatable runs
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def apply(self):
+        """
+        sleep for the injected latency
+        :return: status to answer with instead of the recording, or None
+        """
+        with self._lock:
+            _delay = self.latency + self._random.uniform(0, self.jitter)
+            _draw = self._random.random()
+        if _draw < self.stall_rate:
+            _delay += self.stall
+        if _delay > 0:
+            time.sleep(_delay)
+        if self.stall_rate <= _draw < self.stall_rate + self.error_rate:
+            return self.error_status
+        return None
+
+    def __repr__(self):
+        return f'FaultProfile(latency={self.latency}, jitter={self.jitter}, error_rate={self.error_rate}, ' \
+               f'error_status={self.error_status}, stall_rate={self.stall_rate}, stall={self.stall})'
+
+
+FAULT_PROFILES = {
+    "none": dict(),
+    # ! - a healthy site over a real network
+    "wan": dict(latency=0.08, jitter=0.04),
+    "slow": dict(latency=0.8, jitter=0.6),
+    "flaky": dict(latency=0.15, jitter=0.1, error_rate=0.1, error_status=503),
+    # ! - rate limited: errors are 429, and a few requests hang
+    "overloaded": dict(latency=1.5, jitter=1.0, error_rate=0.2, error_status=429, stall_rate=0.02),
+}
+
+
+def kind_of(method, path):
+    """:return: showing, movie, showtimes, seatplan, grpc, or asset"""
+    _path = urlsplit(path).path.rstrip('/')
+    if method == 'POST':
+        return 'grpc'
+    if SHOWTIME_PATH_PATTERN.match(_path):
+        return 'seatplan'
+    if re.match(r'^/movie/[^/]+/SHOWTIME$', _path):
+        return 'showtimes'
+    if re.match(r'^/movie/[^/]+$', _path):
+        return 'movie'
+    if _path == '/showing':
+        return 'showing'
+    return 'asset'
+
+
+def recording_key(method, path, body=b''):
+    """:return: file name (without extension) of the recording of a request, relative to the directory"""
+    _url = urlsplit(path)
+    _path = _url.path.rstrip('/') or '/index'
+    # ! - '..' or drive letters must not escape the directory
+    _path = '/'.join(re.sub(r'[^\w.@~-]', '_', _p) for _p in _path.split('/') if _p not in ('', '.', '..'))
+    _key = f'{method}/{_path}'
+    if _url.query or body:
+        _key += '__' + hashlib.sha1(_url.query.encode() + b'?' + (body or b'')).hexdigest()[:16]
+    return _key
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, directory, upstream=None, faults=None, origin=ORIGIN):
+        """
+        :param directory: directory of recordings
+        :param upstream: origin to record from when a request is not recorded, e.g., https://hkmovie6.com
+        :param faults: FaultProfile applied to pages, None for none
+        :param origin: replaced by base_url in text bodies, defaults to upstream if given
+        """
+        super().__init__(address, ReplayHandler)
+        self.directory = os.path.abspath(directory)
+        self.upstream = upstream.rstrip('/') if upstream else None
+        self.faults = faults
+        self.origin = self.upstream or origin.rstrip('/')
+        # ! - requests served, by kind (see kind_of) and outcome (missing, recorded, error)
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+        self._record_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def count(self, *keys):
+        with self._stats_lock:
+            for _key in keys:
+                self.stats[_key] += 1
+
+    def snapshot(self):
+        with self._stats_lock:
+            return Counter(self.stats)
+
+    def load(self, method, path, body):
+        """:return: (status, headers, body) of the recording, or None"""
+        _key = os.path.join(self.directory, recording_key(method, path, body))
+        if os.path.isfile(_key + '.body'):
+            with open(_key + '.body', 'rb') as f:
+                _body = f.read()
+            _meta = {"status": 200, "headers": {"content-type": 'text/html; charset=utf-8'}}
+            if os.path.isfile(_key + '.meta'):
+                with open(_key + '.meta', 'r', encoding='utf-8') as f:
+                    _meta = json.load(f)
+            return _meta["status"], _meta["headers"], _body
+        # ! - pages of SeatplanHttpFetcher(record_dir=...) and the synthetic pages
+        _match = SHOWTIME_PATH_PATTERN.match(path) if method == 'GET' else None
+        _file = os.path.join(self.directory, _match.group(1), f'{_match.group(2)}.html') if _match else None
+        if _file is not None and os.path.isfile(_file):
+            with open(_file, 'rb') as f:
+                return 200, {"content-type": 'text/html; charset=utf-8'}, f.read()
+        return None
+
+    def record(self, method, path, body, request_headers):
+        """forward the request to upstream and save the response; :return: (status, headers, body)"""
+        _request = urllib.request.Request(f'{self.upstream}{path}', data=body or None, method=method,
+                                          headers={_k: _v for _k, _v in request_headers.items()
+                                                   if _k.lower() in FORWARDED_HEADERS})
+        try:
+            with urllib.request.urlopen(_request, timeout=30) as _response:
+                _status, _headers, _body = _response.status, _response.headers, _response.read()
+        except urllib.error.HTTPError as err:
+            _status, _headers, _body = err.code, err.headers, err.read()
+        _headers = {_k.lower(): _v for _k, _v in _headers.items() if _k.lower() in RECORDED_HEADERS}
+
+        _key = os.path.join(self.directory, recording_key(method, path, body))
+        with self._record_lock:
+            os.makedirs(os.path.dirname(_key), exist_ok=True)
+            with open(_key + '.body', 'wb') as f:
+                f.write(_body)
+            with open(_key + '.meta', 'w', encoding='utf-8') as f:
+                json.dump({"status": _status, "headers": _headers, "url": f'{self.upstream}{path}'}, f, indent=2)
+        return _status, _headers, _body
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    # ! - keep-alive, so that pooled connections of the client are reused
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.replay('GET')
+
+    def do_POST(self):
+        self.replay('POST')
+
+    def do_OPTIONS(self):
+        # ! - CORS preflight of gRPC-web calls
+        self.send_response(204)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', self.headers.get('Access-Control-Request-Headers', '*'))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def replay(self, method):
+        _body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        _kind = kind_of(method, self.path)
+        _server = self.server
+
+        if _kind != 'asset' and _server.faults is not None:
+            _error = _server.faults.apply()
+            if _error is not None:
+                _server.count(_kind, 'error')
+                self.send_body(_error, b'injected error', 'text/plain')
+                return
+
+        _response = _server.load(method, self.path, _body)
+        if _response is None and _server.upstream:
+            _response = _server.record(method, self.path, _body, self.headers)
+            _server.count('recorded')
+        if _response is None:
+            _server.count(_kind, 'missing')
+            self.send_body(404, b'not found', 'text/plain')
+            return
+
+        _status, _headers, _content = _response
+        _server.count(_kind)
+        _content_type = _headers.get('content-type', 'application/octet-stream')
+        if _content_type.startswith(TEXT_CONTENT_TYPES):
+            _content = _content.replace(_server.origin.encode(), _server.base_url.encode())
+        self.send_body(_status, _content, _content_type,
+                       {_k: _v for _k, _v in _headers.items() if _k != 'content-type'})
+
+    def send_body(self, status, body, content_type='text/html; charset=utf-8', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        for _key, _value in (headers or dict()).items():
+            self.send_header(_key, _value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(directory, host='127.0.0.1', port=0, upstream=None, faults=None):
+    """
+    start the stand-in server in a daemon thread
+    :param port: 0 to pick a free port
+    :param upstream: record from this origin what is not recorded yet
+    :param faults: FaultProfile, or the name of one in FAULT_PROFILES
+    :return: (server, base_url), call server.shutdown() to stop
+    """
+    if isinstance(faults, str):
+        faults = FaultProfile(**FAULT_PROFILES[faults])
+    _server = ReplayServer((host, port), directory, upstream=upstream, faults=faults)
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server, _server.base_url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='record and replay hkmovie6 with injectable latency and errors')
+    parser.add_argument('--dir', required=True, help='directory of recordings')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8606)
+    parser.add_argument('--upstream', default=None, help='record mode: forward and save what is not recorded yet, '
+                                                         'e.g., https://hkmovie6.com')
+    parser.add_argument('--profile', choices=FAULT_PROFILES, default='none', help='fault profile')
+    parser.add_argument('--latency', type=float, default=None, help='seconds, overrides the profile')
+    parser.add_argument('--jitter', type=float, default=None, help='seconds, overrides the profile')
+    parser.add_argument('--error-rate', type=float, default=None, help='overrides the profile')
+    parser.add_argument('--error-status', type=int, default=None, help='overrides the profile')
+    parser.add_argument('--stall-rate', type=float, default=None, help='overrides the profile')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    fault_args = dict(FAULT_PROFILES[args.profile])
+    for name in ('latency', 'jitter', 'error_rate', 'error_status', 'stall_rate'):
+        if getattr(args, name) is not None:
+            fault_args[name] = getattr(args, name)
+
+    server = ReplayServer((args.host, args.port), args.dir, upstream=args.upstream,
+                          faults=FaultProfile(seed=args.seed, **fault_args) if fault_args else None)
+    print(f'{"recording" if args.upstream else "replaying"} {args.dir} on {server.base_url}, '
+          f'faults: {server.faults}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(dict(server.snapshot()))
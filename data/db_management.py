@@ -1,29 +1,75 @@
 import sqlite3
+import zlib
+import hashlib
 from abc import ABC, abstractmethod
 from datetime import datetime
+from itertools import groupby, zip_longest
+from operator import itemgetter
 import os
 
+try:
+    import zstandard
+except ImportError:
+    # ! - svg blobs fall back to zlib, blobs written with zstd cannot be read without zstandard
+    zstandard = None
+
+
+# ! - HKMOVIES_DB points the schema creation and migrate_database() at another database, e.g., a scratch copy in tests
+DB_PATH = os.environ.get('HKMOVIES_DB') or os.path.abspath(os.path.join(os.path.dirname(__file__), 'hk-movies.db'))
+SCHEMA_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'schema.sql'))
+
+
+# ! - views whose definition changed with SalesBitmaps, kept as they are by CREATE VIEW IF NOT EXISTS until migrated
+MIGRATED_VIEWS = ('SalesDetails', 'vSalesHistoryCount', 'vSalesHistory')
+
 
 # todo: https://www.sqlite.org/draft/lang_UPSERT.html
-def create_tables_and_views():
-    _schema_path = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, r'data\schema.sql'))
-    # print(f'_path = {_path}')
-    with open(_schema_path, 'r') as f:
+def create_tables_and_views(db_path=None):
+    """
+    create missing tables, indices, triggers and views; nothing existing is dropped or rewritten,
+    a database of an older schema must be migrated once by migrate_database() (python data/db_management.py --migrate)
+    :param db_path: defaults to DB_PATH
+    """
+    with open(SCHEMA_PATH, 'r') as f:
         _create_script = f.read()
 
-    _db_path = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, r'data\hk-movies.db'))
-    _conn = sqlite3.connect(_db_path)
+    _conn = sqlite3.connect(db_path or DB_PATH)
     _cursor = _conn.cursor()
     _cursor.executescript(_create_script)
+    _missing = [f'{_table}.{_column}' for _table, _column in (('Seats', 'seat_index'), ('HouseLayouts', 'svg_hash'))
+                if _column not in [_c[1] for _c in _cursor.execute(f"PRAGMA table_info({_table})")]]
+    _conn.commit()
+    _conn.close()
+    if _missing:
+        raise RuntimeError(f'{db_path or DB_PATH} has no {", ".join(_missing)}, '
+                           f'run "python data/db_management.py --migrate" once')
+    return True
+
+
+def migrate_database(db_path=None):
+    """
+    one-off migration of a database created by an older version, see migrate_schema();
+    MIGRATED_VIEWS are dropped and created again from schema.sql
+    :param db_path: defaults to DB_PATH
+    """
+    with open(SCHEMA_PATH, 'r') as f:
+        _create_script = f.read()
+
+    _conn = sqlite3.connect(db_path or DB_PATH)
+    _cursor = _conn.cursor()
+    _cursor.executescript(_create_script)
+    migrate_schema(_cursor)
+    for _view in MIGRATED_VIEWS:
+        _cursor.execute(f"DROP VIEW IF EXISTS {_view}")
+    _conn.commit()
+    _cursor.executescript(_create_script)
     _conn.commit()
     _conn.close()
     return True
 
 
 def export_schema_from_db():
-    _db_path = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, r'data\hk-movies.db'))
-    _schema_path = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, r'data\schema.sql'))
-    _conn = sqlite3.connect(_db_path)
+    _conn = sqlite3.connect(DB_PATH)
     _cursor = _conn.cursor()
     _query = "select sql from sqlite_master where sql is not null;"
     _cursor.execute(_query)
@@ -32,7 +78,7 @@ def export_schema_from_db():
     _conn.commit()
     _conn.close()
 
-    with open(_schema_path, 'w+') as f:
+    with open(SCHEMA_PATH, 'w+') as f:
         for _r in _results:
             _statement = str(_r[0]).replace('CREATE TABLE', 'CREATE TABLE IF NOT EXISTS')\
                 .replace('CREATE INDEX', 'CREATE INDEX IF NOT EXISTS') \
@@ -48,6 +94,329 @@ def export_schema_from_db():
 # def query_time_unknown_shows(limit:int = 2000):
 
 
+# =====================================================================================================================|
+# {| Seat bitmaps |}
+# SalesBitmaps keeps one row per showtime instead of one SalesHistory row per sold seat.
+# Seats of a house are numbered by Seats.seat_index (0, 1, 2... in the order they are inserted),
+# bit n of SalesBitmaps.bitmap is set if the seat with seat_index = n is taken.
+# SalesDeltas keeps the seats newly taken by each scrape, i.e., the first-seen time of every sold seat.
+# Bits are ordered from the most significant bit of the first byte,
+# so that bit n is also bit (3 - n % 4) of the (n / 4)th character of hex(bitmap), see view vSalesHistory.
+# =====================================================================================================================|
+def encode_seat_bitmap(seat_indices):
+    """
+    :param seat_indices: iterable of Seats.seat_index of taken seats
+    :return: bytes
+    """
+    _bitmap = bytearray()
+    for _i in seat_indices:
+        if _i >> 3 >= len(_bitmap):
+            _bitmap.extend(bytes((_i >> 3) + 1 - len(_bitmap)))
+        _bitmap[_i >> 3] |= 0x80 >> (_i & 7)
+    return bytes(_bitmap)
+
+
+def decode_seat_bitmap(bitmap):
+    """
+    :param bitmap: bytes
+    :return: list of seat_index of taken seats
+    """
+    return [(_byte_index << 3) + _bit for _byte_index, _byte in enumerate(bitmap) if _byte
+            for _bit in range(8) if _byte & (0x80 >> _bit)]
+
+
+def merge_seat_bitmaps(a, b):
+    """
+    :return: bitwise OR of two bitmaps, as long as the longer one
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    return bytes(_x | _y for _x, _y in zip(a, b)) + a[len(b):]
+
+
+def diff_seat_bitmaps(new, old):
+    """
+    :return: bitmap of seats taken in new but not in old, e.g. tickets sold since the previous scrape
+    """
+    return bytes(_x & ~_y for _x, _y in zip_longest(new, old, fillvalue=0)).rstrip(b'\x00')
+
+
+def count_seat_bitmap(bitmap):
+    """
+    :return: number of taken seats (i.e., ticket_sold)
+    """
+    return bin(int.from_bytes(bitmap, 'big')).count('1')
+
+
+class SeatRegistry:
+    """
+    In-memory (HouseID, x, y) -> (SeatID, seat_index) map of Seats.
+    Seats of a house are loaded once per run, missing seats are created in one executemany,
+    so that writing sales needs no lookup (nor correlated subquery) per seat.
+    Seats stored without seat_number get the seat_number of the seat plan once it is known.
+    """
+    SELECT_SEATS = "SELECT HouseID, x, y, SeatID, seat_index, seat_number FROM Seats"
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.houses = dict()
+        self.next_index = dict()
+        # ! - SeatID of seats stored without seat_number (e.g., seats for disabled before column numbers were patched)
+        self.unnumbered = set()
+        self.created = 0
+        self.renumbered = 0
+
+    def load(self, house_ids):
+        """
+        load seats of houses that are not loaded yet, 500 houses per query
+        :param house_ids: iterable of HouseID
+        :return:
+        """
+        _new = [_h for _h in dict.fromkeys(house_ids) if _h not in self.houses]
+        for _h in _new:
+            self.houses[_h] = dict()
+            self.next_index[_h] = 0
+        for _i in range(0, len(_new), 500):
+            _chunk = _new[_i:_i + 500]
+            for _house_id, _x, _y, _seat_id, _seat_index, _seat_number in self.cursor.execute(
+                    f"{self.SELECT_SEATS} WHERE HouseID IN ({', '.join('?' * len(_chunk))}) ORDER BY SeatID", _chunk):
+                self.houses[_house_id].setdefault((_x, _y), (_seat_id, _seat_index))
+                if _seat_number is None:
+                    self.unnumbered.add(_seat_id)
+                self.next_index[_house_id] = max(self.next_index[_house_id], _seat_index + 1)
+
+    def get_house(self, house_id):
+        if house_id not in self.houses:
+            self.load([house_id])
+        return self.houses[house_id]
+
+    def resolve(self, house_id, seats):
+        """
+        :param house_id: HouseID
+        :param seats: list of {"seat_number", "x", "y"}, e.g. SeatplanProcessor.get_occupied_seats()
+        :return: list of (SeatID, seat_index), in the order of seats
+        """
+        _house = self.get_house(house_id)
+        _missing = dict()
+        for _seat in seats:
+            _key = (_seat['x'], _seat['y'])
+            if _key not in _house and _key not in _missing:
+                _missing[_key] = _seat['seat_number']
+        if _missing:
+            _next_index = self.next_index[house_id]
+            self.next_index[house_id] += len(_missing)
+            self.cursor.executemany(
+                "INSERT INTO Seats (seat_number, HouseID, x, y, seat_index) VALUES (?, ?, ?, ?, ?)",
+                [(_seat_number, house_id, _x, _y, _next_index + _i)
+                 for _i, ((_x, _y), _seat_number) in enumerate(_missing.items())])
+            for _x, _y, _seat_id, _seat_index in self.cursor.execute(
+                    "SELECT x, y, SeatID, seat_index FROM Seats WHERE HouseID = ? AND seat_index >= ?",
+                    [house_id, _next_index]):
+                _house.setdefault((_x, _y), (_seat_id, _seat_index))
+            self.created += len(_missing)
+        _resolved = [_house[(_seat['x'], _seat['y'])] for _seat in seats]
+        if self.unnumbered:
+            _renumber = [(_seat['seat_number'], _seat_id) for _seat, (_seat_id, _) in zip(seats, _resolved)
+                         if _seat_id in self.unnumbered and _seat['seat_number'] is not None]
+            if _renumber:
+                self.cursor.executemany("UPDATE Seats SET seat_number = ? WHERE SeatID = ?", _renumber)
+                self.unnumbered.difference_update(_seat_id for _, _seat_id in _renumber)
+                self.renumbered += len(_renumber)
+        return _resolved
+
+
+# =====================================================================================================================|
+# {| Svg blobs |}
+# Clean svg of the houses are stored once per content in SvgBlobs, keyed by sha1 of the svg (svg_hash),
+# compressed with zstd (or zlib if zstandard is not installed). Houses.svg_hash refers to the current svg of a house,
+# blobs are never deleted, so that previous layouts of a house are kept.
+# =====================================================================================================================|
+def svg_hash(svg):
+    """
+    :param svg: str
+    :return: sha1 hex digest of the svg, i.e., Houses.svg_hash / SvgBlobs.svg_hash
+    """
+    return hashlib.sha1(svg.encode('utf-8')).hexdigest()
+
+
+class LazySvg:
+    """
+    svg of a SvgBlobs row that is decompressed on first access of .text (or str()),
+    so that analytics can list houses and hashes without decompressing every svg
+    """
+    __slots__ = ('svg_hash', 'codec', 'body', '_text')
+
+    def __init__(self, svg_hash, codec, body):
+        self.svg_hash = svg_hash
+        self.codec = codec
+        self.body = body
+        self._text = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = SvgBlobStore.decompress(self.codec, self.body)
+        return self._text
+
+    def __str__(self):
+        return self.text
+
+
+class SvgBlobStore:
+    """
+    content-addressed store of clean svg in SvgBlobs;
+    put() skips the write if the hash is already stored, get()/lazy() read by hash
+    """
+    CODEC = 'zstd' if zstandard is not None else 'zlib'
+    LEVEL = {'zstd': 19, 'zlib': 9}
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.known = set()
+        self.written = 0
+
+    @classmethod
+    def compress(cls, svg):
+        _data = svg.encode('utf-8')
+        if cls.CODEC == 'zstd':
+            return zstandard.ZstdCompressor(level=cls.LEVEL['zstd']).compress(_data)
+        return zlib.compress(_data, cls.LEVEL['zlib'])
+
+    @staticmethod
+    def decompress(codec, body):
+        if codec == 'zstd':
+            if zstandard is None:
+                raise RuntimeError('svg blob is compressed with zstd, but zstandard is not installed')
+            return zstandard.ZstdDecompressor().decompress(body).decode('utf-8')
+        if codec == 'zlib':
+            return zlib.decompress(body).decode('utf-8')
+        raise ValueError(f'unknown svg blob codec: {codec}')
+
+    def put(self, svg, house_id=None, _hash=None):
+        """
+        :param svg: clean svg (str)
+        :param house_id: HouseID of the house that first reports this svg
+        :param _hash: svg_hash(svg) if already computed
+        :return: svg_hash
+        """
+        _hash = _hash or svg_hash(svg)
+        if _hash in self.known:
+            return _hash
+        if self.cursor.execute("SELECT 1 FROM SvgBlobs WHERE svg_hash = ?", [_hash]).fetchone() is None:
+            self.cursor.execute(
+                "INSERT INTO SvgBlobs (svg_hash, codec, size, body, HouseID) VALUES (?, ?, ?, ?, ?)",
+                [_hash, self.CODEC, len(svg), self.compress(svg), house_id])
+            self.written += 1
+        self.known.add(_hash)
+        return _hash
+
+    def claim(self, _hash, house_id):
+        """set the HouseID of a blob put before its house was known"""
+        self.cursor.execute("UPDATE SvgBlobs SET HouseID = ? WHERE svg_hash = ? AND HouseID IS NULL", [house_id, _hash])
+
+    def lazy(self, _hash):
+        """:return: LazySvg, or None if the hash is not stored"""
+        _row = self.cursor.execute("SELECT codec, body FROM SvgBlobs WHERE svg_hash = ?", [_hash]).fetchone()
+        return None if _row is None else LazySvg(_hash, *_row)
+
+    def get(self, _hash):
+        """:return: svg (str), or None if the hash is not stored"""
+        _svg = self.lazy(_hash)
+        return None if _svg is None else _svg.text
+
+    def house_svgs(self, house_ids=None):
+        """
+        :param house_ids: list of HouseID, all houses if None
+        :return: generator of (HouseID, name, LazySvg) of the current svg of each house
+        """
+        _sql = "SELECT h.HouseID, h.name, b.svg_hash, b.codec, b.body FROM Houses AS h " \
+               "INNER JOIN SvgBlobs AS b ON h.svg_hash = b.svg_hash"
+        _house_ids = list(house_ids) if house_ids is not None else None
+        if _house_ids is not None:
+            _sql += f" WHERE h.HouseID IN ({', '.join('?' * len(_house_ids))})"
+        for _house_id, _name, _hash, _codec, _body in self.cursor.execute(_sql, _house_ids or []).fetchall():
+            yield _house_id, _name, LazySvg(_hash, _codec, _body)
+
+
+def migrate_schema(cursor):
+    """
+    one-off migrations of a database created by an older version, each step is skipped once done:
+        1) add Seats.seat_index, Houses.svg_hash, HouseLayouts.rotation and HouseLayouts.svg_hash
+        2) number the seats of each house in SeatID order where seat_index is missing
+        3) fold SalesHistory rows into SalesBitmaps, and into one SalesDeltas row per (ShowtimeID, EnteredDate)
+            so that the first-seen time of every seat is kept, then delete them
+            (rows whose SeatID is not in Seats have no seat_index, they are left in SalesHistory)
+        4) showtimes in SalesBitmaps without SalesDeltas get their whole bitmap as one delta
+        5) move Houses.svg and HouseLayouts.svg into SvgBlobs
+    :param cursor: sqlite3 cursor
+    :return:
+    """
+    if 'seat_index' not in [_c[1] for _c in cursor.execute("PRAGMA table_info(Seats)")]:
+        cursor.execute("ALTER TABLE Seats ADD COLUMN seat_index INTEGER")
+    if 'svg_hash' not in [_c[1] for _c in cursor.execute("PRAGMA table_info(Houses)")]:
+        cursor.execute("ALTER TABLE Houses ADD COLUMN svg_hash TEXT")
+    _layout_columns = [_c[1] for _c in cursor.execute("PRAGMA table_info(HouseLayouts)")]
+    if 'rotation' not in _layout_columns:
+        cursor.execute("ALTER TABLE HouseLayouts ADD COLUMN rotation BLOB")
+    if 'svg_hash' not in _layout_columns:
+        cursor.execute("ALTER TABLE HouseLayouts ADD COLUMN svg_hash TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS Seats_seat_index ON Seats (HouseID, seat_index)")
+
+    if cursor.execute("SELECT 1 FROM Seats WHERE seat_index IS NULL LIMIT 1").fetchone():
+        _next_index = dict(cursor.execute(
+            "SELECT HouseID, MAX(seat_index) + 1 FROM Seats WHERE seat_index IS NOT NULL GROUP BY HouseID"
+        ).fetchall())
+        _updates = list()
+        for _seat_id, _house_id in cursor.execute(
+                "SELECT SeatID, HouseID FROM Seats WHERE seat_index IS NULL ORDER BY HouseID, SeatID").fetchall():
+            _index = _next_index.get(_house_id, 0)
+            _next_index[_house_id] = _index + 1
+            _updates.append((_index, _seat_id))
+        cursor.executemany("UPDATE Seats SET seat_index = ? WHERE SeatID = ?", _updates)
+        print(f'numbered {len(_updates)} seats')
+
+    if cursor.execute(
+            "SELECT 1 FROM SalesHistory AS h INNER JOIN Seats AS s ON h.SeatID = s.SeatID LIMIT 1").fetchone():
+        _upsert_sql = SalesBitmapsTable().upsert_statement()
+        _delta_sql = SalesDeltasTable().insert_statement()
+        _select_cursor = cursor.connection.cursor()
+        _select_cursor.execute(
+            "SELECT h.ShowtimeID, s.HouseID, s.seat_index, h.EnteredDate FROM SalesHistory AS h "
+            "INNER JOIN Seats AS s ON h.SeatID = s.SeatID ORDER BY h.ShowtimeID, h.EnteredDate")
+        _migrated = 0
+        for _showtime_id, _rows in groupby(_select_cursor, key=itemgetter(0)):
+            _rows = list(_rows)
+            _deltas = [(_showtime_id, encode_seat_bitmap(_r[2] for _r in _group), _entered)
+                       for _entered, _group in groupby(_rows, key=itemgetter(3))]
+            _bitmap = encode_seat_bitmap(_r[2] for _r in _rows)
+            cursor.execute(_upsert_sql, [_showtime_id, _rows[0][1], _bitmap, count_seat_bitmap(_bitmap),
+                                         _rows[0][3]])
+            cursor.executemany(_delta_sql, [(_id, _delta, count_seat_bitmap(_delta), _entered)
+                                            for _id, _delta, _entered in _deltas])
+            _migrated += 1
+        cursor.execute("DELETE FROM SalesHistory WHERE SeatID IN (SELECT SeatID FROM Seats)")
+        print(f'migrated SalesHistory of {_migrated} showtimes to SalesBitmaps')
+
+    cursor.execute(
+        "INSERT INTO SalesDeltas (ShowtimeID, bitmap, ticket_sold, EnteredDate) "
+        "SELECT b.ShowtimeID, b.bitmap, b.ticket_sold, b.EnteredDate FROM SalesBitmaps AS b "
+        "WHERE b.ticket_sold > 0 AND NOT EXISTS (SELECT 1 FROM SalesDeltas AS d WHERE d.ShowtimeID = b.ShowtimeID)")
+
+    if cursor.execute("SELECT 1 FROM Houses WHERE svg IS NOT NULL LIMIT 1").fetchone():
+        _store = SvgBlobStore(cursor)
+        _houses = cursor.execute("SELECT HouseID, svg FROM Houses WHERE svg IS NOT NULL").fetchall()
+        cursor.executemany("UPDATE Houses SET svg_hash = ?, svg = NULL WHERE HouseID = ?",
+                           [(_store.put(_svg, _house_id), _house_id) for _house_id, _svg in _houses])
+        print(f'moved svg of {len(_houses)} houses to SvgBlobs ({_store.written} blobs)')
+
+    if cursor.execute("SELECT 1 FROM HouseLayouts WHERE svg IS NOT NULL LIMIT 1").fetchone():
+        _store = SvgBlobStore(cursor)
+        _layouts = cursor.execute("SELECT fingerprint, HouseID, svg FROM HouseLayouts WHERE svg IS NOT NULL").fetchall()
+        cursor.executemany("UPDATE HouseLayouts SET svg_hash = ?, svg = NULL WHERE fingerprint = ?",
+                           [(_store.put(_svg, _house_id), _fingerprint) for _fingerprint, _house_id, _svg in _layouts])
+        print(f'moved svg of {len(_layouts)} layouts to SvgBlobs ({_store.written} blobs)')
+
+
 class SQLiteTableModel(ABC):
     # def __init__(self):
     #     self.table_name = ""
@@ -247,10 +616,14 @@ class HousesTable(SQLiteTableModel):
         """
             HouseID will not be supplied until Seatplan is scraped
             as this information is not present in
+            svg_hash refers to the clean svg of the house in SvgBlobs, svg is no longer written
         """
         return [
             {"column_name": "HouseID",          "dtype": "integer", "primary_key": True},
             {"column_name": "name",             "dtype": "text", "nullable": False},
+            {"column_name": "capacity",         "dtype": "integer"},
+            {"column_name": "svg",              "dtype": "text"},
+            {"column_name": "svg_hash",         "dtype": "text"},
             {"column_name": "TheatreID",        "dtype": "integer"},
             {"column_name": "EnteredDate",      "dtype": "integer(4)", "default": "(strftime('%s','now'))",
                                                 "nullable": False}
@@ -265,6 +638,42 @@ class HousesTable(SQLiteTableModel):
         return insert_sql
 
 
+class HouseLayoutsTable(SQLiteTableModel):
+    @property
+    def table_name(self):
+        return "HouseLayouts"
+
+    @property
+    def primary_key(self):
+        return "fingerprint"
+
+    @property
+    def columns(self):
+        """
+            cache of hkmovie.SeatplanToolkit.SeatplanLayout, one row per layout fingerprint
+            fingerprint: sha1 of the geometry of a seat plan svg, without colors (SeatplanToolkit.scan_layout)
+            svg_hash refers to the clean svg of the layout in SvgBlobs, svg is no longer written
+            x, y, col, row_index, fill_slot: array.array bytes, one item per seat, in document order
+        """
+        return [
+            {"column_name": "fingerprint",      "dtype": "text", "primary_key": True},
+            {"column_name": "HouseID",          "dtype": "integer"},
+            {"column_name": "capacity",         "dtype": "integer"},
+            {"column_name": "slot_count",       "dtype": "integer"},
+            {"column_name": "row_labels",       "dtype": "text"},
+            {"column_name": "svg",              "dtype": "text"},
+            {"column_name": "svg_hash",         "dtype": "text"},
+            {"column_name": "x",                "dtype": "blob"},
+            {"column_name": "y",                "dtype": "blob"},
+            {"column_name": "col",              "dtype": "blob"},
+            {"column_name": "row_index",        "dtype": "blob"},
+            {"column_name": "fill_slot",        "dtype": "blob"},
+            {"column_name": "rotation",         "dtype": "blob"},
+            {"column_name": "EnteredDate",      "dtype": "integer(4)", "default": "(strftime('%s','now'))",
+                                                "nullable": False}
+        ]
+
+
 class ShowtimesTable(SQLiteTableModel):
     @property
     def table_name(self):
@@ -277,8 +686,7 @@ class ShowtimesTable(SQLiteTableModel):
     @property
     def columns(self):
         """
-            HouseID will not be supplied until Seatplan is scraped
-            as this information is not present in
+            start_time, price and HouseID will not be supplied until Seatplan is scraped
         """
         return [
             {"column_name": "ShowtimeID",       "dtype": "integer", "primary_key": True},
@@ -341,6 +749,112 @@ class SalesHistoryTable(SQLiteTableModel):
         return insert_sql
 
 
+class SalesBitmapsTable(SQLiteTableModel):
+    @property
+    def table_name(self):
+        return "SalesBitmaps"
+
+    @property
+    def primary_key(self):
+        return "ShowtimeID"
+
+    @property
+    def columns(self):
+        """
+            one row per showtime, replaces one SalesHistory row per taken seat
+            bitmap: bit n is set if the seat with Seats.seat_index = n (in HouseID) is taken
+            ticket_sold: number of bits set in bitmap
+        """
+        return [
+            {"column_name": "ShowtimeID",       "dtype": "integer", "primary_key": True},
+            {"column_name": "HouseID",          "dtype": "integer", "nullable": False},
+            {"column_name": "bitmap",           "dtype": "blob", "nullable": False},
+            {"column_name": "ticket_sold",      "dtype": "integer", "nullable": False},
+            {"column_name": "EnteredDate",      "dtype": "integer(4)", "default": "(strftime('%s','now'))",
+                                                "nullable": False},
+            {"column_name": "ModifiedDate",     "dtype": "integer(4)", "default": "(strftime('%s','now'))",
+                                                "nullable": False}
+        ]
+
+    def upsert_statement(self):
+        """
+        parameters: ShowtimeID, HouseID, bitmap, ticket_sold, EnteredDate (None for now)
+        :return:
+        """
+        insert_sql = """
+            INSERT INTO {table} ( ShowtimeID, HouseID, bitmap, ticket_sold, EnteredDate ) 
+            VALUES ( ?1, ?2, ?3, ?4, COALESCE(?5, strftime('%s','now')) )
+            ON CONFLICT ( ShowtimeID )
+            DO UPDATE SET HouseID = ?2, bitmap = ?3, ticket_sold = ?4, ModifiedDate = (strftime('%s','now'))
+        """.format(table=self.table_name).strip().replace('\n', '')
+        return insert_sql
+
+
+class SalesDeltasTable(SQLiteTableModel):
+    @property
+    def table_name(self):
+        return "SalesDeltas"
+
+    @property
+    def primary_key(self):
+        return "DeltaID"
+
+    @property
+    def columns(self):
+        """
+            one row per scrape that found newly sold seats of a showtime
+            bitmap: seats first seen taken by that scrape (same bit positions as SalesBitmaps.bitmap)
+            EnteredDate: first-seen time of those seats
+        """
+        return [
+            {"column_name": "DeltaID",          "dtype": "integer", "primary_key": True},
+            {"column_name": "ShowtimeID",       "dtype": "integer", "nullable": False},
+            {"column_name": "bitmap",           "dtype": "blob", "nullable": False},
+            {"column_name": "ticket_sold",      "dtype": "integer", "nullable": False},
+            {"column_name": "EnteredDate",      "dtype": "integer(4)", "default": "(strftime('%s','now'))",
+                                                "nullable": False}
+        ]
+
+    def insert_statement(self):
+        """
+        parameters: ShowtimeID, bitmap, ticket_sold, EnteredDate (None for now)
+        :return:
+        """
+        insert_sql = """
+            INSERT INTO {table} ( ShowtimeID, bitmap, ticket_sold, EnteredDate ) 
+            VALUES ( ?1, ?2, ?3, COALESCE(?4, strftime('%s','now')) )
+        """.format(table=self.table_name).strip().replace('\n', '')
+        return insert_sql
+
+
+class SvgBlobsTable(SQLiteTableModel):
+    @property
+    def table_name(self):
+        return "SvgBlobs"
+
+    @property
+    def primary_key(self):
+        return "svg_hash"
+
+    @property
+    def columns(self):
+        """
+            svg_hash: sha1 of the svg text
+            codec: "zstd" / "zlib", compression of body
+            size: length of the svg text
+            HouseID: the house that first reported this svg
+        """
+        return [
+            {"column_name": "svg_hash",         "dtype": "text", "primary_key": True},
+            {"column_name": "codec",            "dtype": "text", "nullable": False},
+            {"column_name": "size",             "dtype": "integer"},
+            {"column_name": "body",             "dtype": "blob", "nullable": False},
+            {"column_name": "HouseID",          "dtype": "integer"},
+            {"column_name": "EnteredDate",      "dtype": "integer(4)", "default": "(strftime('%s','now'))",
+                                                "nullable": False}
+        ]
+
+
 class SeatsTable(SQLiteTableModel):
     @property
     def table_name(self):
@@ -369,6 +883,9 @@ class SeatsTable(SQLiteTableModel):
             {"column_name": "SeatID",           "dtype": "integer", "primary_key": True},
             {"column_name": "seat_number",      "dtype": "text"},
             {"column_name": "HouseID",          "dtype": "integer"},
+            {"column_name": "x",                "dtype": "integer(4)"},
+            {"column_name": "y",                "dtype": "integer(4)"},
+            {"column_name": "seat_index",       "dtype": "integer"},
             {"column_name": "EnteredDate",      "dtype": "integer(4)", "default": "(strftime('%s','now'))",
                                                 "nullable": False}
         ]
@@ -426,6 +943,15 @@ class TheatresTable(SQLiteTableModel):
 
 
 if __name__ == "__main__":
-    export_schema_from_db()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='export the schema of the database to schema.sql, or migrate it')
+    parser.add_argument('--migrate', action='store_true',
+                        help='migrate a database of an older schema once (SalesBitmaps, seat_index, SvgBlobs)')
+    args = parser.parse_args()
+    if args.migrate:
+        migrate_database()
+    else:
+        export_schema_from_db()
 else:
     create_tables_and_views()
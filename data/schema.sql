@@ -1,7 +1,7 @@
 CREATE TABLE IF NOT EXISTS Movies ( MovieID integer PRIMARY KEY, hkmovie6_code text NOT NULL UNIQUE, name text NOT NULL, name_en text, synopsis text, release_date text, duration integer, category text, InTheatre integer NOT NULL, ModifiedDate integer(4) NOT NULL DEFAULT (strftime('%s','now')), EnteredDate integer(4) NOT NULL DEFAULT (strftime('%s','now')) );
 CREATE TABLE IF NOT EXISTS Reactions ( ReactionID integer PRIMARY KEY, rating integer, like integer, comment_count integer, MovieID integer NOT NULL, EnteredDate integer(4) NOT NULL DEFAULT (strftime('%s','now')) );
 CREATE TABLE IF NOT EXISTS Showtimes (ShowtimeID integer PRIMARY KEY, showtime_code text NOT NULL UNIQUE, HouseID integer, MovieID integer NOT NULL, start_time integer (4), EnteredDate integer (4) NOT NULL DEFAULT (strftime('%s', 'now')), price INTEGER);
-CREATE TABLE IF NOT EXISTS Seats (SeatID integer PRIMARY KEY, seat_number text, HouseID integer, x INTEGER (4), y INTEGER (4), EnteredDate integer (4) NOT NULL DEFAULT (strftime('%s', 'now')));
+CREATE TABLE IF NOT EXISTS Seats (SeatID integer PRIMARY KEY, seat_number text, HouseID integer, x INTEGER (4), y INTEGER (4), seat_index INTEGER, EnteredDate integer (4) NOT NULL DEFAULT (strftime('%s', 'now')));
 CREATE TABLE IF NOT EXISTS SalesHistory (
     ID          INTEGER     PRIMARY KEY,
     SeatID      INTEGER     ,
@@ -10,6 +10,8 @@ CREATE TABLE IF NOT EXISTS SalesHistory (
                             DEFAULT (strftime('%s', 'now') ) ,
     UNIQUE(SeatID, ShowtimeID)
 );
+CREATE TABLE IF NOT EXISTS SalesDeltas ( DeltaID integer PRIMARY KEY, ShowtimeID integer NOT NULL, bitmap blob NOT NULL, ticket_sold integer NOT NULL, EnteredDate integer(4) NOT NULL DEFAULT (strftime('%s','now')) );
+CREATE TABLE IF NOT EXISTS SalesBitmaps ( ShowtimeID integer PRIMARY KEY, HouseID integer NOT NULL, bitmap blob NOT NULL, ticket_sold integer NOT NULL, EnteredDate integer(4) NOT NULL DEFAULT (strftime('%s','now')), ModifiedDate integer(4) NOT NULL DEFAULT (strftime('%s','now')) );
 CREATE TABLE IF NOT EXISTS Theatres (
     TheatreID  INTEGER        PRIMARY KEY
                               UNIQUE,
@@ -21,10 +23,15 @@ CREATE TABLE IF NOT EXISTS Theatres (
     DistrictID INT
 );
 CREATE TABLE IF NOT EXISTS Districts (DistrictID INTEGER PRIMARY KEY, name TEXT, name_en TEXT);
-CREATE TABLE IF NOT EXISTS Houses (HouseID integer PRIMARY KEY, name text NOT NULL, capacity INTEGER, svg TEXT, alias1, TheatreID integer, EnteredDate integer (4) NOT NULL DEFAULT (strftime('%s', 'now')));
+CREATE TABLE IF NOT EXISTS Houses (HouseID integer PRIMARY KEY, name text NOT NULL, capacity INTEGER, svg TEXT, svg_hash TEXT, alias1, TheatreID integer, EnteredDate integer (4) NOT NULL DEFAULT (strftime('%s', 'now')));
+CREATE TABLE IF NOT EXISTS SvgBlobs ( svg_hash text PRIMARY KEY, codec text NOT NULL, size integer, body blob NOT NULL, HouseID integer, EnteredDate integer(4) NOT NULL DEFAULT (strftime('%s','now')) );
+CREATE TABLE IF NOT EXISTS HouseLayouts ( fingerprint text PRIMARY KEY, HouseID integer, capacity integer, slot_count integer, row_labels text, svg text, svg_hash text, x blob, y blob, col blob, row_index blob, fill_slot blob, rotation blob, EnteredDate integer(4) NOT NULL DEFAULT (strftime('%s','now')) );
 CREATE INDEX IF NOT EXISTS Movies_indices ON Movies (hkmovie6_code, name, name_en);
 CREATE INDEX IF NOT EXISTS Theatres_indices ON Theatres (name, name_en);
 CREATE INDEX IF NOT EXISTS Showtimes_indices ON Showtimes (showtime_code, HouseID, MovieID);
+CREATE INDEX IF NOT EXISTS HouseLayouts_indices ON HouseLayouts (HouseID);
+CREATE INDEX IF NOT EXISTS Seats_indices ON Seats (HouseID, x, y);
+CREATE INDEX IF NOT EXISTS SalesDeltas_indices ON SalesDeltas (ShowtimeID);
 CREATE VIEW IF NOT EXISTS SalesDetails AS WITH base AS (
     SELECT
         b.hkmovie6_code
@@ -44,12 +51,12 @@ CREATE VIEW IF NOT EXISTS SalesDetails AS WITH base AS (
             ELSE 'day'
         END as 'time_check'
         , d.capacity
-        , COUNT(c.ID) as 'ticket_sold'
-        , COUNT(c.ID) * a.price as 'profit'
+        , COALESCE(SUM(c.ticket_sold), 0) as 'ticket_sold'
+        , COALESCE(SUM(c.ticket_sold), 0) * a.price as 'profit'
     FROM Showtimes AS a
     INNER JOIN Movies AS b
         ON a.MovieID = b.MovieID
-    LEFT JOIN SalesHistory AS c
+    LEFT JOIN SalesBitmaps AS c
         ON a.ShowtimeID = c.ShowtimeID
     LEFT JOIN Houses AS d
         ON a.HouseID = d.HouseID
@@ -125,9 +132,17 @@ INNER JOIN (
 ) dup ON main.start_time = dup.start_time and main.MovieID = dup.MovieID and main.HouseID = dup.HouseID
 INNER JOIN vShowDetails as sd ON main.showtimeID = sd.showtimeID
 ORDER BY main.start_time, main.MovieID, main.HouseID;
-CREATE VIEW IF NOT EXISTS vSalesHistoryCount AS select a.ShowtimeID, COUNT(a.ShowtimeID) as 'cnt' from SalesHistory a 
-group by a.ShowtimeID;
+CREATE VIEW IF NOT EXISTS vSalesHistoryCount AS select a.ShowtimeID, a.ticket_sold as 'cnt' from SalesBitmaps a 
+where a.ticket_sold > 0;
+CREATE VIEW IF NOT EXISTS vSalesHistory AS SELECT s.SeatID, d.ShowtimeID, d.EnteredDate FROM SalesDeltas AS d
+INNER JOIN SalesBitmaps AS b
+    ON d.ShowtimeID = b.ShowtimeID
+INNER JOIN Seats AS s
+    ON s.HouseID = b.HouseID AND s.seat_index < length(d.bitmap) * 8
+WHERE ((instr('0123456789ABCDEF', substr(hex(d.bitmap), s.seat_index / 4 + 1, 1)) - 1) >> (3 - s.seat_index % 4)) & 1 = 1;
 CREATE TRIGGER IF NOT EXISTS delete_sale_records AFTER DELETE ON Showtimes BEGIN DELETE FROM SalesHistory WHERE SalesHistory.ShowtimeID = OLD.showtimeID; END;
+CREATE TRIGGER IF NOT EXISTS delete_sale_bitmaps AFTER DELETE ON Showtimes BEGIN DELETE FROM SalesBitmaps WHERE SalesBitmaps.ShowtimeID = OLD.showtimeID; END;
+CREATE TRIGGER IF NOT EXISTS delete_sale_deltas AFTER DELETE ON Showtimes BEGIN DELETE FROM SalesDeltas WHERE SalesDeltas.ShowtimeID = OLD.showtimeID; END;
 CREATE VIEW IF NOT EXISTS vShowDetails AS SELECT
     c.hkmovie6_code
     , c.MovieID
@@ -0,0 +1,159 @@
+import time
+import asyncio
+import inspect
+import threading
+import concurrent.futures
+from urllib.parse import urlparse
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Async Orchestrator |}
+#
+# Schedules fetch tasks on an asyncio event loop under a per-host token bucket,
+# so that the request budget (requests per second, burst) is shared by every worker instead of each scraper
+# sleeping at random.
+#
+# flow:
+#   1) run(task, items) starts task(orchestrator, item) for every item, at most `concurrency` at a time
+#   2) a task calls await orchestrator.browser(host, func, *args) or await orchestrator.http(host, func, *args),
+#       both take a token from the bucket of host first (waiting if the bucket is empty)
+#       a) browser: func runs on the browser thread pool (one thread per Firefox process, see BrowserPool)
+#       b) http: a coroutine function (e.g., SeatplanHttpFetcher.fetch_async over aiohttp) is awaited on the loop,
+#           a plain function (e.g., SeatplanHttpFetcher.fetch, without aiohttp) runs on the http thread pool
+#   3) results are returned in the order of items, a task that raises is logged and returns None
+#   4) finalize() is awaited on the loop once every task is done, e.g., to close an aiohttp session
+#
+# usage:
+#   async def task(orchestrator, code):
+#       return await orchestrator.browser('hkmovie6.com', automate_scrape, code, pool)
+#   results = AsyncOrchestrator(rate=2, burst=4, browser_workers=3).run(task, codes)
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+
+def host_of(url):
+    """:return: host of url, or url itself if it is already a host"""
+    return urlparse(url).netloc or url
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        """
+        :param rate: tokens (requests) added per second
+        :param burst: maximum number of tokens, i.e., requests that can be sent at once after idling
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.acquired = 0
+        self.waited = 0.0
+        self._lock = None
+
+    def _refill(self):
+        _now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (_now - self.updated) * self.rate)
+        self.updated = _now
+
+    async def acquire(self):
+        """
+        take a token, waiting until one is available; waiters are served in order
+        :return: seconds waited
+        """
+        # ! - created on first use, inside the running loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        _t0 = time.monotonic()
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+        _waited = time.monotonic() - _t0
+        self.acquired += 1
+        self.waited += _waited
+        return _waited
+
+
+class AsyncOrchestrator:
+    def __init__(self, rate=2.0, burst=4, browser_workers=3, http_workers=10, concurrency=None):
+        """
+        :param rate: requests per second, per host
+        :param burst: requests that can be sent at once, per host
+        :param browser_workers: threads running browser work, should be the size of the BrowserPool
+        :param http_workers: threads running blocking http work (unused by coroutine functions)
+        :param concurrency: tasks in flight, defaults to browser_workers + http_workers
+        """
+        self.rate = rate
+        self.burst = burst
+        self.browser_workers = browser_workers
+        self.http_workers = http_workers
+        self.concurrency = concurrency or browser_workers + http_workers
+        self.buckets = dict()
+        self._buckets_lock = threading.Lock()
+        self._browser_executor = None
+        self._http_executor = None
+        self.failed = 0
+
+    def bucket(self, host):
+        """:return: TokenBucket of host (or of the host of a url)"""
+        _host = host_of(host)
+        with self._buckets_lock:
+            if _host not in self.buckets:
+                self.buckets[_host] = TokenBucket(self.rate, self.burst)
+            return self.buckets[_host]
+
+    async def browser(self, host, func, *args, **kwargs):
+        """take a token of host, then run func on the browser thread pool"""
+        await self.bucket(host).acquire()
+        _loop = asyncio.get_running_loop()
+        return await _loop.run_in_executor(self._browser_executor, lambda: func(*args, **kwargs))
+
+    async def http(self, host, func, *args, **kwargs):
+        """take a token of host, then await func if it is a coroutine function, else run it on the http thread pool"""
+        await self.bucket(host).acquire()
+        if inspect.iscoroutinefunction(func):
+            return await func(*args, **kwargs)
+        _loop = asyncio.get_running_loop()
+        return await _loop.run_in_executor(self._http_executor, lambda: func(*args, **kwargs))
+
+    async def _run(self, task, items, finalize=None):
+        _semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def _guarded(_item):
+            async with _semaphore:
+                try:
+                    return await task(self, _item)
+                except Exception as err:
+                    self.failed += 1
+                    print(f'AsyncOrchestrator: task failed for {_item}: {repr(err)}')
+                    return None
+
+        try:
+            return await asyncio.gather(*(_guarded(_item) for _item in items))
+        finally:
+            if finalize is not None:
+                await finalize()
+
+    def run(self, task, items, finalize=None):
+        """
+        :param task: coroutine function task(orchestrator, item)
+        :param items: list of items
+        :param finalize: coroutine function without argument, awaited on the loop after the tasks
+        :return: list of results, in the order of items
+        """
+        self._browser_executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.browser_workers)
+        self._http_executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.http_workers)
+        try:
+            return asyncio.run(self._run(task, list(items), finalize))
+        finally:
+            self._browser_executor.shutdown()
+            self._http_executor.shutdown()
+
+    def print_summary(self):
+        for _host, _bucket in self.buckets.items():
+            print(f'{_host}: {_bucket.acquired} requests at {self.rate}/s (burst {self.burst}), '
+                  f'waited {_bucket.waited:.1f}s in total for tokens')
+        if self.failed:
+            print(f'AsyncOrchestrator: {self.failed} tasks failed')
@@ -0,0 +1,196 @@
+import time
+import threading
+import concurrent.futures
+from contextlib import contextmanager
+from selenium.common.exceptions import WebDriverException
+from hkmovie.Instrumentation import METRICS
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Browser Pool |}
+#
+# Keeps warm scrapers (SeatplanScraper / ShowtimeScraper, i.e., objects with .driver and .tear_down())
+# so that geckodriver/Firefox is started once per pool slot instead of once per thread per run,
+# and a SeatplanScraper that has done its first forced refresh keeps its state between leases.
+#
+# flow:
+#   1) warm() starts `size` scrapers in parallel (optional, otherwise scrapers are started on first lease)
+#   2) lease() hands out an idle scraper, blocks if all `size` scrapers are leased
+#       a) a scraper that fails the health check, served `max_pages` pages or is older than `max_age` seconds
+#           is torn down and replaced on lease (recycling)
+#   3) release() returns the scraper to the pool, release(broken=True) tears it down (e.g., after Terminator)
+#   4) close() tears down every scraper
+#
+# usage:
+#   pool = BrowserPool(lambda: SeatplanScraper(headless=True), size=3)
+#   with pool.leased() as scraper:
+#       scraper.scrape(...)
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+
+class BrowserPool:
+    def __init__(self, factory, size=3, max_pages=200, max_age=30 * 60, health_check=True):
+        """
+        :param factory: function that creates a scraper, e.g., lambda: SeatplanScraper(headless=True)
+        :param size: maximum number of scrapers (i.e., Firefox processes)
+        :param max_pages: number of leases after which a scraper is recycled, None for no limit
+        :param max_age: seconds after which a scraper is recycled, None for no limit
+        :param health_check: whether to check that the driver responds before leasing it
+        """
+        self.factory = factory
+        self.size = size
+        self.max_pages = max_pages
+        self.max_age = max_age
+        self.health_check = health_check
+        # ! - idle scrapers, the most recently returned (warmest) scraper is leased first
+        self._idle = list()
+        self._lock = threading.Condition()
+        self._created = 0
+        self._closed = False
+        # ! - id(scraper) -> [scraper, created at, number of leases]
+        self._stats = dict()
+        self.recycled = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def warm(self, n=None):
+        """
+        start scrapers in parallel until the pool holds n (defaults to size) scrapers
+        :return: number of scrapers started
+        """
+        with self._lock:
+            _n = max(min(n or self.size, self.size) - self._created, 0)
+            self._created += _n
+        if _n == 0:
+            return 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=_n) as executor:
+            _futures = [executor.submit(self._create, leased=False) for _ in range(_n)]
+        _started = 0
+        for _future in _futures:
+            try:
+                self.release(_future.result())
+                _started += 1
+            except Exception as err:
+                print(f'BrowserPool.warm(): failed to start a scraper: {repr(err)}')
+        return _started
+
+    def lease(self, timeout=None):
+        """
+        :param timeout: seconds to wait for an idle scraper when all scrapers are leased, None to wait forever
+        :return: scraper
+        """
+        _deadline = None if timeout is None else time.time() + timeout
+        while True:
+            with self._lock:
+                while not self._idle and self._created >= self.size:
+                    if self._closed:
+                        raise RuntimeError('BrowserPool is closed')
+                    _remaining = None if _deadline is None else _deadline - time.time()
+                    if _remaining is not None and _remaining <= 0:
+                        raise TimeoutError(f'BrowserPool.lease(): no scraper available after {timeout} seconds')
+                    self._lock.wait(_remaining)
+                if self._closed:
+                    raise RuntimeError('BrowserPool is closed')
+                if self._idle:
+                    _scraper = self._idle.pop()
+                else:
+                    self._created += 1
+                    _scraper = None
+            if _scraper is None:
+                # ! - started outside of the lock, as starting Firefox takes seconds
+                return self._create(leased=True)
+
+            _expired = self._is_expired(_scraper)
+            if _expired or not self._is_healthy(_scraper):
+                self._discard(_scraper)
+                self.recycled += 1
+                METRICS.increment('driver_restarts_total', reason='expired' if _expired else 'unhealthy')
+                continue
+            self._stats[id(_scraper)][2] += 1
+            return _scraper
+
+    def release(self, scraper, broken=False):
+        """
+        :param scraper: scraper returned by lease()
+        :param broken: tear down the scraper instead of returning it to the pool
+        :return:
+        """
+        if broken or self._closed:
+            if broken:
+                METRICS.increment('driver_restarts_total', reason='broken')
+            self._discard(scraper)
+            return
+        with self._lock:
+            self._idle.append(scraper)
+            self._lock.notify()
+
+    @contextmanager
+    def leased(self, timeout=None):
+        """lease a scraper, returned to the pool on exit, or torn down if an exception is raised"""
+        _scraper = self.lease(timeout)
+        try:
+            yield _scraper
+        except BaseException:
+            self.release(_scraper, broken=True)
+            raise
+        else:
+            self.release(_scraper)
+
+    def close(self):
+        """tear down all idle scrapers, scrapers still leased are torn down on release"""
+        with self._lock:
+            self._closed = True
+            _idle, self._idle = self._idle, list()
+            self._lock.notify_all()
+        for _scraper in _idle:
+            self._discard(_scraper)
+
+    def _create(self, leased):
+        """
+        start a scraper, self._created must be incremented by the caller beforehand
+        :param leased: whether the scraper is handed out right away (counts as its first lease)
+        """
+        try:
+            with METRICS.span('driver_start'):
+                _scraper = self.factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+                self._lock.notify()
+            raise
+        self._stats[id(_scraper)] = [_scraper, time.time(), 1 if leased else 0]
+        return _scraper
+
+    def _discard(self, scraper):
+        self._stats.pop(id(scraper), None)
+        with self._lock:
+            self._created -= 1
+            self._lock.notify()
+        try:
+            scraper.tear_down()
+        except Exception as err:
+            print(f'BrowserPool: failed to tear down scraper: {repr(err)}')
+
+    def _is_expired(self, scraper):
+        _, _created_at, _pages = self._stats[id(scraper)]
+        if self.max_pages is not None and _pages >= self.max_pages:
+            return True
+        if self.max_age is not None and time.time() - _created_at >= self.max_age:
+            return True
+        return False
+
+    def _is_healthy(self, scraper):
+        if not self.health_check:
+            return True
+        try:
+            # ! - a round trip to geckodriver, raises if Firefox or geckodriver is gone
+            scraper.driver.window_handles
+            return True
+        except (WebDriverException, AttributeError) as err:
+            print(f'BrowserPool: scraper failed health check: {repr(err)}')
+            return False
@@ -0,0 +1,149 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Adaptive Concurrency Controller |}
+#
+# Grows or shrinks the number of active workers at runtime (AIMD: additive increase, multiplicative decrease),
+# between min_workers and max_workers, based on per-page latency and the rate of errors
+# (Terminator, RetryError, timeouts), so that a run neither under-uses the machine nor hammers a struggling site.
+#
+# flow:
+#   1) a worker enters slot() before each page, and blocks while `limit` workers are already active
+#   2) slot() records exactly one outcome per page: its latency, or its error (the name of the exception raised),
+#       an error handled inside the worker (e.g., a Terminator followed by a retry) is reported on the SlotOutcome
+#       yielded by slot() (outcome.fail(...)), so that the page counts as that error and not also as a latency
+#   3) every `window` observations, a decision is made and logged:
+#       a) error rate > max_error_rate: limit = limit * decrease (at least min_workers)
+#       b) median latency > target_latency: limit = limit * decrease
+#       c) otherwise: limit = limit + increase (at most max_workers)
+#       target_latency defaults to `slowdown` x the median latency of the first window (baseline)
+#
+# usage:
+#   controller = AdaptiveConcurrency(min_workers=1, max_workers=8)
+#   with controller.slot() as outcome:
+#       scrape(..., slot=outcome)
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+
+class SlotOutcome:
+    """outcome of the page of a slot, see AdaptiveConcurrency.slot()"""
+    def __init__(self):
+        self.error = None
+
+    def fail(self, error):
+        """:param error: name of an error handled by the worker, the first one is recorded"""
+        if self.error is None:
+            self.error = error
+
+
+class AdaptiveConcurrency:
+    def __init__(self, min_workers=1, max_workers=8, initial=None, target_latency=None, max_error_rate=0.1,
+                 window=10, increase=1, decrease=0.5, slowdown=2.0):
+        """
+        :param min_workers:
+        :param max_workers: also the number of threads (and drivers) to create
+        :param initial: number of active workers at start, defaults to min_workers
+        :param target_latency: seconds per page above which the limit is decreased, None to learn a baseline
+        :param max_error_rate: share of errors in a window above which the limit is decreased
+        :param window: number of observations per decision
+        :param increase: workers added after a healthy window
+        :param decrease: factor applied to the limit after an unhealthy window
+        :param slowdown: target_latency = slowdown x baseline median latency, if target_latency is None
+        """
+        self.min_workers = max(min_workers, 1)
+        self.max_workers = max(max_workers, self.min_workers)
+        self.limit = min(max(initial or self.min_workers, self.min_workers), self.max_workers)
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+        self.window = window
+        self.increase = increase
+        self.decrease = decrease
+        self.slowdown = slowdown
+        self.active = 0
+        self._cond = threading.Condition()
+        self._latencies = list()
+        self._errors = dict()
+        # ! - (time, old limit, new limit, reason)
+        self.decisions = list()
+
+    def acquire(self):
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """
+        hold a worker slot for one page, recording either its latency or one error
+        :return: SlotOutcome, to report an error handled inside the slot
+        """
+        self.acquire()
+        _t0 = time.perf_counter()
+        _outcome = SlotOutcome()
+        try:
+            yield _outcome
+        except BaseException as err:
+            self.observe(error=_outcome.error or type(err).__name__)
+            raise
+        else:
+            if _outcome.error is not None:
+                self.observe(error=_outcome.error)
+            else:
+                self.observe(latency=time.perf_counter() - _t0)
+        finally:
+            self.release()
+
+    def observe(self, latency=None, error=None):
+        """
+        :param latency: seconds of a successful page
+        :param error: name of the error of a failed page (e.g., "Terminator", "RetryError", "TimeoutException")
+        """
+        with self._cond:
+            if error is not None:
+                self._errors[error] = self._errors.get(error, 0) + 1
+            elif latency is not None:
+                self._latencies.append(latency)
+            if len(self._latencies) + sum(self._errors.values()) >= self.window:
+                self._decide()
+
+    def _decide(self):
+        """called with self._cond held"""
+        _errors = sum(self._errors.values())
+        _observations = len(self._latencies) + _errors
+        _error_rate = _errors / _observations
+        _latencies = sorted(self._latencies)
+        _median = _latencies[len(_latencies) // 2] if _latencies else None
+        _old = self.limit
+
+        if self.target_latency is None and _median is not None and _error_rate <= self.max_error_rate:
+            self.target_latency = _median * self.slowdown
+            print(f'AdaptiveConcurrency: baseline median latency {_median:.2f}s, '
+                  f'target latency set to {self.target_latency:.2f}s')
+
+        if _error_rate > self.max_error_rate:
+            self.limit = max(self.min_workers, int(self.limit * self.decrease))
+            _reason = f'error rate {_error_rate:.0%} > {self.max_error_rate:.0%} ' \
+                      f'({", ".join(f"{_k}: {_v}" for _k, _v in sorted(self._errors.items()))})'
+        elif _median is not None and self.target_latency is not None and _median > self.target_latency:
+            self.limit = max(self.min_workers, int(self.limit * self.decrease))
+            _reason = f'median latency {_median:.2f}s > {self.target_latency:.2f}s'
+        else:
+            self.limit = min(self.max_workers, self.limit + self.increase)
+            _reason = f'healthy (median latency {_median if _median is not None else 0:.2f}s, ' \
+                      f'error rate {_error_rate:.0%})'
+
+        self.decisions.append((time.time(), _old, self.limit, _reason))
+        print(f'AdaptiveConcurrency: {_old} -> {self.limit} workers: {_reason}')
+        self._latencies = list()
+        self._errors = dict()
+        self._cond.notify_all()
@@ -0,0 +1,148 @@
+import time
+import queue
+import threading
+from hkmovie.Instrumentation import METRICS
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Export Pipeline |}
+#
+# Overlaps scraping and exporting: scraper workers put() profiles on a bounded queue while a writer thread
+# exports them in micro-batches, instead of keeping every profile (and its svg) in memory until the last show
+# is scraped and exporting them all at once.
+#
+# flow:
+#   1) put(profile): a worker hands over a profile, and blocks while the queue is full (backpressure),
+#       blocked puts and the seconds they waited are counted
+#   2) the writer thread takes up to batch_size profiles, or what arrived within flush_interval seconds,
+#       and calls export(batch), e.g., export_profile_to_db, which parses the seatplans and commits them to SQLite
+#       a) a batch that raises is logged and counted (failed), the writer carries on with the next batch
+#   3) close() lets the writer drain the queue, export the last batch and stop
+#   queue depth is sampled on every put; batches, exported profiles and waits are also recorded in METRICS
+#
+# usage:
+#   with ExportPipeline(export_profile_to_db, max_queue=200, batch_size=50) as pipeline:
+#       threads_work(content, sink=pipeline)
+#   pipeline.print_summary()
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+# ! - put on the queue by close(), the writer stops once it takes it
+_STOP = object()
+
+
+class ExportPipeline:
+    def __init__(self, export, max_queue=200, batch_size=50, flush_interval=2.0):
+        """
+        :param export: function exporting a list of profiles, called on the writer thread only
+        :param max_queue: profiles waiting for the writer, put() blocks beyond it
+        :param batch_size: maximum number of profiles per export call
+        :param flush_interval: seconds the writer waits to fill a batch before exporting what it has
+        """
+        self.export = export
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._writer = None
+        self._stats_lock = threading.Lock()
+        self.put_count = 0
+        self.blocked = 0
+        self.blocked_seconds = 0.0
+        self.depth_sum = 0
+        self.max_depth = 0
+        self.batches = 0
+        self.exported = 0
+        self.failed = 0
+        self.failed_profiles = 0
+        self.export_seconds = 0.0
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        self._writer = threading.Thread(target=self._run, name='ExportPipeline-writer', daemon=True)
+        self._writer.start()
+        return self
+
+    def put(self, profile):
+        """hand over a profile to the writer, blocks while the queue is full"""
+        try:
+            self._queue.put_nowait(profile)
+            _waited = None
+        except queue.Full:
+            _t0 = time.perf_counter()
+            self._queue.put(profile)
+            _waited = time.perf_counter() - _t0
+        # ! - sampled after the put, approximate as the writer and other workers run concurrently
+        _depth = self._queue.qsize()
+        with self._stats_lock:
+            self.put_count += 1
+            self.depth_sum += _depth
+            self.max_depth = max(self.max_depth, _depth)
+            if _waited is not None:
+                self.blocked += 1
+                self.blocked_seconds += _waited
+        if _waited is not None:
+            METRICS.increment('export_backpressure_total')
+            METRICS.observe('export_queue_wait', _waited)
+
+    def close(self):
+        """export what is left in the queue and stop the writer"""
+        if self._writer is None:
+            return
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._writer = None
+
+    def _run(self):
+        _stopping = False
+        while not _stopping:
+            _first = self._queue.get()
+            if _first is _STOP:
+                break
+            _batch = [_first]
+            _deadline = time.perf_counter() + self.flush_interval
+            while len(_batch) < self.batch_size:
+                try:
+                    _item = self._queue.get(timeout=max(_deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if _item is _STOP:
+                    _stopping = True
+                    break
+                _batch.append(_item)
+            self._export(_batch)
+
+    def _export(self, batch):
+        _t0 = time.perf_counter()
+        try:
+            with METRICS.span('export_batch'):
+                self.export(batch)
+        except Exception as err:
+            self.failed += 1
+            self.failed_profiles += len(batch)
+            print(f'ExportPipeline: failed to export a batch of {len(batch)} profiles: {repr(err)}')
+        else:
+            self.exported += len(batch)
+            METRICS.increment('export_profiles_total', n=len(batch))
+        self.batches += 1
+        self.export_seconds += time.perf_counter() - _t0
+
+    def summary(self):
+        with self._stats_lock:
+            return {"profiles": self.put_count, "exported": self.exported, "failed_profiles": self.failed_profiles,
+                    "batches": self.batches, "failed_batches": self.failed, "export_seconds": self.export_seconds,
+                    "max_queue": self.max_queue, "max_depth": self.max_depth,
+                    "mean_depth": self.depth_sum / self.put_count if self.put_count else 0,
+                    "blocked_puts": self.blocked, "blocked_seconds": self.blocked_seconds}
+
+    def print_summary(self):
+        _s = self.summary()
+        print(f'ExportPipeline: {_s["exported"]}/{_s["profiles"]} profiles exported in {_s["batches"]} batches '
+              f'({_s["export_seconds"]:.1f}s), {_s["failed_batches"]} batches failed; '
+              f'queue depth mean {_s["mean_depth"]:.1f}, max {_s["max_depth"]}/{_s["max_queue"]}; '
+              f'{_s["blocked_puts"]} puts blocked for {_s["blocked_seconds"]:.1f}s (backpressure)')
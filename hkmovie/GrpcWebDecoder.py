@@ -0,0 +1,315 @@
+import re
+import struct
+import argparse
+from collections import namedtuple
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| gRPC-web Decoder |}
+#
+# Decodes the gRPC-web responses captured by ShowtimeScraper into showtime records,
+# walking the bytes once (per nesting level) without decoding the body as text.
+#
+# gRPC-web body:
+#   [flag: 1 byte][length: 4 bytes, big-endian][message: length bytes] ... repeated
+#   flag 0x00 = data frame (a protobuf message), flag 0x80 = trailer frame (grpc-status..., skipped),
+#   flag 0x01 = compressed data frame (skipped, hkmovie6 does not compress)
+#
+# protobuf wire format:
+#   field = [tag: varint (field_number << 3 | wire_type)][value]
+#   wire_type 0 = varint, 1 = 8 bytes, 2 = [length: varint][length bytes], 5 = 4 bytes (3, 4 = groups, not used)
+#
+# showtime message:
+#   a message with field SHOWTIME_CODE_FIELD holding a 36 byte uuid, i.e., the bytes matched by the former regex
+#   \*\$(.{8}-.{4}-.{4}-.{4}-.{12})2 (0x2a = field 5 length-delimited, 0x24 = 36 bytes)
+#   a) start_time: field START_TIME_FIELD, a varint (or Timestamp message {1: seconds}) in the range of unix time
+#   b) house: field HOUSE_FIELD, text
+#   c) cinema: field CINEMA_FIELD, text or the first text field of a nested message
+#   d) price: field PRICE_FIELD, a float / double / varint in PRICE_RANGE (ticket price in HKD)
+#   a uuid anywhere else (e.g., movie id, images) is not a showtime
+#
+# Only SHOWTIME_CODE_FIELD is pinned, from the ListByMovieAndDate response in the README (screenshots).
+# A field whose number is None is not decoded (None), rather than guessed from its position or value:
+# a wrong guess would end up in Showtimes. To pin a field, record responses (ShowtimeScraper(record_dir=...)),
+# list the fields of their showtime messages, set the field number below, and add the response to
+# tests/fixtures/grpc with its expected values (see tests/fixtures/grpc/README.md):
+#   python ScheduledTasks/scrape_showtime.py --record-dir data/grpc
+#   python hkmovie/GrpcWebDecoder.py data/grpc/{hkmovie6_code}/0.bin
+#
+# usage:
+#   for record in decode_showtimes(request.response.body):
+#       record.showtime_code, record.start_time, record.house, record.cinema, record.price
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+# ! - field numbers of the showtime message, None until pinned from a recorded response
+SHOWTIME_CODE_FIELD = 5
+START_TIME_FIELD = None
+HOUSE_FIELD = None
+CINEMA_FIELD = None
+PRICE_FIELD = None
+
+# ! - unix time between 2001 and 2096, anything else is not a start time
+UNIX_TIME_RANGE = (1_000_000_000, 4_000_000_000)
+# ! - ticket prices (HKD) outside of this range are not taken as a price
+PRICE_RANGE = (10, 1000)
+# ! - nested messages deeper than this are not walked
+MAX_DEPTH = 8
+
+VARINT, FIXED64, LENGTH_DELIMITED, FIXED32 = 0, 1, 2, 5
+UUID_PATTERN = re.compile(rb'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+
+ShowtimeRecord = namedtuple('ShowtimeRecord', ['showtime_code', 'start_time', 'house', 'cinema', 'price'])
+
+
+class ProtobufDecodeError(Exception):
+    """raised when bytes are not a valid gRPC-web frame or protobuf message"""
+    pass
+
+
+def iter_grpc_web_frames(body):
+    """
+    :param body: gRPC-web response body (bytes)
+    :return: generator of memoryview, the protobuf message of each uncompressed data frame
+    """
+    _view = memoryview(body)
+    _pos, _end = 0, len(_view)
+    while _pos < _end:
+        if _end - _pos < 5:
+            raise ProtobufDecodeError(f'truncated frame header at {_pos}')
+        _flag = _view[_pos]
+        _length = int.from_bytes(_view[_pos + 1:_pos + 5], 'big')
+        _pos += 5
+        if _pos + _length > _end:
+            raise ProtobufDecodeError(f'frame of {_length} bytes at {_pos} exceeds body of {_end} bytes')
+        if _flag == 0:
+            yield _view[_pos:_pos + _length]
+        _pos += _length
+
+
+def read_varint(buf, pos):
+    """
+    :return: (value, position after the varint)
+    """
+    _result, _shift = 0, 0
+    _end = len(buf)
+    while True:
+        if pos >= _end:
+            raise ProtobufDecodeError('truncated varint')
+        _byte = buf[pos]
+        pos += 1
+        _result |= (_byte & 0x7f) << _shift
+        if _byte < 0x80:
+            return _result, pos
+        _shift += 7
+        if _shift >= 64:
+            raise ProtobufDecodeError('varint longer than 10 bytes')
+
+
+def iter_fields(buf):
+    """
+    :param buf: protobuf message (bytes or memoryview)
+    :return: generator of (field_number, wire_type, value),
+                value is an int for varint / fixed fields and a memoryview for length-delimited fields
+    """
+    _view = memoryview(buf)
+    _pos, _end = 0, len(_view)
+    while _pos < _end:
+        # ! - tags of fields 1 to 15 are 1 byte
+        _tag = _view[_pos]
+        if _tag < 0x80:
+            _pos += 1
+        else:
+            _tag, _pos = read_varint(_view, _pos)
+        _field, _wire_type = _tag >> 3, _tag & 7
+        if _field == 0:
+            raise ProtobufDecodeError('field number 0')
+        if _wire_type == VARINT:
+            _value, _pos = read_varint(_view, _pos)
+        elif _wire_type == LENGTH_DELIMITED:
+            _length = _view[_pos] if _pos < _end else 0x80
+            if _length < 0x80:
+                _pos += 1
+            else:
+                _length, _pos = read_varint(_view, _pos)
+            if _pos + _length > _end:
+                raise ProtobufDecodeError(f'field {_field} of {_length} bytes exceeds message')
+            _value = _view[_pos:_pos + _length]
+            _pos += _length
+        elif _wire_type == FIXED64 or _wire_type == FIXED32:
+            _size = 8 if _wire_type == FIXED64 else 4
+            if _pos + _size > _end:
+                raise ProtobufDecodeError(f'field {_field} exceeds message')
+            _value = int.from_bytes(_view[_pos:_pos + _size], 'little')
+            _pos += _size
+        else:
+            raise ProtobufDecodeError(f'unsupported wire type {_wire_type}')
+        yield _field, _wire_type, _value
+
+
+def parse_message(buf):
+    """
+    :return: list of fields of iter_fields(), or None if buf is not a valid message
+    """
+    try:
+        return list(iter_fields(buf))
+    except ProtobufDecodeError:
+        return None
+
+
+def is_uuid(value):
+    """:param value: bytes or memoryview, e.g., b'0d7e8a0c-57b0-4a8b-9f4c-3c3e4bd5f1a2'"""
+    return len(value) == 36 and value[8] == 0x2d and UUID_PATTERN.fullmatch(value) is not None
+
+
+def as_text(value):
+    """
+    :return: str if value is printable utf-8 text (a name), else None; only called on candidate fields
+    """
+    if not value or len(value) > 200:
+        return None
+    # ! - a control character (incl. tags of a nested message) means binary
+    if min(value) < 0x20:
+        return None
+    try:
+        return bytes(value).decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+
+def is_showtime_code(field, wire_type, value):
+    return field == SHOWTIME_CODE_FIELD and wire_type == LENGTH_DELIMITED and is_uuid(value)
+
+
+def read_unix_time(wire_type, value):
+    """:return: value if it is a varint (or Timestamp message) in UNIX_TIME_RANGE, else None"""
+    if wire_type == VARINT:
+        return value if UNIX_TIME_RANGE[0] <= value < UNIX_TIME_RANGE[1] else None
+    if wire_type == LENGTH_DELIMITED and len(value) <= 24:
+        _fields = parse_message(value)
+        if _fields:
+            _field, _wire_type, _seconds = _fields[0]
+            if _field == 1 and _wire_type == VARINT:
+                return read_unix_time(VARINT, _seconds)
+    return None
+
+
+def read_price(wire_type, value):
+    """:return: value as an int if it is a float / double / varint in PRICE_RANGE, else None"""
+    if wire_type == FIXED64:
+        value = struct.unpack('<d', value.to_bytes(8, 'little'))[0]
+    elif wire_type == FIXED32:
+        value = struct.unpack('<f', value.to_bytes(4, 'little'))[0]
+    elif wire_type != VARINT:
+        return None
+    return round(value) if PRICE_RANGE[0] <= value < PRICE_RANGE[1] else None
+
+
+def read_text(wire_type, value):
+    """:return: value as str if it is a length-delimited text other than a uuid, else None"""
+    if wire_type != LENGTH_DELIMITED or is_uuid(value):
+        return None
+    return as_text(value)
+
+
+def read_nested_text(wire_type, value):
+    """:return: value as str if it is text, else the first text field of value as a nested message, else None"""
+    _text = read_text(wire_type, value)
+    if _text is None and wire_type == LENGTH_DELIMITED:
+        _text = next((_t for _t in (read_text(_w, _v) for _, _w, _v in (parse_message(value) or ()))
+                      if _t is not None), None)
+    return _text
+
+
+def read_showtime(fields, code):
+    """
+    :param fields: fields of a showtime message
+    :param code: showtime code (memoryview)
+    :return: ShowtimeRecord, fields whose number is not pinned are None
+    """
+    _start_time = _house = _cinema = _price = None
+    for _field, _wire_type, _value in fields:
+        if _field == SHOWTIME_CODE_FIELD:
+            continue
+        if _field == START_TIME_FIELD and _start_time is None:
+            _start_time = read_unix_time(_wire_type, _value)
+        elif _field == HOUSE_FIELD and _house is None:
+            _house = read_text(_wire_type, _value)
+        elif _field == CINEMA_FIELD and _cinema is None:
+            _cinema = read_nested_text(_wire_type, _value)
+        elif _field == PRICE_FIELD and _price is None:
+            _price = read_price(_wire_type, _value)
+    return ShowtimeRecord(bytes(code).decode('ascii'), _start_time, _house, _cinema, _price)
+
+
+def iter_showtime_messages(buf, depth=0):
+    """
+    :return: generator of the fields of every showtime message in the message or its nested messages
+    """
+    _fields = parse_message(buf)
+    if _fields is None:
+        return
+    if any(is_showtime_code(_f, _w, _v) for _f, _w, _v in _fields):
+        yield _fields
+        return
+    if depth >= MAX_DEPTH:
+        return
+    for _field, _wire_type, _value in _fields:
+        # ! - only length-delimited fields can hold nested messages, short ones cannot hold a showtime
+        if _wire_type == LENGTH_DELIMITED and len(_value) > 36:
+            yield from iter_showtime_messages(_value, depth + 1)
+
+
+def walk_message(buf, depth=0):
+    """
+    :return: generator of ShowtimeRecord found in the message or its nested messages
+    """
+    for _fields in iter_showtime_messages(buf, depth):
+        _code = next(_v for _f, _w, _v in _fields if is_showtime_code(_f, _w, _v))
+        yield read_showtime(_fields, _code)
+
+
+def decode_showtimes(body):
+    """
+    :param body: gRPC-web response body (bytes)
+    :return: generator of ShowtimeRecord, in the order of the response
+    :raise ProtobufDecodeError: if body is not gRPC-web framed
+    """
+    for _message in iter_grpc_web_frames(body):
+        yield from walk_message(_message)
+
+
+def describe_field(wire_type, value):
+    """:return: str, a preview of a field's value to tell which field holds what"""
+    if wire_type == VARINT:
+        return f'varint {value}' + (' (unix time)' if read_unix_time(VARINT, value) is not None else '')
+    if wire_type == FIXED64:
+        return f'fixed64 {value}, double {struct.unpack("<d", value.to_bytes(8, "little"))[0]!r}'
+    if wire_type == FIXED32:
+        return f'fixed32 {value}, float {struct.unpack("<f", value.to_bytes(4, "little"))[0]!r}'
+    _text = as_text(value)
+    if _text is not None:
+        return f'text {_text!r}'
+    _fields = parse_message(value)
+    if _fields:
+        return 'message {' + ', '.join(f'{_f}: {describe_field(_w, _v)}' for _f, _w, _v in _fields[:6]) + \
+            (', ...' if len(_fields) > 6 else '') + '}'
+    return f'bytes[{len(value)}] {bytes(value[:24])!r}'
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='list the fields of the showtime messages in recorded gRPC-web '
+                                                 'responses, to pin the field numbers of the showtime message')
+    parser.add_argument('bodies', nargs='+', help='files of recorded response bodies')
+    parser.add_argument('--limit', type=int, default=3, help='showtime messages listed per file')
+    args = parser.parse_args()
+
+    for path in args.bodies:
+        with open(path, 'rb') as f:
+            body = f.read()
+        messages = [_m for _frame in iter_grpc_web_frames(body) for _m in iter_showtime_messages(_frame)]
+        print(f'{path}: {len(messages)} showtime messages')
+        for fields in messages[:args.limit]:
+            for field, wire_type, value in fields:
+                print(f'  {field:>3}: {describe_field(wire_type, value)}')
+            print()
@@ -0,0 +1,185 @@
+import os
+import time
+import bisect
+import functools
+import threading
+import orjson
+from contextlib import contextmanager
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Instrumentation |}
+#
+# Per-stage latency of a run, to see which stage eats the time (page load, refresh, selector waits, page_source
+# regex, gRPC decode, teardown...) before adding workers.
+#
+# 1) span(stage): context manager (or @timed(stage) decorator) recording the seconds of a stage into a histogram,
+#       an exception is recorded too (counter span_errors_total) and re-raised
+# 2) increment(counter, **labels): counters, e.g., retries_total{stage="load"}, driver_restarts_total{reason="expired"}
+#       retry_hook(stage) is a tenacity before_sleep callback counting the retries of a stage
+# 3) at the end of a run, write_report(directory, run): {run}-{timestamp}.json (histograms, counters, extra),
+#       and {run}.prom in the Prometheus text format (for the node_exporter textfile collector), overwritten every run
+#
+# usage:
+#   with METRICS.span('load'):
+#       driver.get(url)
+#   METRICS.write_report('metrics', 'seatplan', extra={"waits": WAIT_STATS.summary()})
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+# ! - upper bounds (seconds) of the histogram buckets, the last bucket (+Inf) is implicit
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = 'hkmovie'
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # ! - counts per bucket (not cumulative), the last one is +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """:return: upper bound of the bucket holding the q-quantile, max for the +Inf bucket"""
+        if self.count == 0:
+            return None
+        _rank, _seen = q * self.count, 0
+        for _i, _n in enumerate(self.counts):
+            _seen += _n
+            if _seen >= _rank and _n:
+                return self.buckets[_i] if _i < len(self.buckets) else self.max
+        return self.max
+
+    def summary(self):
+        return {"count": self.count, "sum": self.sum, "mean": self.sum / self.count if self.count else None,
+                "max": self.max, "p50": self.quantile(0.5), "p90": self.quantile(0.9), "p99": self.quantile(0.99),
+                "buckets": {str(_b): _n for _b, _n in zip(self.buckets + ('+Inf',), self.counts)}}
+
+
+class RunMetrics:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # ! - stage -> Histogram
+        self.histograms = dict()
+        # ! - (name, ((label, value)...)) -> count
+        self.counters = dict()
+        self.started = time.time()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = Histogram(self.buckets)
+            self.histograms[stage].observe(seconds)
+
+    def increment(self, name, n=1, **labels):
+        _key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[_key] = self.counters.get(_key, 0) + n
+
+    @contextmanager
+    def span(self, stage):
+        _t0 = time.perf_counter()
+        try:
+            yield
+        except BaseException as err:
+            self.increment('span_errors_total', stage=stage, error=type(err).__name__)
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - _t0)
+
+    def timed(self, stage):
+        """:return: decorator recording every call of the function as a span of stage"""
+        def _decorator(func):
+            @functools.wraps(func)
+            def _wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return _wrapper
+        return _decorator
+
+    def retry_hook(self, stage):
+        """:return: tenacity before_sleep callback, counting retries_total{stage}"""
+        def _before_sleep(retry_state):
+            self.increment('retries_total', stage=stage)
+        return _before_sleep
+
+    def reset(self):
+        with self._lock:
+            self.histograms = dict()
+            self.counters = dict()
+            self.started = time.time()
+
+    def report(self, extra=None):
+        """:return: dict of the run: started, seconds, stages (histogram summaries), counters, and extra"""
+        with self._lock:
+            _report = {
+                "started": self.started,
+                "seconds": time.time() - self.started,
+                "stages": {_stage: _h.summary() for _stage, _h in sorted(self.histograms.items())},
+                "counters": [{"name": _name, "labels": dict(_labels), "value": _value}
+                             for (_name, _labels), _value in sorted(self.counters.items())],
+            }
+        _report.update(extra or dict())
+        return _report
+
+    def prometheus(self, run):
+        """:return: the metrics in the Prometheus text exposition format, labelled with run"""
+        _lines = [f'# HELP {METRIC_PREFIX}_stage_seconds Latency of scraper stages',
+                  f'# TYPE {METRIC_PREFIX}_stage_seconds histogram']
+        with self._lock:
+            for _stage, _h in sorted(self.histograms.items()):
+                _labels = f'run="{run}",stage="{_stage}"'
+                _cumulative = 0
+                for _bound, _n in zip(_h.buckets + ('+Inf',), _h.counts):
+                    _cumulative += _n
+                    _lines.append(f'{METRIC_PREFIX}_stage_seconds_bucket{{{_labels},le="{_bound}"}} {_cumulative}')
+                _lines.append(f'{METRIC_PREFIX}_stage_seconds_sum{{{_labels}}} {_h.sum:.6f}')
+                _lines.append(f'{METRIC_PREFIX}_stage_seconds_count{{{_labels}}} {_h.count}')
+            _typed = set()
+            for (_name, _labels), _value in sorted(self.counters.items()):
+                if _name not in _typed:
+                    _lines.append(f'# TYPE {METRIC_PREFIX}_{_name} counter')
+                    _typed.add(_name)
+                _labels = ','.join([f'run="{run}"'] + [f'{_k}="{_v}"' for _k, _v in _labels])
+                _lines.append(f'{METRIC_PREFIX}_{_name}{{{_labels}}} {_value}')
+        _lines.append(f'# TYPE {METRIC_PREFIX}_run_seconds gauge')
+        _lines.append(f'{METRIC_PREFIX}_run_seconds{{run="{run}"}} {time.time() - self.started:.3f}')
+        return '\n'.join(_lines) + '\n'
+
+    def write_report(self, directory, run, extra=None):
+        """
+        write {run}-{timestamp}.json and {run}.prom to directory
+        :return: (json path, prom path)
+        """
+        os.makedirs(directory, exist_ok=True)
+        _json_path = os.path.join(directory, f'{run}-{time.strftime("%Y%m%d-%H%M%S")}.json')
+        with open(_json_path, 'wb') as f:
+            f.write(orjson.dumps(self.report(extra), option=orjson.OPT_INDENT_2))
+        # ! - written to a temporary file and renamed, so that a collector never reads a partial file
+        _prom_path = os.path.join(directory, f'{run}.prom')
+        with open(_prom_path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(self.prometheus(run))
+        os.replace(_prom_path + '.tmp', _prom_path)
+        return _json_path, _prom_path
+
+    def print_summary(self):
+        _report = self.report()
+        for _stage, _s in _report["stages"].items():
+            print(f'stage {_stage}: {_s["count"]} spans, mean {_s["mean"]:.3f}s, p90 <= {_s["p90"]}s, '
+                  f'max {_s["max"]:.3f}s, total {_s["sum"]:.1f}s')
+        for _counter in _report["counters"]:
+            _labels = ', '.join(f'{_k}={_v}' for _k, _v in _counter["labels"].items())
+            print(f'{_counter["name"]}({_labels}): {_counter["value"]}')
+
+
+# ! - shared by every scraper of the process, written at the end of a run
+METRICS = RunMetrics()
@@ -0,0 +1,106 @@
+import re
+from urllib.parse import urlparse, quote
+from hkmovie.SiteConfig import HOST
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Lean Firefox Profile |}
+#
+# Blocks what the scrapers never read: images, media, web fonts, and requests to third-party domains
+# (posters, trackers, analytics). The seatplan <svg> is rendered by the page's javascript from hkmovie6's own
+# responses, and showtimes come from gRPC calls to hkmovie6, so both still load.
+#
+# how:
+#   1) preferences (both scrapers): images, autoplay / media source, document fonts, prefetching are disabled
+#   2) third-party domains:
+#       a) SeatplanScraper (plain selenium): a PAC script (network.proxy.autoconfig_url) sends requests to hosts
+#           that are not ALLOWED_HOSTS to a closed local port, i.e., they fail at once
+#       b) ShowtimeScraper (selenium-wire, which sets its own proxy, so PAC does not apply):
+#           a request_interceptor aborts blocked requests (see lean_request_interceptor)
+#
+# usage:
+#   apply_lean_profile(firefox_profile)                         # selenium
+#   driver.request_interceptor = lean_request_interceptor()     # selenium-wire
+#   (see benchmarks/page_load_benchmark.py for a comparison against the default profile)
+#
+# status: experimental, opt-in (--lean); its effect on page load has not been measured against hkmovie6.com yet
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+# ! - hosts (and their subdomains) that are allowed in a lean profile
+ALLOWED_HOSTS = ('hkmovie6.com',) + (() if HOST.endswith('hkmovie6.com') else (HOST.split(':')[0],))
+# ! - a port nothing listens on, requests proxied to it fail immediately
+BLACKHOLE_PROXY = '127.0.0.1:9'
+BLOCKED_RESOURCE_PATTERN = re.compile(
+    r'\.(?:png|jpe?g|gif|webp|avif|bmp|ico|svg|woff2?|ttf|otf|eot|mp4|webm|m3u8|mp3|ogg)(?:[?#]|$)', re.I)
+
+LEAN_PREFERENCES = {
+    # ! - 2 = block all images
+    "permissions.default.image": 2,
+    # ! - 5 = block autoplay of audio and video
+    "media.autoplay.default": 5,
+    "media.mediasource.enabled": False,
+    "media.hardware-video-decoding.enabled": False,
+    # ! - web fonts are not downloaded, the page renders with system fonts
+    "gfx.downloadable_fonts.enabled": False,
+    "browser.display.use_document_fonts": 0,
+    "network.prefetch-next": False,
+    "network.dns.disablePrefetch": True,
+    "network.http.speculative-parallel-limit": 0,
+    "browser.urlbar.speculativeConnect.enabled": False,
+    "privacy.trackingprotection.enabled": True,
+    "dom.webnotifications.enabled": False,
+    "geo.enabled": False,
+}
+
+
+def is_allowed_host(host, allowed_hosts=ALLOWED_HOSTS):
+    _host = (host or '').split(':')[0].lower()
+    return any(_host == _a or _host.endswith('.' + _a) for _a in allowed_hosts)
+
+
+def is_blocked(url, allowed_hosts=ALLOWED_HOSTS):
+    """
+    :return: True if url is a third-party request, or an image / media / font of an allowed host
+    """
+    _url = urlparse(url)
+    if _url.scheme in ('data', 'blob', 'about'):
+        return False
+    if not is_allowed_host(_url.netloc, allowed_hosts):
+        return True
+    return BLOCKED_RESOURCE_PATTERN.search(_url.path) is not None
+
+
+def pac_script(allowed_hosts=ALLOWED_HOSTS):
+    """:return: PAC script, DIRECT for allowed hosts and localhost, the blackhole proxy for anything else"""
+    _conditions = ' || '.join(f'host == "{_h}" || dnsDomainIs(host, ".{_h}")' for _h in allowed_hosts)
+    return ('function FindProxyForURL(url, host) { '
+            f'if ({_conditions} || host == "localhost" || host == "127.0.0.1") return "DIRECT"; '
+            f'return "PROXY {BLACKHOLE_PROXY}"; }}')
+
+
+def apply_lean_profile(firefox_profile, allowed_hosts=ALLOWED_HOSTS, block_third_party=True):
+    """
+    :param firefox_profile: selenium FirefoxProfile
+    :param allowed_hosts: hosts that are not blocked by the PAC script
+    :param block_third_party: set the PAC script, must be False with selenium-wire (it manages the proxy)
+    :return: firefox_profile
+    """
+    for _key, _value in LEAN_PREFERENCES.items():
+        firefox_profile.set_preference(_key, _value)
+    if block_third_party:
+        # ! - 2 = proxy auto-configuration from network.proxy.autoconfig_url
+        firefox_profile.set_preference("network.proxy.type", 2)
+        firefox_profile.set_preference("network.proxy.autoconfig_url",
+                                       "data:text/javascript," + quote(pac_script(allowed_hosts)))
+    return firefox_profile
+
+
+def lean_request_interceptor(allowed_hosts=ALLOWED_HOSTS):
+    """
+    :return: selenium-wire request_interceptor aborting blocked requests
+    """
+    def _interceptor(request):
+        if is_blocked(request.url, allowed_hosts):
+            request.abort()
+    return _interceptor
@@ -0,0 +1,125 @@
+import time
+import random
+import threading
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Page Readiness |}
+#
+# Replaces fixed sleeps in the scrapers with waits on concrete signals, and keeps politeness delays separate.
+#
+# 1) wait_until(condition): polls condition until it returns a truthy value (or the timeout is reached),
+#       e.g., document.readyState is complete, the seatplan <svg> has a stable number of seats,
+#       the expected number of gRPC responses has arrived after a click
+# 2) WaitRecorder: records how long every wait actually took (and whether it timed out), per label
+# 3) PacingPolicy: politeness delay between actions, random between min_delay and max_delay seconds,
+#       0 (no delay) unless configured
+#
+# usage:
+#   wait_until(lambda: driver.execute_script('return document.readyState') == 'complete', timeout=5,
+#              label='document_ready', recorder=WAIT_STATS)
+#   PacingPolicy(0.5, 1.5).pause()
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+
+class ReadinessTimeout(TimeoutError):
+    """raised by wait_until when the condition is not met within the timeout"""
+    pass
+
+
+class WaitRecorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # ! - label -> [count, total seconds, max seconds, timeouts]
+        self.waits = dict()
+
+    def record(self, label, seconds, timed_out=False):
+        with self._lock:
+            _w = self.waits.setdefault(label, [0, 0.0, 0.0, 0])
+            _w[0] += 1
+            _w[1] += seconds
+            _w[2] = max(_w[2], seconds)
+            _w[3] += 1 if timed_out else 0
+
+    def summary(self):
+        """
+        :return: {label: {"count", "mean", "max", "total", "timeouts"}}, seconds
+        """
+        with self._lock:
+            return {_label: {"count": _c, "mean": _t / _c, "max": _m, "total": _t, "timeouts": _to}
+                    for _label, (_c, _t, _m, _to) in self.waits.items()}
+
+    def print_summary(self):
+        for _label, _s in sorted(self.summary().items()):
+            print(f'wait {_label}: {_s["count"]} waits, mean {_s["mean"]:.2f}s, max {_s["max"]:.2f}s, '
+                  f'total {_s["total"]:.1f}s, {_s["timeouts"]} timed out')
+
+
+# ! - shared by every scraper of the process, printed at the end of a run
+WAIT_STATS = WaitRecorder()
+
+
+def wait_until(condition, timeout=10, poll=0.1, label='wait', recorder=WAIT_STATS):
+    """
+    :param condition: function without argument, polled until it returns a truthy value
+    :param timeout: seconds
+    :param poll: seconds between polls
+    :param label: name of the wait in recorder
+    :param recorder: WaitRecorder, None not to record
+    :return: the truthy value returned by condition
+    :raise ReadinessTimeout: if condition is not met within timeout
+    """
+    _t0 = time.perf_counter()
+    _deadline = _t0 + timeout
+    while True:
+        _result = condition()
+        _now = time.perf_counter()
+        if _result:
+            if recorder is not None:
+                recorder.record(label, _now - _t0)
+            return _result
+        if _now >= _deadline:
+            if recorder is not None:
+                recorder.record(label, _now - _t0, timed_out=True)
+            raise ReadinessTimeout(f'{label}: not ready after {timeout} seconds')
+        time.sleep(min(poll, max(_deadline - _now, 0)))
+
+
+def stable_count(counter, stable_for=0.3):
+    """
+    :param counter: function without argument returning a number (e.g., number of <rect> in the seatplan <svg>)
+    :param stable_for: seconds the number must stay the same
+    :return: condition for wait_until, met once counter() > 0 and unchanged for stable_for seconds
+    """
+    _state = {"count": None, "since": None}
+
+    def _condition():
+        _count = counter()
+        _now = time.perf_counter()
+        if not _count or _count != _state["count"]:
+            _state["count"], _state["since"] = _count, _now
+            return False
+        return _count if _now - _state["since"] >= stable_for else False
+    return _condition
+
+
+class PacingPolicy:
+    def __init__(self, min_delay=0.0, max_delay=0.0, recorder=WAIT_STATS):
+        """
+        :param min_delay: seconds
+        :param max_delay: seconds, a delay is drawn uniformly between min_delay and max_delay
+        :param recorder: WaitRecorder, pauses are recorded as "pacing"
+        """
+        self.min_delay = min_delay
+        self.max_delay = max(max_delay, min_delay)
+        self.recorder = recorder
+
+    def pause(self):
+        if self.max_delay <= 0:
+            return 0
+        _delay = random.uniform(self.min_delay, self.max_delay)
+        time.sleep(_delay)
+        if self.recorder is not None:
+            self.recorder.record('pacing', _delay)
+        return _delay
@@ -0,0 +1,104 @@
+import os
+import threading
+import orjson
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Scrape Journal |}
+#
+# A durable checkpoint of a scrape run: every profile is appended to a JSONL file as soon as it is scraped
+# (flushed and fsync-ed), so that a crash, an OOM or a Task Scheduler kill does not lose the shows already scraped.
+#
+# flow:
+#   1) an existing journal is never truncated: it is left by a run that crashed or failed to export,
+#       its entries are read back (replayed, with a warning) and new lines are appended to it
+#   2) append(hkmovie6_code, profile) writes one line: {"hkmovie6_code": ..., "profile": {...}}
+#   3) pending(content) drops the shows already in the journal from {hkmovie6_code: [showtime_code...]},
+#       and profiles() returns the journaled profiles, to be exported with the newly scraped ones
+#       (export_profile_to_db is idempotent: bitmaps are merged, unchanged shows are not written)
+#   4) once the run is exported, close(remove=True) deletes the journal
+#   a line cut short by a crash is skipped when the journal is read, and cut off before new lines are appended
+#
+# usage:
+#   journal = ScrapeJournal(r'data\journal\seatplan-last_n_hour.jsonl')
+#   content = journal.pending(content)
+#   profiles = journal.profiles() + threads_work(content, journal=journal)
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+
+class ScrapeJournal:
+    def __init__(self, path, key='showtime_code', sync=True):
+        """
+        :param path: JSONL file, its directory is created if missing; the entries of an existing journal are kept
+        :param key: key of a profile identifying a completed item
+        :param sync: fsync after every line, so that a line survives a power loss and not only a crash
+        """
+        self.path = path
+        self.key = key
+        self.sync = sync
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.replayed = self._read()
+        if self.replayed:
+            print(f'ScrapeJournal: {path} holds {len(self.replayed)} profiles of an interrupted run, '
+                  f'they are kept and exported with this run')
+        self.completed = {_entry["profile"][key] for _entry in self.replayed}
+        self._file = open(path, 'ab')
+        self._truncate_partial_line()
+        self.appended = 0
+
+    def _read(self):
+        """:return: list of the journal's entries, without a line cut short by a crash"""
+        if not os.path.isfile(self.path):
+            return list()
+        _entries = list()
+        with open(self.path, 'rb') as f:
+            for _line in f:
+                try:
+                    _entries.append(orjson.loads(_line))
+                except orjson.JSONDecodeError:
+                    print(f'ScrapeJournal: skipped a partial line in {self.path}')
+        return _entries
+
+    def _truncate_partial_line(self):
+        """cut a line left without its newline by a crash, so that the next line is not appended to it"""
+        with open(self.path, 'rb') as f:
+            _data = f.read()
+        if _data and not _data.endswith(b'\n'):
+            self._file.truncate(_data.rfind(b'\n') + 1)
+
+    def pending(self, content):
+        """
+        :param content: {hkmovie6_code: [showtime_code...]}
+        :return: content without the showtime_codes already in the journal, movies left without shows are dropped
+        """
+        _pending = {_code: [_s for _s in _shows if _s not in self.completed] for _code, _shows in content.items()}
+        _pending = {_code: _shows for _code, _shows in _pending.items() if _shows}
+        print(f'ScrapeJournal: {len(self.completed)} shows already scraped, '
+              f'{sum(len(_shows) for _shows in _pending.values())} pending')
+        return _pending
+
+    def profiles(self):
+        """:return: list of the journaled profiles of the previous run"""
+        return [_entry["profile"] for _entry in self.replayed]
+
+    def append(self, hkmovie6_code, profile):
+        _line = orjson.dumps({"hkmovie6_code": hkmovie6_code, "profile": profile}) + b'\n'
+        with self._lock:
+            self._file.write(_line)
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+            self.completed.add(profile[self.key])
+            self.appended += 1
+
+    def close(self, remove=False):
+        """
+        :param remove: delete the journal, once its profiles are safely exported
+        """
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+        if remove and os.path.isfile(self.path):
+            os.remove(self.path)
@@ -0,0 +1,117 @@
+import os
+import concurrent.futures
+from collections import namedtuple
+from hkmovie.SeatplanToolkit import LayoutCache, SeatplanLayout, SeatplanProcessor
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Seatplan Batch Processor |}
+#
+# This module processes many seat plans across a pool of processes.
+# It takes an iterable of (showtime_code, svg) pairs, sends them to worker processes in chunks,
+# and returns one compact SeatplanResult per show, i.e., no lxml object is pickled back to the main process.
+#
+# Each worker keeps its own in-memory LayoutCache, seeded with the layouts known to the caller,
+# so only the first show of an unknown layout is parsed in each worker.
+# Layouts built by workers are returned along with the results and added to the caller's LayoutCache.
+# Known layouts are sent to workers without their clean svg, which workers never export.
+#
+# Note: with the "spawn" start method (Windows), worker processes re-import the caller's main module,
+#       which must be guarded by if __name__ == "__main__"
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+
+class SeatplanResult(namedtuple('SeatplanResult', ['showtime_code', 'fingerprint', 'capacity', 'occupied', 'parsed'])):
+    """
+    showtime_code: str
+    fingerprint: layout fingerprint of the seat plan, see LayoutCache.layouts for its clean svg
+    capacity: number of seats in the house
+    occupied: tuple of (seat number, x-coordinate, y-coordinate) of taken seats
+    parsed: True if the seat plan was parsed, False if it was read from a cached layout
+    """
+    __slots__ = ()
+
+    def get_occupied_seats(self):
+        for _seat_number, _x, _y in self.occupied:
+            yield {"seat_number": _seat_number, "x": _x, "y": _y}
+
+    def count_occupied_seats(self):
+        return len(self.occupied)
+
+    def get_house_capacity(self):
+        return self.capacity
+
+
+# ! - LayoutCache of a worker process, created by _init_worker
+_worker_cache = None
+
+
+def _init_worker(layout_records):
+    global _worker_cache
+    _worker_cache = LayoutCache()
+    for _record in layout_records:
+        _worker_cache.put(SeatplanLayout.from_record(_record))
+
+
+def process_chunk(chunk, layout_cache=None):
+    """
+    :param chunk: list of (showtime_code, svg)
+    :param layout_cache: LayoutCache, the LayoutCache of the worker process is used if None
+    :return: a tuple of (list of SeatplanResult, list of (record, clean svg) of layouts built in this chunk)
+    """
+    _cache = layout_cache if layout_cache is not None else _worker_cache
+    _results, _new_layouts = list(), list()
+    for _showtime_code, _svg in chunk:
+        _sp = _cache.process(_svg)
+        _seats = _sp.seats
+        _occupied = tuple((_seats.seat_number(_i), _seats.x[_i], _seats.y[_i]) for _i in _seats.taken_indices())
+        _parsed = isinstance(_sp, SeatplanProcessor)
+        if _parsed:
+            _layout = _cache.get(_sp.fingerprint)
+            _new_layouts.append((_layout.to_record(), _layout.clean_svg))
+        _results.append(SeatplanResult(_showtime_code, _sp.fingerprint, len(_seats), _occupied, _parsed))
+    return _results, _new_layouts
+
+
+def process_seatplans(pairs, layout_cache=None, max_workers=None, chunksize=25, min_parallel=200):
+    """
+    flow:
+        1) split (showtime_code, svg) pairs into chunks
+            a) pairs should be sorted by house, so that shows of a house are processed by the same worker
+        2) if there are fewer than min_parallel pairs, or max_workers == 1, process in the current process
+            (starting worker processes costs more than reading a few hundred seat plans of known layouts)
+        3) otherwise, process chunks across a ProcessPoolExecutor
+        4) add layouts built by workers to layout_cache
+    :param pairs: iterable of (showtime_code, svg)
+    :param layout_cache: LayoutCache of the caller, layouts found in the seat plans are added to it
+    :param max_workers: number of worker processes, defaults to os.cpu_count()
+    :param chunksize: number of seat plans sent to a worker at a time
+    :param min_parallel: minimum number of pairs to use worker processes
+    :return: dict of {showtime_code: SeatplanResult}
+    """
+    if layout_cache is None:
+        layout_cache = LayoutCache()
+    _pairs = list(pairs)
+    _chunks = [_pairs[_i:_i + chunksize] for _i in range(0, len(_pairs), chunksize)]
+    _results = dict()
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(_chunks))
+
+    if max_workers <= 1 or len(_pairs) < min_parallel:
+        for _result in process_chunk(_pairs, layout_cache)[0]:
+            _results[_result.showtime_code] = _result
+        return _results
+
+    _known_layouts = [_layout.to_record() for _layout in layout_cache.layouts.values()]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                                initargs=(_known_layouts,)) as executor:
+        for _chunk_results, _new_layouts in executor.map(process_chunk, _chunks):
+            for _record, _clean_svg in _new_layouts:
+                if _record[0] not in layout_cache.layouts:
+                    layout_cache.put(SeatplanLayout.from_record(_record, _clean_svg))
+            for _result in _chunk_results:
+                _results[_result.showtime_code] = _result
+    return _results
@@ -9,8 +9,14 @@ import os
 import time
 import re
 from tenacity import retry, retry_if_exception_type, stop_after_attempt, RetryError, wait_random
+from hkmovie.PageReadiness import wait_until, stable_count, PacingPolicy, ReadinessTimeout
+from hkmovie.LeanProfile import apply_lean_profile
+from hkmovie.SiteConfig import BASE_URL
+from hkmovie.Instrumentation import METRICS
 
-from random import randint
+# ! - number of seats (<rect>) in the seatplan <svg>, 0 if the seatplan is not rendered yet
+COUNT_SEATS_SCRIPT = "var svg = document.querySelector('div.seatplanWrapper > svg'); " \
+                     "return svg ? svg.getElementsByTagName('rect').length : 0;"
 
 
 class Terminator(Exception):
@@ -19,15 +25,26 @@ class Terminator(Exception):
 
 
 class SeatplanScraper:
-    def __init__(self, headless=True):
+    def __init__(self, headless=True, pacing=None, ready_timeout=5, lean=False):
+        """
+        :param headless:
+        :param pacing: PacingPolicy, politeness delay after each page, no delay if None
+        :param ready_timeout: seconds to wait for the seatplan to be rendered before reading it anyway
+        :param lean: block images, media, fonts and third-party domains (see hkmovie/LeanProfile.py)
+        """
+        self.lean = lean
         self._setup(headless)
         self.refreshed = False
+        self.pacing = pacing or PacingPolicy()
+        self.ready_timeout = ready_timeout
 
     def _setup(self, headless):
         _firefox_options = webdriver.FirefoxOptions()
         _firefox_profile = FirefoxProfile()
         _ua = UserAgent()
         _firefox_profile.set_preference("general.useragent.override", _ua.random)
+        if self.lean:
+            apply_lean_profile(_firefox_profile)
         if headless:
             _firefox_options.add_argument('--headless')
 
@@ -48,7 +65,9 @@ class SeatplanScraper:
             retry_if_exception_type(AttributeError) |
             retry_if_exception_type(WebDriverException)
         ),
-           stop=stop_after_attempt(3), wait=wait_random(min=2, max=5))
+           stop=stop_after_attempt(3), wait=wait_random(min=2, max=5),
+           before_sleep=METRICS.retry_hook('page_source_regex'))
+    @METRICS.timed('page_source_regex')
     def _get_show_details_from_page_source(self, _pattern):
         _page_src = self.driver.page_source
         _result = re.search(_pattern, _page_src)
@@ -65,7 +84,9 @@ class SeatplanScraper:
             retry_if_exception_type(AttributeError) |
             retry_if_exception_type(WebDriverException)
         ),
-           stop=stop_after_attempt(5), wait=wait_random(min=2, max=5))
+           stop=stop_after_attempt(5), wait=wait_random(min=2, max=5),
+           before_sleep=METRICS.retry_hook('selector_wait'))
+    @METRICS.timed('selector_wait')
     def _get_show_details_from_html(self, _selector, _attribute):
         """
         Some seatplan pages may no longer be available for various reasons
@@ -122,7 +143,7 @@ class SeatplanScraper:
         try:
             _profile = dict()
             _profile["showtime_code"] = showtime_code
-            _url = f"https://hkmovie6.com/movie/{hkmovie6_code}/SHOWTIME/{showtime_code}"
+            _url = f"{BASE_URL}/movie/{hkmovie6_code}/SHOWTIME/{showtime_code}"
             t1 = time.time()
             try:
                 self._load_url(_url)
@@ -132,14 +153,16 @@ class SeatplanScraper:
                 raise Terminator(f'SeatplanScraper.scrape({self.driver.session_id}): failed to load {_url} after 3 retries')
 
             if not self.refreshed:
-                time.sleep(1)
+                self._wait_ready(self._is_document_complete, 'document_ready')
                 try:
                     self._refresh()
                 except RetryError:
                     raise Terminator(f'SeatplanScraper.scrape({self.driver.session_id}): failed to refresh after 3 retries')
                 self.refreshed = True
 
-            time.sleep(randint(2, 3))
+            # ! - the seatplan is ready once its number of seats stops changing
+            self._wait_ready(stable_count(self._count_seats), 'seatplan_stable')
+            self.pacing.pause()
 
             t2 = time.time()
 
@@ -207,6 +230,13 @@ class SeatplanScraper:
                 _profile["start_time"] = int(_start_time)
             except:
                 _profile["start_time"] = None
+            t4 = time.time()
+
+            # ! - page_ready: load to a stable seatplan, seatplan_read: reading the <svg>, details: house, price, time
+            METRICS.observe('page_ready', t2 - t1)
+            METRICS.observe('seatplan_read', t3 - t2)
+            METRICS.observe('details', t4 - t3)
+            METRICS.observe('scrape', t4 - t1)
 
             print(f'^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^|\n'
                   f'driver: {self.driver.session_id}\n'
@@ -222,15 +252,40 @@ class SeatplanScraper:
             # print('...')
             return _profile
         except Terminator as terminator:
+            METRICS.increment('terminators_total', scraper='seatplan')
             print(f'SeatplanScraper.scrape(session_id={self.driver.session_id}) Terminator raised: \n{repr(terminator)}')
             raise Terminator(f'Terminator re-raised: {str(terminator)}')
 
+    def _wait_ready(self, condition, label):
+        """
+        wait for condition (see PageReadiness.wait_until), a timeout is recorded and ignored,
+        as the page is then read with the retries of _get_show_details_from_html
+        """
+        try:
+            return wait_until(condition, timeout=self.ready_timeout, label=label)
+        except ReadinessTimeout:
+            return None
+
+    def _is_document_complete(self):
+        try:
+            return self.driver.execute_script('return document.readyState') == 'complete'
+        except WebDriverException:
+            return False
+
+    def _count_seats(self):
+        try:
+            return self.driver.execute_script(COUNT_SEATS_SCRIPT)
+        except WebDriverException:
+            return 0
+
     @retry(retry=(
             retry_if_exception_type(TimeoutException) |
             retry_if_exception_type(AttributeError) |
             retry_if_exception_type(WebDriverException)
         ),
-           stop=stop_after_attempt(5), wait=wait_random(min=5, max=20))
+           stop=stop_after_attempt(5), wait=wait_random(min=5, max=20),
+           before_sleep=METRICS.retry_hook('load'))
+    @METRICS.timed('load')
     def _load_url(self, url):
         self.driver.get(url)
         # if randint(0, 5) == 0:
@@ -242,7 +297,9 @@ class SeatplanScraper:
             retry_if_exception_type(AttributeError) |
             retry_if_exception_type(WebDriverException)
         ),
-           stop=stop_after_attempt(3), wait=wait_random(min=5, max=10))
+           stop=stop_after_attempt(3), wait=wait_random(min=5, max=10),
+           before_sleep=METRICS.retry_hook('refresh'))
+    @METRICS.timed('refresh')
     def _refresh(self):
         self.driver.refresh()
 
@@ -269,7 +326,8 @@ class SeatplanScraper:
         print(f'tear_down() driver: {self.driver.session_id}')
         try:
             # self.driver.close()
-            self.driver.quit()
+            with METRICS.span('teardown'):
+                self.driver.quit()
             print(f'Tore down driver: {self.driver.session_id}')
         except WebDriverException as err:
             print(f'tear_down({self.driver.session_id}) error: {repr(err)}')
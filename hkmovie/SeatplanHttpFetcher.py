@@ -0,0 +1,188 @@
+import os
+import re
+import html
+import asyncio
+import requests
+from lxml import etree
+from requests.adapters import HTTPAdapter
+from fake_useragent import UserAgent
+from hkmovie.SiteConfig import BASE_URL
+from hkmovie.Instrumentation import METRICS
+
+try:
+    import aiohttp
+except ImportError:
+    # ! - fetch_async() is unavailable (async_capable is False), the asyncio orchestrator runs fetch() on threads
+    aiohttp = None
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Seatplan HTTP Fetcher |}
+#
+# Fetches a showtime page with a plain HTTP request (pooled keep-alive connections, no browser),
+# and decodes the same profile as SeatplanScraper.scrape() from the server-rendered html:
+#   seatplan: <svg> under div.seatplanWrapper
+#   house: div.showDetail > div.name > div (as SeatplanScraper), or show state ({response:{show:{house:"...",...)
+#   seatplan is kept as the server serializes it, layout_fingerprint() gives it the same fingerprint as outerHTML
+#   start_time, price: show state
+#
+# fetch() is blocking (requests); fetch_async() is a coroutine over an aiohttp session, for AsyncOrchestrator.http(),
+# so that pages are awaited on the event loop instead of occupying a thread each.
+#
+# If the page cannot be decoded (e.g., the seat plan is only rendered by javascript, or its svg is not well-formed xml
+# that SeatplanProcessor could parse), SeatplanDecodeError is raised and the caller falls back to SeatplanScraper.
+# Only verified on pages of benchmarks/seatplan_generator so far, scrape_seatplan.py uses it with --fetch-mode http.
+#
+# assumptions:
+#   1) page url is {base_url}/movie/{hkmovie6_code}/SHOWTIME/{showtime_code}
+#   2) base_url can point to a local stand-in server (see benchmarks/standin_server.py) to run offline
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+SHOW_STATE_PATTERN = re.compile(
+    r'{response:{show:{house:"((?:[^"\\]|\\.)*)",starttime:(\d+)?,price:(\d{2,3})?,')
+HOUSE_HTML_PATTERN = re.compile(r'class="name f row wrap"[^>]*>\s*<div[^>]*>(.*?)</div>', re.S)
+SVG_PATTERN = re.compile(r'<svg\b.*?</svg>', re.S)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+
+class SeatplanDecodeError(Exception):
+    """raised when a page does not contain a seat plan or show details that can be decoded without a browser"""
+    pass
+
+
+class SeatplanHttpFetcher:
+    def __init__(self, base_url=None, pool_size=10, timeout=10, record_dir=None):
+        """
+        :param base_url: defaults to BASE_URL (environment variable HKMOVIE6_BASE_URL or https://hkmovie6.com)
+        :param pool_size: number of keep-alive connections, should be >= number of threads
+        :param timeout: seconds, per request
+        :param record_dir: if given, every fetched page is saved as {record_dir}/{hkmovie6_code}/{showtime_code}.html,
+                            so that it can be replayed by a stand-in server
+        """
+        self.base_url = (base_url or BASE_URL).rstrip('/')
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.record_dir = record_dir
+        self.headers = {'User-Agent': UserAgent().random, 'Accept': 'text/html'}
+        self.session = requests.Session()
+        _adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', _adapter)
+        self.session.mount('https://', _adapter)
+        self.session.headers.update(self.headers)
+        # ! - aiohttp.ClientSession of fetch_async(), created on first use inside the running loop
+        self.async_session = None
+        self.async_capable = aiohttp is not None
+        self.decoded = 0
+        self.failed = 0
+
+    def url(self, hkmovie6_code, showtime_code):
+        return f"{self.base_url}/movie/{hkmovie6_code}/SHOWTIME/{showtime_code}"
+
+    def fetch(self, hkmovie6_code, showtime_code):
+        """
+        :return: a dictionary containing show info, same keys as SeatplanScraper.scrape()
+        :raise SeatplanDecodeError: if the page cannot be fetched or decoded
+        """
+        _url = self.url(hkmovie6_code, showtime_code)
+        try:
+            with METRICS.span('http_fetch'):
+                _response = self.session.get(_url, timeout=self.timeout)
+                _response.raise_for_status()
+        except requests.RequestException as err:
+            self.failed += 1
+            raise SeatplanDecodeError(f'SeatplanHttpFetcher.fetch(): {_url}: {repr(err)}')
+        return self._decode_fetched(hkmovie6_code, showtime_code, _response.text)
+
+    async def fetch_async(self, hkmovie6_code, showtime_code):
+        """
+        fetch() as a coroutine, over pooled aiohttp connections (pool_size), close them with close_async()
+        :return: a dictionary containing show info, same keys as SeatplanScraper.scrape()
+        :raise SeatplanDecodeError: if the page cannot be fetched or decoded
+        """
+        _url = self.url(hkmovie6_code, showtime_code)
+        if self.async_session is None:
+            self.async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size), headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        try:
+            with METRICS.span('http_fetch'):
+                async with self.async_session.get(_url) as _response:
+                    _response.raise_for_status()
+                    _page = await _response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            self.failed += 1
+            raise SeatplanDecodeError(f'SeatplanHttpFetcher.fetch_async(): {_url}: {repr(err)}')
+        return self._decode_fetched(hkmovie6_code, showtime_code, _page)
+
+    def _decode_fetched(self, hkmovie6_code, showtime_code, page):
+        """record (with record_dir) and decode a fetched page, counting it as decoded or failed"""
+        if self.record_dir:
+            self.record(hkmovie6_code, showtime_code, page)
+        try:
+            with METRICS.span('http_decode'):
+                _profile = self.decode_page(page, showtime_code)
+        except SeatplanDecodeError:
+            self.failed += 1
+            raise
+        self.decoded += 1
+        return _profile
+
+    def record(self, hkmovie6_code, showtime_code, page):
+        _dir = os.path.join(self.record_dir, hkmovie6_code)
+        os.makedirs(_dir, exist_ok=True)
+        with open(os.path.join(_dir, f'{showtime_code}.html'), 'w', encoding='utf-8') as f:
+            f.write(page)
+
+    @staticmethod
+    def decode_page(page, showtime_code):
+        """
+        :param page: html of the showtime page
+        :param showtime_code:
+        :return: profile dictionary, see SeatplanScraper.scrape()
+        """
+        _wrapper = page.find('seatplanWrapper')
+        _svg = SVG_PATTERN.search(page, _wrapper) if _wrapper != -1 else None
+        if _svg is None or '<rect' not in _svg.group(0):
+            raise SeatplanDecodeError(f'{showtime_code}: seat plan is not in the page')
+        _seatplan = _svg.group(0)
+        # ! - add namespace to <svg> tag, as SeatplanScraper does
+        if 'xmlns:xlink' not in _seatplan[:_seatplan.find('>')]:
+            _pos = _seatplan.find('>')
+            _seatplan = _seatplan[:_pos] + ' xmlns:xlink="http://www.w3.org/1999/xlink" ' + _seatplan[_pos:]
+        # ! - the seat plan must parse as SeatplanProcessor parses it, otherwise the show is left to the browser
+        # ! - instead of failing the export (e.g., html entities or unclosed tags of the server's serialization)
+        try:
+            _root = etree.fromstring(_seatplan)
+        except etree.XMLSyntaxError as err:
+            raise SeatplanDecodeError(f'{showtime_code}: seat plan is not well-formed: {repr(err)}')
+        if next(_root.iter('{*}rect', 'rect'), None) is None:
+            raise SeatplanDecodeError(f'{showtime_code}: seat plan has no seat')
+
+        # ! - the house is read from the same element as SeatplanScraper (its .text collapses whitespace),
+        # ! - so that both scrapers give the same Houses.name; the Nuxt state is a fallback
+        _state = SHOW_STATE_PATTERN.search(page)
+        _house = None
+        _house_html = HOUSE_HTML_PATTERN.search(page)
+        if _house_html is not None:
+            _house = ' '.join(html.unescape(TAG_PATTERN.sub('', _house_html.group(1))).split())
+        if not _house and _state is not None:
+            _house = _state.group(1).encode('latin-1', 'backslashreplace').decode('unicode_escape')
+        if not _house:
+            raise SeatplanDecodeError(f'{showtime_code}: house is not in the page')
+
+        return {
+            "showtime_code": showtime_code,
+            "seatplan": _seatplan,
+            "house": _house,
+            "price": int(_state.group(3)) if _state is not None and _state.group(3) else None,
+            "start_time": int(_state.group(2)) if _state is not None and _state.group(2) else None
+        }
+
+    async def close_async(self):
+        if self.async_session is not None:
+            await self.async_session.close()
+            self.async_session = None
+
+    def close(self):
+        self.session.close()
@@ -1,90 +1,441 @@
 import os
+import sys
 import time
+import html
+import hashlib
+import orjson
+from array import array
 from lxml import etree
 import re
-from itertools import zip_longest
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from itertools import compress
 
 # =====================================================================================================================|
 # =====================================================================================================================|
 # {| Seatplan Processor |}
 #
 # This Class is used to read seat plan SVG scraped by SeatplanScraper.
-# It parses and transforms all seats in a seat plan to a list of dictionaries,
-# which contains data as follows:
-# {row_number: n, [{'x': x-coordinate, 'y': y-coordinate, 'col': column_number, 'availability', is_seat_taken}...]}
+# The SVG is streamed through a pull parser one row (<g> tag) at a time, no full document tree is kept.
+# It parses and stores all seats in a seat plan in a column-oriented SeatTable,
+# which contains data as follows (one entry per seat, in document order):
+# x-coordinate (int16), y-coordinate (int16), availability (uint8), column number (int16, -1 if missing), row label
 #
 # This Class also contains functions that cleanse an occupied seat plan to an "unoccupied" seat plan,
 # and counts the number of seats in a seat plan.
 #
 # Not all seats are labelled with a column number (e.g., seats for disabled),
-# there used to be functions that patch the labels,
-# which were later proved to be unreliable.
-# Hence, x-coordinate and y-coordinate are used to identify a seat.
+# the column number of such a seat is inferred once per house layout (SeatTable.patch_missing_columns),
+# from the labelled seats of its own row, or from the seat at the same position in the nearest row (SeatSpatialIndex).
+# As the inferred column number is not guaranteed, x-coordinate and y-coordinate are still used to identify a seat.
+#
+# Every show in a house shares the same geometry, only the fill colors differ.
+# LayoutCache keeps a SeatplanLayout per layout fingerprint (sha1 of the geometry of the seats, without colors),
+# so that a seat plan of a known layout is read by scanning its fill colors in document order, without parsing;
+# the fingerprint and the fill colors are taken in the same single regex pass (scan_layout).
 #
 # =====================================================================================================================|
 # =====================================================================================================================|
 
+# ! - the first fill color in a style attribute decides the availability of a seat
+FILL_RGB = r'fill: ?rgb\((\d{0,3}), ?(\d{0,3}), ?(\d{0,3})\)'
+FILL_PATTERN = re.compile(FILL_RGB)
+STYLE_FILL_PATTERN = re.compile(r'\sstyle="[^"]*?' + FILL_RGB)
+TAKEN_RGB = ('255', '0', '0')
+ROTATE_PATTERN = re.compile(r'rotate\((-?[\d.]+)')
+# ! - every element with a fill color in its style: tag, attributes around the style, fill color, text that follows;
+# ! - the same elements, in the same order, as STYLE_FILL_PATTERN
+LAYOUT_SCAN_PATTERN = re.compile(r'<([\w:-]+)([^<>]*?)\sstyle="[^"]*?' + FILL_RGB + r'[^"]*"([^<>]*?)/?>([^<]*)')
+
+
+def scan_layout(svg_string):
+    """
+    one regex pass over a seatplan svg, for LayoutCache:
+        the layout fingerprint, sha1 of the geometry of every element with a fill color (tag, attributes other than
+        style, and its text, e.g., a column number), so that colors do not change the fingerprint;
+        the page source and the browser's outerHTML of a seat plan (self-closing tags, style spacing, whitespace,
+        character references) give the same fingerprint
+        the fill colors of those elements in document order, i.e., the fill slots read by SeatplanLayout.read_snapshot
+    :param svg_string: seatplan svg (str)
+    :return: tuple of (fingerprint, list of (r, g, b) strings)
+    """
+    _matches = LAYOUT_SCAN_PATTERN.findall(svg_string)
+    _geometry = '\x1f'.join(f'{_tag}{_before}{_after}\x1e{_text.strip()}'
+                             for _tag, _before, _r, _g, _b, _after, _text in _matches)
+    if '&' in _geometry:
+        _geometry = html.unescape(_geometry)
+    return hashlib.sha1(_geometry.encode('utf-8')).hexdigest(), [_m[2:5] for _m in _matches]
+
+
+def layout_fingerprint(svg_string):
+    """
+    :param svg_string: seatplan svg, str or bytes
+    :return: sha1 hex digest of the geometry of the svg, see scan_layout()
+    """
+    if isinstance(svg_string, bytes):
+        svg_string = svg_string.decode('utf-8')
+    return scan_layout(svg_string)[0]
+
+
+class SeatTable:
+    """
+    column-oriented storage of the seats in a seat plan;
+    coordinates are rounded to integers once when a seat is added,
+    availability is kept in a bytearray so that filtering and counting are done by C-level bytes operations
+    """
+    __slots__ = ('x', 'y', 'availability', 'col', 'row_index', 'row_labels', 'fill_slot', 'rotation')
+
+    FREE = 1
+    TAKEN = 2
+    NO_COLUMN = -1
+    # ! - translation table that maps availability codes to a 0/1 mask of taken seats
+    _TAKEN_MASK = bytes(1 if _code == 2 else 0 for _code in range(256))
+
+    def __init__(self):
+        self.x = array('h')
+        self.y = array('h')
+        self.availability = bytearray()
+        self.col = array('h')
+        self.row_index = array('H')
+        self.row_labels = list()
+        # ! - index of the style (among styles with a fill color, in document order) that decides availability
+        # ! - 'i' (4 bytes on every platform), 'l' is 4 bytes on Windows but 8 bytes on Linux
+        self.fill_slot = array('i')
+        # ! - degree of the transform="rotate(...)" of the seat's <a> tag, 0 if not rotated
+        self.rotation = array('h')
+
+    def __len__(self):
+        return len(self.availability)
+
+    def add_row(self, label):
+        """
+        :param label: row number as shown on the seat plan, e.g., "A"
+        :return: index of the row in self.row_labels
+        """
+        self.row_labels.append(sys.intern(label))
+        return len(self.row_labels) - 1
+
+    def append(self, x, y, availability, col, row_index, fill_slot=-1, rotation=0):
+        self.x.append(int(round(float(x))))
+        self.y.append(int(round(float(y))))
+        self.availability.append(availability)
+        self.col.append(self.NO_COLUMN if col is None else col)
+        self.row_index.append(row_index)
+        self.fill_slot.append(fill_slot)
+        self.rotation.append(rotation)
+
+    def truncate(self, size, rows):
+        """
+        drop seats and rows added after the table had `size` seats and `rows` rows
+        """
+        del self.x[size:], self.y[size:], self.availability[size:], self.col[size:], self.row_index[size:]
+        del self.fill_slot[size:], self.rotation[size:], self.row_labels[rows:]
+
+    def with_availability(self, availability):
+        """
+        :param availability: bytearray, one availability code per seat
+        :return: a SeatTable sharing the geometry of this table
+        """
+        _table = SeatTable.__new__(SeatTable)
+        _table.x, _table.y, _table.col, _table.row_index = self.x, self.y, self.col, self.row_index
+        _table.row_labels, _table.fill_slot, _table.rotation = self.row_labels, self.fill_slot, self.rotation
+        _table.availability = availability
+        return _table
+
+    def taken_mask(self):
+        return self.availability.translate(self._TAKEN_MASK)
+
+    def taken_indices(self):
+        return compress(range(len(self)), self.taken_mask())
+
+    def count_taken(self):
+        return self.availability.count(self.TAKEN)
+
+    def seat_number(self, index):
+        """
+        :return: seat number, e.g., "B7", or None if the seat is not labelled with a column number
+        """
+        _col = self.col[index]
+        if _col == self.NO_COLUMN:
+            return None
+        return self.row_labels[self.row_index[index]] + str(_col)
+
+    def occupied_seats(self):
+        """
+        :return: generator of dictionaries, keys: seat number, x-coordinate, y-coordinate
+        """
+        for _i in self.taken_indices():
+            yield {"seat_number": self.seat_number(_i), "x": self.x[_i], "y": self.y[_i]}
+
+    def column_pitch(self):
+        """
+        :return: the most common x distance between two labelled seats next to each other in a row
+                    whose column numbers differ by 1, negative if column numbers decrease from left to right;
+                    None if there is no such pair
+        """
+        _pitches = Counter(
+            (self.x[_i + 1] - self.x[_i]) * (self.col[_i + 1] - self.col[_i])
+            for _i in range(len(self) - 1)
+            if self.row_index[_i] == self.row_index[_i + 1] and self.col[_i] != self.NO_COLUMN
+            and self.col[_i + 1] != self.NO_COLUMN and abs(self.col[_i + 1] - self.col[_i]) == 1
+            and self.x[_i + 1] != self.x[_i])
+        return _pitches.most_common(1)[0][0] if _pitches else None
+
+    def patch_missing_columns(self):
+        """
+        infer the column number of seats that are not labelled (e.g., seats for disabled), in place
+        flow, for each unlabelled seat:
+            1) take the nearest labelled seat of the same row and rotation,
+                if the x distance between them is a whole number of column pitches (see column_pitch),
+                column number = column number of that seat +/- number of pitches
+            2) otherwise, take the column number of the labelled seat at the same position (rotation, x)
+                in the nearest row, looked up in SeatSpatialIndex
+            3) a column number that is already used in the row is never assigned
+        :return: number of seats patched
+        """
+        if self.NO_COLUMN not in self.col:
+            return 0
+        _pitch = self.column_pitch()
+        _spatial_index = SeatSpatialIndex(self)
+        _row_seats = dict()
+        for _i, _col in enumerate(self.col):
+            if _col != self.NO_COLUMN:
+                _row_seats.setdefault(self.row_index[_i], list()).append(_i)
+        _row_cols = {_row: {self.col[_i] for _i in _seats} for _row, _seats in _row_seats.items()}
+
+        _patched = 0
+        for _i in [_i for _i, _col in enumerate(self.col) if _col == self.NO_COLUMN]:
+            _row, _x, _rotation = self.row_index[_i], self.x[_i], self.rotation[_i]
+            _used = _row_cols.setdefault(_row, set())
+            _col = None
+            # (1) - nearest labelled seat of the same row
+            _refs = [_j for _j in _row_seats.get(_row, ()) if self.rotation[_j] == _rotation]
+            if _pitch and _refs:
+                _ref = min(_refs, key=lambda _j: abs(self.x[_j] - _x))
+                _steps = (_x - self.x[_ref]) / _pitch
+                if abs(_steps - round(_steps)) <= 0.2:
+                    _col = self.col[_ref] + int(round(_steps))
+            # (2) - same position in the nearest row
+            if _col is None or _col <= 0 or _col in _used:
+                _col = _spatial_index.nearest_column(_rotation, _x, _row)
+            # (3)
+            if _col is None or _col <= 0 or _col in _used:
+                continue
+            self.col[_i] = _col
+            _used.add(_col)
+            _patched += 1
+        return _patched
+
+
+class SeatSpatialIndex:
+    """
+    labelled seats of a house keyed on (rotation, x),
+    each key holds the row indices (ascending, i.e., document order) and column numbers of the seats at that position,
+    so that the seat at the same position in the nearest row is found by bisect instead of scanning every row
+    """
+    __slots__ = ('buckets',)
+
+    # ! - x-coordinates are rounded to integers, seats within 1px are considered at the same position
+    X_TOLERANCE = 1
+
+    def __init__(self, seats):
+        """:param seats: SeatTable"""
+        self.buckets = dict()
+        for _i, _col in enumerate(seats.col):
+            if _col == SeatTable.NO_COLUMN:
+                continue
+            _rows, _cols = self.buckets.setdefault((seats.rotation[_i], seats.x[_i]), (array('H'), array('h')))
+            _rows.append(seats.row_index[_i])
+            _cols.append(_col)
+
+    def nearest_column(self, rotation, x, row_index):
+        """
+        :return: column number of the labelled seat at (rotation, x) in the row nearest to row_index (excluding
+                    row_index itself), None if there is none
+        """
+        _best, _best_distance = None, None
+        for _x in range(x - self.X_TOLERANCE, x + self.X_TOLERANCE + 1):
+            _bucket = self.buckets.get((rotation, _x))
+            if _bucket is None:
+                continue
+            _rows, _cols = _bucket
+            for _j in (bisect_left(_rows, row_index) - 1, bisect_right(_rows, row_index)):
+                if 0 <= _j < len(_rows):
+                    _distance = abs(_rows[_j] - row_index)
+                    if _best_distance is None or _distance < _best_distance:
+                        _best, _best_distance = _cols[_j], _distance
+        return _best
+
 
 class SeatplanProcessor:
-    def __init__(self, svg_string):
-        self.tree = etree.fromstring(svg_string)
-        self.rows = list()
+    # ! - number of characters fed to the pull parser at a time
+    FEED_SIZE = 64 * 1024
+    TAKEN_COLOR = 'rgb(255, 0, 0)'
+    CLEAN_RECT_COLOR = 'rgb(0, 255, 0)'
+    CLEAN_TEXT_COLOR = 'rgb(0, 0, 0)'
+
+    def __init__(self, svg_string, record_fill_slots=False):
+        self.seats = SeatTable()
+        # ! - fill slots are only needed to build a SeatplanLayout
+        self.record_fill_slots = record_fill_slots
+        self.fill_slot_count = 0
+        # ! - layout fingerprint, set by LayoutCache
+        self.fingerprint = None
+        self._fill_slots = dict()
+        self._rows = None
         self.isSeatOrderAscending = None
         self.house_capacity = 0
-        self.svg = svg_string
+        # ! - serialized top-level children of <svg>, kept so that export_clean_svg() does not need the tree
+        self._svg_fragments = list()
+        self._svg_shell = None
 
-        self.parse_row_elements()
+        self.parse_row_elements(svg_string)
+
+    @property
+    def rows(self):
+        """
+        legacy structure of the seat plan, built on first access from self.seats:
+        [[{'row': n}, [{'x': x, 'y': y, 'col': column_number, 'availability': is_seat_taken}...]]...]
+        """
+        if self._rows is None:
+            _seats = self.seats
+            self._rows = [[{'row': _label}, list()] for _label in _seats.row_labels]
+            for _i in range(len(_seats)):
+                _col = _seats.col[_i]
+                self._rows[_seats.row_index[_i]][1].append({
+                    'x': _seats.x[_i], 'y': _seats.y[_i],
+                    'col': None if _col == SeatTable.NO_COLUMN else _col,
+                    'availability': _seats.availability[_i]
+                })
+        return self._rows
 
     def get_occupied_seats(self):
         """
-        yield seats in self.rows where availability = 2;
+        yield seats in self.seats where availability = 2;
         data produced by this function will be INSERTED INTO SalesHistory and Seats tables
         :return: generator of dictionaries, keys: seat number, x-coordinate, y-coordinate
         """
-        for row in self.rows:
-            row_number = row[0]['row']
-            for seat in row[1]:
-                if seat['availability'] == 2:
-                    seat_number = row_number + str(seat['col']) if seat.get('col') is not None else None
-                    x = int(round(float(seat['x'])))
-                    y = int(round(float(seat['y'])))
-                    yield {"seat_number": seat_number, "x": x, "y": y}
+        return self.seats.occupied_seats()
+
+    def count_occupied_seats(self):
+        return self.seats.count_taken()
 
     def get_house_capacity(self):
-        _cap = sum(len(_row[1]) for _row in self.rows)
-        return _cap
+        return len(self.seats)
 
-    def walk_tree(self):
+    def walk_tree(self, svg_string):
         # ! - not in use
-        for _event, _element in etree.iterwalk(self.tree, events=('start', 'end')):
+        for _event, _element in etree.iterwalk(etree.fromstring(svg_string), events=('start', 'end')):
             if _event == 'start':
                 print(f'{str(_element.text).strip() if _element.text else ""}\telement.tag: {_element.tag}\telement.attrib : {_element.attrib}')
 
     def export_clean_svg(self):
         """
-        substitute red rectangles with green rectangles;
+        red rectangles have already been substituted with green rectangles (see clean_element) during parsing;
         product of this function will be INSERTED INTO Houses (svg)
         :return:
         """
-        # < rect. *?\(255, 0, 0\). *?stroke: ?rgb\(255, 0, 0\). *? / >
-        _svg = etree.tostring(self.tree, encoding='unicode', pretty_print=False)
-        _svg = re.sub(
-            r'(<rect.*?\()255, 0, 0(\).*?stroke: ?rgb\()255, 0, 0(\).*?/>|\).+></rect>)',
-            r"\g<1>0, 255, 0\g<2>0, 255, 0\g<3>", _svg)
-        _svg = re.sub(
-            r'(<text.*?; ??fill ??: ??rgb\()255, 0, 0(\).*?\">)',
-            r"\g<1>0, 0, 0\g<2>", _svg)
-        return _svg
+        _head, _tail = self._svg_shell
+        return _head + ''.join(self._svg_fragments) + _tail
 
-    def parse_row_elements(self):
+    def clean_element(self, element):
+        """
+        cleanse an occupied seat in place, before the element is serialized:
+            1) <rect>: red fill and stroke => green
+            2) <text>: red fill => black
+        :param element: direct child of <svg>
+        :return:
+        """
+        for _node in element.iter('rect', 'text'):
+            _style = _node.get('style')
+            if _style and self.TAKEN_COLOR in _style:
+                if _node.tag == 'rect':
+                    _node.set('style', _style.replace(self.TAKEN_COLOR, self.CLEAN_RECT_COLOR))
+                else:
+                    _node.set('style', _style.replace(self.TAKEN_COLOR, self.CLEAN_TEXT_COLOR))
+
+    def iter_top_level_elements(self, svg_string):
+        """
+        feed svg_string to a pull parser and yield each direct child of <svg> as soon as its end tag is read
+
+        once a child has been consumed by the caller, it is cleansed and serialized for export_clean_svg(),
+        then removed from <svg>,
+        so only one row (i.e., <g> tag) is held in memory at any time
+        :param svg_string: seatplan svg, str or bytes
+        :return: generator of lxml elements
+        """
+        _parser = etree.XMLPullParser(events=('start', 'end', 'comment', 'pi'))
+        _root = None
+        for _i in range(0, len(svg_string), self.FEED_SIZE):
+            _parser.feed(svg_string[_i:_i + self.FEED_SIZE])
+            for _event, _element in _parser.read_events():
+                if _root is None:
+                    if _event == 'start':
+                        _root = _element
+                        if self.record_fill_slots:
+                            self.assign_fill_slots(_root, recursive=False)
+                    continue
+                if _element is _root:
+                    # ! - </svg> reached, every child has been removed by now
+                    self._svg_shell = self.serialize_svg_shell(_root)
+                elif _event != 'start' and _element.getparent() is _root:
+                    if self.record_fill_slots and _event == 'end':
+                        self.assign_fill_slots(_element)
+                    yield _element
+                    self._fill_slots.clear()
+                    self.clean_element(_element)
+                    self._svg_fragments.append(self.serialize_fragment(_element, _root.nsmap))
+                    _root.remove(_element)
+        _parser.close()
+
+    def assign_fill_slots(self, element, recursive=True):
+        """
+        number the style attributes that contain a fill color in document order,
+        the same order in which STYLE_FILL_PATTERN finds them in the raw svg
+        :param element: <svg> (recursive=False) or a direct child of <svg>
+        :return:
+        """
+        _nodes = element.iter(tag=etree.Element) if recursive else [element]
+        for _node in _nodes:
+            _style = _node.get('style')
+            if _style and FILL_PATTERN.search(_style):
+                self._fill_slots[_node] = self.fill_slot_count
+                self.fill_slot_count += 1
+
+    def serialize_svg_shell(self, root):
+        """
+        :param root: <svg> element without children
+        :return: a tuple of (opening tag and leading text, closing tag) of <svg>
+        """
+        if root.text is None:
+            root.text = ''
+        _svg = etree.tostring(root, encoding='unicode')
+        _pos = _svg.rfind('</')
+        return _svg[:_pos], _svg[_pos:]
+
+    def serialize_fragment(self, element, nsmap):
+        """
+        lxml re-declares all inherited namespaces on a serialized sub-element,
+        those declarations are dropped as they are already declared on <svg>
+        :param element: direct child of <svg>
+        :param nsmap: namespaces declared on <svg>
+        :return: str
+        """
+        _fragment = etree.tostring(element, encoding='unicode', with_tail=True)
+        for _prefix, _uri in nsmap.items():
+            _declaration = f' xmlns:{_prefix}="{_uri}"' if _prefix else f' xmlns="{_uri}"'
+            _fragment = _fragment.replace(_declaration, '', 1)
+        return _fragment
+
+    def parse_row_elements(self, svg_string):
         """
         flow:
-            1) for each row (i.e., <g> tag) in seat plan, do:
+            1) stream the seat plan with a pull parser, a row (i.e., <g> tag) is processed once its end tag is read
             2) for each seat in row, do:
             3) get seat's x-coordinate, y-coordinate, availability, seat number
             4) once a row is processed, append a dict containing
                 row number,
-                and a list of dicts containing each seat's x-coordinate, y-coordinate, availability, column number
+                and each seat's x-coordinate, y-coordinate, availability, column number to self.seats
         assumptions:
             1) <rect> tag is always present
             2) <rect> width attribute is used to recognize seat type
@@ -93,72 +444,66 @@ class SeatplanProcessor:
         :return:
         """
         # (1) - loop through all rows
-        _allRows = self.tree.xpath('/svg/g')
-        for _row in _allRows:
+        for _row in self.iter_top_level_elements(svg_string):
+            if _row.tag != 'g':
+                continue
+            try:
+                _row_number = str(next(_c for _c in _row if _c.tag == 'text').text).strip()
+            except StopIteration:
+                # ! - this is used to bypass the tags that represent "SCREEN"
+                # ! - as "SCREEN" <g> tag has no <text> tag of its own
+                continue
+            _size, _rows = len(self.seats), len(self.seats.row_labels)
+            _row_index = self.seats.add_row(_row_number)
             try:
-                _row_number = str(_row.xpath('text[1]')[0].text).strip()
-                seat_list = list()
                 # (2) - loop through all columns (seats)
-                _seats = _row.xpath('a')
-                for _seat in _seats:
-                    seat_data = dict()
-                    _seat_rect = _seat.xpath('rect')[0]
-                    _x = _seat_rect.attrib.get('x')
-                    _y = _seat_rect.attrib.get('y')
+                for _seat in _row:
+                    if _seat.tag != 'a':
+                        continue
+                    _seat_rect = [_c for _c in _seat if _c.tag == 'rect'][0]
+                    _transform = _seat.get('transform')
+                    _rotate = ROTATE_PATTERN.search(_transform) if _transform else None
+                    _rotation = int(round(float(_rotate.group(1)))) if _rotate else 0
 
                     # (3) - get seat width to identify single/double seat
                     _w = _seat_rect.attrib.get('width', 10)
                     if _w == '10':
                         self.house_capacity += 1
-                        single_seat_data = self.parse_single_seat(_seat_rect)
-
                         try:
-                            _seat_text = _seat.xpath('text')[0]
-                            _seat_number = int(str(_seat.xpath('text')[0].text).strip())
-                            single_seat_data['col'] = _seat_number
-
+                            _seat_text = [_c for _c in _seat if _c.tag == 'text'][0]
+                            _seat_number = int(str(_seat_text.text).strip())
                         except IndexError:
                             # ! - if <text> tag not found under <a> tag, it might be disabled/vibratin seat
-                            _seat_text, _seat_number, single_seat_data['col'] = None, None, None
-                            pass
-                        # ! - convert to list(dict) for seat_list extend
-                        seat_data = [single_seat_data]
-                    # print(f'seat data: {seat_data}\t\tseat list: {seat_list[-3:]}')
+                            _seat_number = None
+                        self.parse_single_seat(_seat_rect, _seat_number, _row_index, _rotation)
                     elif _w == '25':
                         self.house_capacity += 2
-                        double_seat_data = self.parse_double_seat(_seat, _seat_rect)
-                        seat_data = double_seat_data
-
-                    seat_list.extend(seat_data)
-                self.rows.append([{'row': _row_number}, seat_list])
+                        self.parse_double_seat(_seat, _seat_rect, _row_index, _rotation)
 
             except IndexError:
-                # ! - this exception is used to bypass the tags that represent "SCREEN"
-                # ! - as "SCREEN" xpath (/svg/g/a) will be filtered by xpath search (/svg/g/text)
-                pass
+                # ! - malformed seat (e.g., <a> tag without <rect>), skip the row as before
+                self.seats.truncate(_size, _rows)
         return
 
-    def parse_single_seat(self, rect):
+    def parse_single_seat(self, rect, col, row_index, rotation=0):
         """
+        add x-coordinate, y-coordinate, availability of a single seat to self.seats
         :param rect: <a>/<rect> tag
-        :return: a dict containing x-coordinate (str), y-coordinate (str), availability (int)
+        :param col: column number (int), None if the seat is not labelled
+        :param row_index: index of the row in self.seats.row_labels
+        :param rotation: degree of rotate() in the transform of the <a> tag
+        :return:
         """
-        single_seat_dict = dict()
-
-        _x = rect.attrib.get('x')
-        _y = rect.attrib.get('y')
-        single_seat_dict['x'] = _x
-        single_seat_dict['y'] = _y
-
         _seat_style = rect.attrib.get('style')
         if _seat_style:
-            single_seat_dict['availability'] = self.get_availability_from_style(_seat_style)
+            _availability = self.get_availability_from_style(_seat_style)
         else:
-            single_seat_dict['availability'] = 1
+            _availability = 1
 
-        return single_seat_dict
+        self.seats.append(rect.attrib.get('x'), rect.attrib.get('y'), _availability, col, row_index,
+                          self._fill_slots.get(rect, -1), rotation)
 
-    def parse_double_seat(self, seat, rect):
+    def parse_double_seat(self, seat, rect, row_index, rotation=0):
         """
         assumptions:
             1) double seat is always structured as follows:
@@ -169,28 +514,25 @@ class SeatplanProcessor:
                 <a>
         :param seat:
         :param rect:
-        :return: a list of 2 dicts (i.e., two seats in double seats);
-                    each dict contains x-coordinate (str), y-coordinate (str),
+        :param row_index: index of the row in self.seats.row_labels
+        :param rotation: degree of rotate() in the transform of the <a> tag
+        :return: add 2 seats (i.e., two seats in double seats) to self.seats;
+                    each contains x-coordinate, y-coordinate,
                     availability (int), column number (int) (e.g., 7 as in seat B7)
         """
-        double_seat_dicts = [dict(), dict()]
-
         _x = rect.attrib.get('x')
         _y = rect.attrib.get('y')
 
-        _seat_text = seat.xpath('text')
+        _seat_text = [_c for _c in seat if _c.tag == 'text']
+        _seat_numbers = [int(str(_seat_text[i].text).strip()) for i in range(2)]
         for i in range(2):
-            double_seat_dicts[i]['x'] = _x
-            double_seat_dicts[i]['y'] = _y
-            _seat_number = int(str(_seat_text[i].text).strip())
-            double_seat_dicts[i]['col'] = _seat_number
             _seat_style = _seat_text[i].get('style')
             if _seat_style:
-                double_seat_dicts[i]['availability'] = self.get_availability_from_style(_seat_style)
+                _availability = self.get_availability_from_style(_seat_style)
             else:
-                double_seat_dicts[i]['availability'] = 1
-
-        return double_seat_dicts
+                _availability = 1
+            self.seats.append(_x, _y, _availability, _seat_numbers[i], row_index,
+                              self._fill_slots.get(_seat_text[i], -1), rotation)
 
     def get_availability_from_style(self, style):
         """
@@ -201,10 +543,10 @@ class SeatplanProcessor:
 
         :return: int; 1 (free), 2 (taken)
         """
-        _rgb = re.search(r'fill: ?rgb\((\d{0,3}), ?(\d{0,3}), ?(\d{0,3})\)', style)
+        _rgb = FILL_PATTERN.search(style)
         if _rgb:
             _r, _g, _b = _rgb.group(1), _rgb.group(2), _rgb.group(3)
-            if (_r, _g, _b) == ('255', '0', '0'):
+            if (_r, _g, _b) == TAKEN_RGB:
                 _availability = 2
             else:
                 _availability = 1
@@ -214,192 +556,265 @@ class SeatplanProcessor:
         return _availability
 
     def patch_missing_column(self):
-        # ! - not in use
         """
         scenarios where seat number will be missing:
             1) seat is for disabled
             2) seat is a vibrating seat
+        infer the missing column numbers with SeatTable.patch_missing_columns,
+        this is done once per house layout by SeatplanLayout, not for every seat plan
+        :return: number of seats patched
         """
-        for _i, _r in enumerate(self.rows):
-            for _c in _r[1]:
-                _row_number = _r[0]['row']
-                if _c.get('col') is None:
-                    print(f'A None seat is found in Row {_row_number}')
-                    _first_patch = self.fill_by_incremental_col_num(_i)
-                    if not _first_patch:
-                        _second_patch = self.fill_by_x_coordinate(_i)
-                    break
-
-    def fill_by_incremental_col_num(self, index_of_row):
-        # ! - not in use
+        _patched = self.seats.patch_missing_columns()
+        if _patched:
+            self._rows = None
+        return _patched
+
+
+class SeatplanSnapshot:
+    """
+    seats of a show read from a known SeatplanLayout,
+    provides the same functions as SeatplanProcessor to get occupied seats, house capacity and clean svg
+    """
+    def __init__(self, seats, clean_svg, fingerprint=None):
         """
-        assumptions:
-            1) columns are always in ascending order, and each column is increased by 1
+        :param clean_svg: str, or an object whose str() is the svg (e.g., data.db_management.LazySvg)
+        """
+        self.seats = seats
+        self._clean_svg = clean_svg
+        self.fingerprint = fingerprint
+
+    def get_occupied_seats(self):
+        return self.seats.occupied_seats()
 
-        description:
-            Given an ordered list of column numbers with at least one valid number and one None,
-            fill all the None by increasing or decreasing from the closest valid number
+    def count_occupied_seats(self):
+        return self.seats.count_taken()
 
-            Examples: [1, 2, None, 4, None, 6, None, 8, None, None] => [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+    def get_house_capacity(self):
+        return len(self.seats)
 
-            If success, patch self.rows directly and return True;
-            If the row does not contain at least one valid column number, return False
+    def export_clean_svg(self):
+        return str(self._clean_svg)
 
-        flow:
-            1) retrieve the column numbers from the given row as a list
-            2) look for first valid (non-None) number in the list
-                if all are Nones, return False
-            3) create a range of numbers based on the index of the first number and length of [column numbers] from (1)
-                start of range = first number minus its index
-                    > this will bring us the starting number, assuming the step is 1
-                end of range = first number plus the remaining columns left in the list
-            4) compare the filled numbers list from 3) with original list from (1)
-                theoretically, they should match perfectly because the step from one column to another is 1
-                if not, this may imply
-                    a) the seats are not placed consecutively, because of separation by aisle, etc.
-            5) update self.rows with a for-loop
-        :param index_of_row: given an index of row, for example "3",
-                this function will access the row in self.rows by index
-        :return: If the list generated by filled numbers matches entirely to original list, return True.
-                Otherwise, return False
-        """
-        _cols = [_c.get("col") for _c in self.rows[index_of_row][1]]
-        print(f'FIRST EXTRACTED COL: {_cols}')
-
-        # print(self.isSeatOrderAscending)
-        _current_row = self.rows[index_of_row][0]["row"]
-        # print(f'getting {self.rows[index_of_row][0]["row"]} by incremental fill')
-        # ! - find first non-None value
-        try:
-            _valid_num = next(__c for __c in _cols if __c is not None)
-        except StopIteration:
-            # ! - except all are Nones
-            _row_number = self.rows[index_of_row][0]['row']
-            # print(f'all cols for row {self.rows[index_of_row][0]["row"]} are None')
-            return False
-        _index = _cols.index(_valid_num)
-        # print(f'index to the first valid num is {_index}')
-        if _valid_num - _index > 0:
-            if self.isSeatOrderAscending:
-                # print(f'self.isSeatOrderAscending is {self.isSeatOrderAscending}')
-                _filled_cols = list(range(_valid_num - _index, len(_cols) - _index + _valid_num))
-            else:
-                # print(f'self.isSeatOrderAscending is {self.isSeatOrderAscending}')
-                _filled_cols = list(range(_index + _valid_num, _valid_num - len(_cols) + _index, -1))
-        else:
-            # ! - all column numbers should be > 0, otherwise return False
-            print(f'not all column numbers for row {self.rows[index_of_row][0]["row"]} > 0')
-            return False
-
-        # ! - validate whether the filled list matches entirely to the original list
-        # ! - (i.e., whether the columns are indeed increased by 1 each)
-        # ! - only work if original list has two non-None values
-        if _col_num := self.rows[index_of_row][0]["row"] == "A":
-            print(f'Current Row: {self.rows[index_of_row][0]["row"]}')
-            print(f'extracted row = {_cols}')
-            print(f'calculated row = {_filled_cols}')
-            print(set(_filled_cols).difference(set(_cols)))
-            print('===================================================================')
-
-        _differences = [_d for _d in set(_cols).difference(set(_filled_cols)) if _d is not None]
-        if len(_differences) != 0:
-            # print(f'increase for each col in row {self.rows[index_of_row][0]["row"]} is not +1')
-            return False
-
-        for _n, _c in zip(_filled_cols, self.rows[index_of_row][1]):
-            _c["col"] = _n
-
-        # print(f'|| Patched row {self.rows[index_of_row][0]["row"]}')
-        return True
-
-    def fill_by_x_coordinate(self, index_of_row):
-        # ! - not in use
+
+class SeatplanLayout:
+    """
+    geometry of a house: seats (x, y, column number, row label), capacity and clean svg,
+    plus the fill slot of every seat, i.e., which fill color (in document order) decides its availability
+
+    HouseLayouts only keeps svg_hash, the clean svg itself is stored once per hash in SvgBlobs;
+    clean_svg is a str for a layout that has just been parsed, a LazySvg for one read from the database,
+    and None for one sent to a worker process of SeatplanBatch (which never exports svg)
+    """
+    # ! - array columns of SeatTable persisted in HouseLayouts, arrays have fixed-width typecodes
+    # ! - and are stored in native byte order
+    ARRAY_COLUMNS = ('x', 'y', 'col', 'row_index', 'fill_slot', 'rotation')
+
+    def __init__(self, fingerprint, seats, slot_count, clean_svg, svg_hash=None):
         """
-        assumptions:
-            1) the gap between two <rect> elements is always 15px
-            2) based on (1), if the gap between two <rects> is less than 15px (~12px), then they are on the same column
-            3) rows closer to each other tend to have the same structure,
-                thus the seat on the closest row will share same x-coordinate, rotation with the target seat
-        flow:
-            1) create two lists of numbers
-                a) one of which runs from given index to first index of list
-                b) another runs from given index to ending index of list
-                the purpose is explained on assumption (3)
-            2) loop from first seat on the row
-            3) inner loop through each seats on the closest rows
-            4) once the column number for first seat is acquired, run self.fill_by_incremental_col_num
-            5) if (4) returns False, continue to next seat in (2); otherwise, return True for this row
-        """
-        if index_of_row != self.rows:
-            _loop_idx = index_of_row
-        else:
-            _loop_idx = index_of_row - 1
-
-        _positive_range = list(reversed(range(0, _loop_idx)))
-        _negative_range = range(_loop_idx + 1, len(self.rows))
-
-        for _target_seat in self.rows[index_of_row][1]:
-            _target_seat_rotate_degree = _target_seat.get('rotate_degree', 0)
-            _target_seat_rotate_x = _target_seat.get('rotate_x', 0)
-            _target_seat_x = _target_seat['x']
-            # print(f'current seat {_target_seat.get("col")}')
-            for a, b in zip_longest(_positive_range, _negative_range):
-                _a_loop = False
-                _b_loop = False
-                if a is not None:
-                    for _ref_seat in self.rows[a][1]:
-                        if _ref_seat.get('rotate_degree', 0) == _target_seat_rotate_degree and \
-                                _ref_seat.get('rotate_x', 0) == _target_seat_rotate_x and \
-                                _ref_seat['x'] == _target_seat_x and \
-                                _ref_seat.get('col') is not None:
-                            # print(
-                            #     f'===a) Seat {self.rows[a][0]["row"]}{_ref_seat["col"]} has the same property as target seat:')
-                            # print(f'|||> {_ref_seat}')
-                            # print(f'||> {_target_seat}')
-                            _target_seat['col'] = _ref_seat['col']
-                            _a_loop = True
-                            break
-                # print(f'a loop ended')
-                if _a_loop:
-                    break
-                if b is not None:
-                    for _ref_seat in self.rows[b][1]:
-                        if _ref_seat.get('rotate_degree', 0) == _target_seat_rotate_degree and \
-                                _ref_seat.get('rotate_x', 0) == _target_seat_rotate_x and \
-                                _ref_seat['x'] == _target_seat_x and \
-                                _ref_seat.get('col') is not None:
-                            # print(f'===b) Seat {self.rows[b][0]["row"]}{_ref_seat["col"]} has the same property as target seat:')
-                            # print(f'|||> {_ref_seat}')
-                            # print(f'||> {_target_seat}')
-                            _target_seat['col'] = _ref_seat['col']
-                            _b_loop = True
-                            break
-                # print(f'b loop ended')
-                if _b_loop:
-                    break
-
-            # print(f'|| Patched row {self.rows[index_of_row][0]["row"]} by x-coordinates')
-            _patch = self.fill_by_incremental_col_num(index_of_row)
-            if _patch:
-                return True
-        return
+        :param svg_hash: sha1 of clean_svg (as data.db_management.svg_hash), computed if None
+        """
+        self.fingerprint = fingerprint
+        self.seats = seats
+        self.slot_count = slot_count
+        self.clean_svg = clean_svg
+        if svg_hash is None:
+            svg_hash = hashlib.sha1(clean_svg.encode('utf-8')).hexdigest()
+        self.svg_hash = svg_hash
+
+    @classmethod
+    def from_processor(cls, fingerprint, processor):
+        """
+        :param fingerprint: layout_fingerprint() of the svg parsed by processor
+        :param processor: SeatplanProcessor created with record_fill_slots=True,
+                            missing column numbers of its seats are patched in place
+        :return: SeatplanLayout
+        """
+        processor.patch_missing_column()
+        return cls(fingerprint, processor.seats, processor.fill_slot_count, processor.export_clean_svg())
+
+    @classmethod
+    def from_record(cls, record, clean_svg=None):
+        """
+        :param record: a row of HouseLayouts, in the order of SeatplanLayout.to_record()
+        :param clean_svg: the svg of record's svg_hash, str or LazySvg, None if not needed
+        :return: SeatplanLayout
+        """
+        _fingerprint, _slot_count, _row_labels, _svg_hash = record[:4]
+        _seats = SeatTable()
+        for _column, _blob in zip(cls.ARRAY_COLUMNS, record[4:]):
+            if _blob is None:
+                continue
+            # ! - fill_slot of layouts stored on Linux with typecode 'l', i.e., 8 bytes per seat
+            if _column == 'fill_slot' and len(_blob) == 8 * len(_seats.x) != _seats.fill_slot.itemsize * len(_seats.x):
+                _wide = array('q')
+                _wide.frombytes(_blob)
+                _seats.fill_slot.extend(_wide.tolist())
+                continue
+            getattr(_seats, _column).frombytes(_blob)
+        _seats.row_labels = [sys.intern(_label) for _label in orjson.loads(_row_labels)]
+        _seats.availability = bytearray([SeatTable.FREE]) * len(_seats.x)
+        # ! - layouts stored before rotations were recorded
+        if len(_seats.rotation) != len(_seats.x):
+            _seats.rotation = array('h', bytes(2 * len(_seats.x)))
+        _seats.patch_missing_columns()
+        return cls(_fingerprint, _seats, _slot_count, clean_svg, _svg_hash)
+
+    def to_record(self):
+        return (self.fingerprint, self.slot_count, orjson.dumps(self.seats.row_labels).decode('utf-8'),
+                self.svg_hash) + tuple(getattr(self.seats, _column).tobytes() for _column in self.ARRAY_COLUMNS)
+
+    def read_snapshot(self, svg_string, fills=None):
+        """
+        read availability of every seat from the fill colors of svg_string in document order
+        :param svg_string: seatplan svg (str) that has the same fingerprint as this layout
+        :param fills: fill colors of svg_string found by scan_layout(), scanned again if None
+        :return: SeatplanSnapshot, or None if the fill colors do not line up with this layout
+        """
+        _fills = fills if fills is not None else STYLE_FILL_PATTERN.findall(svg_string)
+        if len(_fills) != self.slot_count:
+            return None
+        _codes = [SeatTable.TAKEN if _rgb == TAKEN_RGB else SeatTable.FREE for _rgb in _fills]
+        # ! - fill_slot == -1 (seat without fill color) reads the last code, i.e., free
+        _codes.append(SeatTable.FREE)
+        _availability = bytearray(map(_codes.__getitem__, self.seats.fill_slot))
+        return SeatplanSnapshot(self.seats.with_availability(_availability), self.clean_svg, self.fingerprint)
+
+
+class LayoutCache:
+    """
+    SeatplanLayout by fingerprint, held in memory and persisted in HouseLayouts table,
+    with the clean svg of each layout in SvgBlobs (through svg_store)
+
+    flow of process():
+        1) compute layout fingerprint of the seat plan
+        2) if the layout is known, read the fill colors only and return a SeatplanSnapshot
+        3) otherwise, parse the seat plan with SeatplanProcessor, and cache its layout
+    a house has one layout at a time,
+    once a house reports a new fingerprint, its previous layout is dropped from HouseLayouts (it is kept in memory)
+    """
+    def __init__(self, cursor=None, svg_store=None):
+        """
+        :param cursor: sqlite3 cursor of hk-movies.db, layouts are only kept in memory if None
+        :param svg_store: data.db_management.SvgBlobStore of the same database, required with a cursor
+        """
+        if cursor is not None and svg_store is None:
+            raise ValueError('LayoutCache: a svg_store is required to persist layouts')
+        self.cursor = cursor
+        self.svg_store = svg_store
+        self.layouts = dict()
+        self.house_fingerprints = dict()
+        self.hits = 0
+        self.misses = 0
+
+    # ! - HouseLayouts columns in the order of SeatplanLayout.to_record()
+    SELECT_LAYOUT = "SELECT fingerprint, slot_count, row_labels, svg_hash, x, y, col, row_index, fill_slot, " \
+                    "rotation, HouseID FROM HouseLayouts"
+
+    def load_record(self, record):
+        """
+        :param record: a row of SELECT_LAYOUT
+        :return: SeatplanLayout, its clean svg is decompressed from SvgBlobs on first use
+        """
+        return SeatplanLayout.from_record(record[:-1], self.svg_store.lazy(record[3]))
+
+    def get(self, fingerprint):
+        _layout = self.layouts.get(fingerprint)
+        if _layout is None and self.cursor is not None:
+            _record = self.cursor.execute(f"{self.SELECT_LAYOUT} WHERE fingerprint = ?", [fingerprint]).fetchone()
+            if _record is not None:
+                _layout = self.load_record(_record)
+                self.layouts[fingerprint] = _layout
+        return _layout
+
+    def preload(self, house_ids):
+        """
+        load the current layouts of the given houses from HouseLayouts into memory
+        :param house_ids: list of HouseID
+        :return:
+        """
+        if self.cursor is None:
+            return
+        _house_ids = list(house_ids)
+        for _i in range(0, len(_house_ids), 500):
+            _chunk = _house_ids[_i:_i + 500]
+            _placeholders = ', '.join('?' * len(_chunk))
+            for _record in self.cursor.execute(f"{self.SELECT_LAYOUT} WHERE HouseID IN ({_placeholders})", _chunk):
+                self.layouts[_record[0]] = self.load_record(_record)
+                self.house_fingerprints[_record[-1]] = _record[0]
+
+    def put(self, layout, house_id=None):
+        """
+        :param layout: SeatplanLayout, whose clean_svg is a str unless it is already in SvgBlobs
+        :param house_id:
+        """
+        self.layouts[layout.fingerprint] = layout
+        if self.cursor is not None:
+            if isinstance(layout.clean_svg, str):
+                self.svg_store.put(layout.clean_svg, house_id, layout.svg_hash)
+            self.cursor.execute(
+                "INSERT OR REPLACE INTO HouseLayouts "
+                "(fingerprint, slot_count, row_labels, svg_hash, x, y, col, row_index, fill_slot, rotation, HouseID, "
+                "capacity) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                layout.to_record() + (house_id, len(layout.seats)))
+        if house_id is not None:
+            self.assign_house(house_id, layout.fingerprint)
+
+    def assign_house(self, house_id, fingerprint):
+        """
+        make fingerprint the current layout of the house, and drop the previous layout of the house from HouseLayouts
+        (the previous layout is kept in memory, other shows of the same run may still refer to it)
+        """
+        if self.house_fingerprints.get(house_id) == fingerprint:
+            return
+        self.house_fingerprints[house_id] = fingerprint
+
+        if self.cursor is not None:
+            self.cursor.execute("DELETE FROM HouseLayouts WHERE HouseID = ? AND fingerprint != ?",
+                                [house_id, fingerprint])
+            self.cursor.execute("UPDATE HouseLayouts SET HouseID = ? WHERE fingerprint = ?", [house_id, fingerprint])
+
+    def process(self, svg_string, house_id=None):
+        """
+        :param svg_string: seatplan svg (str)
+        :param house_id: HouseID of the show, used to invalidate the previous layout of the house
+        :return: SeatplanSnapshot if the layout is known, otherwise SeatplanProcessor
+        """
+        _fingerprint, _fills = scan_layout(svg_string)
+        _layout = self.get(_fingerprint)
+        if _layout is not None:
+            _snapshot = _layout.read_snapshot(svg_string, _fills)
+            if _snapshot is not None:
+                self.hits += 1
+                if house_id is not None:
+                    self.assign_house(house_id, _fingerprint)
+                return _snapshot
+
+        self.misses += 1
+        _sp = SeatplanProcessor(svg_string, record_fill_slots=True)
+        _sp.fingerprint = _fingerprint
+        self.put(SeatplanLayout.from_processor(_fingerprint, _sp), house_id)
+        return _sp
 
 
 if __name__ == "__main__":
-    svg_file = 'seatplan_double_seats.svg'
-    # svg_file = 'seatplan.svg'
-    svg_path = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, 'ScheduledTasks'))
-    svg_list = [os.path.join(svg_path, f) for f in os.listdir(svg_path) if str(f).endswith('5.svg')]
-    for svg in svg_list:
+    # ! - svg files given as arguments, otherwise the synthetic seat plans of benchmarks/seatplan_generator.py;
+    # ! - for repeatable timings (parse, occupied seats, clean svg, capacity; seats/sec, peak memory)
+    # ! - see benchmarks/seatplan_benchmark.py
+    if len(sys.argv) > 1:
+        svg_list = list()
+        for svg in sys.argv[1:]:
+            with open(svg, 'rb') as f:
+                svg_list.append((svg, f.read()))
+    else:
+        sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+        from benchmarks.seatplan_generator import generate_corpus
+        svg_list = [(f'{_name} (generated)', _svg) for _name, _capacity, _svg in generate_corpus()]
+    for svg, lxml_as_binary in svg_list:
         print(f'===========\t=> Current svg: {svg}')
-        with open(svg, 'rb') as f:
-            lxml_as_binary = f.read()
 
         t0 = time.time()
         sp = SeatplanProcessor(lxml_as_binary)
         print(sp.export_clean_svg())
 
         t1 = time.time()
-
-
-    # print(f'\n===================================\nTime spent to analyze seatplan: {t1 - t0}')
\ No newline at end of file
+        print(f'\n===================================\nTime spent to analyze seatplan: {t1 - t0}')
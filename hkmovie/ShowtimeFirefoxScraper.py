@@ -1,4 +1,5 @@
 import os
+import re
 from seleniumwire import webdriver
 from selenium.webdriver.firefox.firefox_profile import FirefoxProfile
 from selenium.webdriver.common.by import By
@@ -6,11 +7,15 @@ from selenium.common.exceptions import TimeoutException
 from fake_useragent import UserAgent
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as ec
-import random
 import orjson
-import re
 import time
+import threading
 from tenacity import retry, retry_if_exception_type, stop_after_attempt, RetryError, wait_random
+from hkmovie.GrpcWebDecoder import decode_showtimes, ProtobufDecodeError
+from hkmovie.PageReadiness import wait_until, PacingPolicy, ReadinessTimeout
+from hkmovie.LeanProfile import apply_lean_profile, lean_request_interceptor
+from hkmovie.SiteConfig import BASE_URL, HOST
+from hkmovie.Instrumentation import METRICS
 
 # ! - todo: https://medium.com/c%C3%B3digo-ecuador/python-multithreading-vs-multiprocessing-web-scrape-stock-price-history-faster-b72827601cf6
 # ! - todo: https://medium.com/drunk-wis/python-selenium-webdriver-page-object-model-design-pattern-%E7%9A%84%E4%B8%80%E4%BA%9B%E6%83%B3%E6%B3%95-6d8cc0e156a6
@@ -26,19 +31,59 @@ class Terminator(Exception):
     pass
 
 
+# ! - scoped capture: only requests to these urls (regex) are recorded by selenium-wire,
+# ! - and only POST requests, as gRPC-web calls are always POST (images, fonts, scripts are GET)
+# ! - plus the host of HKMOVIE6_BASE_URL, e.g., a local stand-in server
+CAPTURE_SCOPES = [r'.*hkmovie6\.com.*'] + ([] if HOST.endswith('hkmovie6.com') else [f'.*{re.escape(HOST)}.*'])
+CAPTURE_IGNORED_METHODS = ['GET', 'HEAD', 'OPTIONS']
+# ! - at most this many requests are kept in driver.requests, the oldest are dropped first
+CAPTURE_MAX_REQUESTS = 100
+# ! - response bytes decoded per scrape, responses beyond the cap are dropped (and counted)
+CAPTURE_MAX_BYTES = 16 * 1024 * 1024
+
+
 class ShowtimeScraper:
-    def __init__(self, headless=True):
+    def __init__(self, headless=True, scoped_capture=True, max_capture_bytes=CAPTURE_MAX_BYTES, pacing=None,
+                 ready_timeout=5, lean=False, record_dir=None):
+        """
+        :param headless:
+        :param lean: block images, media, fonts and third-party domains (see hkmovie/LeanProfile.py)
+        :param pacing: PacingPolicy, politeness delay after each date click, no delay if None
+        :param ready_timeout: seconds to wait for the gRPC response of a date click
+        :param scoped_capture: record only gRPC calls of hkmovie6 and decode each response as it arrives
+                                (response_interceptor), instead of buffering every request until the end of scrape()
+        :param max_capture_bytes: cap on response bytes decoded per scrape in scoped capture
+        :param record_dir: if given, every gRPC response body is saved as {record_dir}/{hkmovie6_code}/{n}.bin,
+                            to pin the field numbers of hkmovie/GrpcWebDecoder.py
+        """
+        self.scoped_capture = scoped_capture
+        self.record_dir = record_dir
+        self.lean = lean
+        self.max_capture_bytes = max_capture_bytes
+        self.pacing = pacing or PacingPolicy()
+        self.ready_timeout = ready_timeout
+        # ! - the response_interceptor runs on the proxy's threads
+        self._capture_lock = threading.Lock()
+        self.captured_bytes = 0
+        self.dropped_responses = 0
         self._setup(headless)
         self.hkmovie6_code = None
         self.secret_codes = None
+        # ! - showtime_code -> ShowtimeRecord (start_time, house, cinema, price) of the last scrape
+        self.showtime_records = dict()
         self.received_response_ts = list()
         self.num_of_resp = 0
+        # ! - classes of the date shown when the page is loaded that the other dates do not have, see _click()
+        self.selected_classes = set()
 
     def _setup(self, headless):
         _firefox_options = webdriver.FirefoxOptions()
         _firefox_profile = FirefoxProfile()
         _ua = UserAgent()
         _firefox_profile.set_preference("general.useragent.override", _ua.random)
+        if self.lean:
+            # ! - third-party domains are blocked by the request_interceptor, selenium-wire manages the proxy
+            apply_lean_profile(_firefox_profile, block_third_party=False)
         if headless:
             _firefox_options.add_argument('--headless')
 
@@ -46,18 +91,39 @@ class ShowtimeScraper:
         _service_log_path = os.path.abspath(
             os.path.join(os.path.dirname(__file__), os.pardir, r'plug-ins\geckodriver.log'))
 
+        _seleniumwire_options = dict()
+        if self.scoped_capture:
+            _seleniumwire_options = {
+                # ! - in lean mode, GET requests must reach the request_interceptor to be blocked
+                'ignore_http_methods': ['OPTIONS'] if self.lean else CAPTURE_IGNORED_METHODS,
+                'request_storage': 'memory',
+                'request_storage_max_size': CAPTURE_MAX_REQUESTS
+            }
+
         self.driver = webdriver.Firefox(
             executable_path=_driver_path,
             options=_firefox_options,
             firefox_profile=_firefox_profile,
-            service_log_path=_service_log_path
+            service_log_path=_service_log_path,
+            seleniumwire_options=_seleniumwire_options
         )
         self.driver.set_page_load_timeout(20)
+        if self.scoped_capture and not self.lean:
+            self.driver.scopes = CAPTURE_SCOPES
+        if self.scoped_capture:
+            self.driver.response_interceptor = self._intercept_response
+        if self.lean:
+            # ! - out-of-scope requests are not intercepted, so no scopes are set in lean mode
+            self.driver.request_interceptor = lean_request_interceptor()
         return True
 
     def scrape(self, hkmovie6_code):
         try:
-            self.num_of_resp = 0
+            with self._capture_lock:
+                self.num_of_resp = 0
+                self.showtime_records = dict()
+                self.captured_bytes = 0
+                self.dropped_responses = 0
             self.hkmovie6_code = hkmovie6_code
             _url = self._generate_url()
             _time0 = time.time()
@@ -73,38 +139,55 @@ class ShowtimeScraper:
             except NoButtonError:
                 raise Terminator(f'failed to find buttons on {_url} as movie is not showing in theatre')
             _time2 = time.time()
+            # ! - page_ready: load (with retries) and date buttons found
+            METRICS.observe('page_ready', _time2 - _time0)
+            METRICS.observe('date_buttons', _time2 - _time1)
+            _expected = self._count_responses()
             if date_btns is not None:
                 for btn in date_btns:
-                    self._click(btn)
-            # ! - wait for request.response
-            time.sleep(2)
+                    if self._click(btn):
+                        _expected += 1
+            # ! - wait for the response of the default date (loaded with the page) if no date was clicked,
+            # ! - the response of every answered click has already arrived
+            self._wait_ready(lambda: self._count_responses() >= max(_expected, 1), 'grpc_responses')
+            METRICS.observe('scrape', time.time() - _time0)
             try:
                 secret_codes = self._fetch_secret_response()
             except Exception as err:
                 raise Terminator(f'ShowtimeScraper.scrape(): {_url}: {repr(err)}')
             else:
-                self.secret_codes = secret_codes
-                return {'movie_code': self.hkmovie6_code, 'secret_codes': list(self.secret_codes)}
+                self.secret_codes = list(secret_codes)
+                # ! - showtimes: start_time, house, price of each show as found in the responses, see export_showtime_to_db
+                return {'movie_code': self.hkmovie6_code, 'secret_codes': self.secret_codes,
+                        'showtimes': [self.showtime_records[_code]._asdict() for _code in self.secret_codes]}
         except Terminator:
+            METRICS.increment('terminators_total', scraper='showtime')
             print(repr(Terminator))
         finally:
             if self.num_of_resp > 0:
                 print(
-                    f'|| Scraped {self.num_of_resp} responses on {_url}')
+                    f'|| Scraped {self.num_of_resp} responses ({self.captured_bytes} bytes) on {_url}')
                 print('...')
+            if self.dropped_responses > 0:
+                print(f'|| Dropped {self.dropped_responses} responses over the capture cap of '
+                      f'{self.max_capture_bytes} bytes on {_url}')
             del self.driver.requests
             print(f'responses deleted for {self.hkmovie6_code}')
 
     def _generate_url(self):
         # ! - Expect the url structure to be always the same
-        _url = f'https://hkmovie6.com/movie/{self.hkmovie6_code}/SHOWTIME'
+        _url = f'{BASE_URL}/movie/{self.hkmovie6_code}/SHOWTIME'
         return _url
 
-    @retry(retry=retry_if_exception_type(TimeoutException), stop=stop_after_attempt(3), wait=wait_random(min=3, max=5))
+    @retry(retry=retry_if_exception_type(TimeoutException), stop=stop_after_attempt(3), wait=wait_random(min=3, max=5),
+           before_sleep=METRICS.retry_hook('load'))
+    @METRICS.timed('load')
     def _load_url(self, url):
         self.driver.get(url)
 
-    @retry(retry=retry_if_exception_type(TimeoutException), stop=stop_after_attempt(2), wait=wait_random(min=1, max=2))
+    @retry(retry=retry_if_exception_type(TimeoutException), stop=stop_after_attempt(2), wait=wait_random(min=1, max=2),
+           before_sleep=METRICS.retry_hook('selector_wait'))
+    @METRICS.timed('selector_wait')
     def _find_date_buttons(self):
         try:
             _all_btns = WebDriverWait(self.driver, 5).until(
@@ -122,46 +205,108 @@ class ShowtimeScraper:
                 # ! - if button is default active date, return
                 return None
             else:
+                # ! - swiper's own classes (e.g., swiper-slide-active) follow the scroll position, not the date shown
+                self.selected_classes = {_c for _c in set(_all_btns[0].get_attribute('class').split()) -
+                                         set(_all_btns[1].get_attribute('class').split())
+                                         if not _c.startswith('swiper-')}
                 # ! - return 2nd to last buttons, as the 1st button (default active date) needs not be clicked
                 return _all_btns[1:]
 
     def _click(self, element):
+        """
+        :return: True if the click was answered by a gRPC response, i.e., one more response for scrape() to expect;
+                    a click on the date already shown sends no request and is skipped, a click that is not answered
+                    within ready_timeout is not waited for again by scrape()
+        """
         try:
+            if self.selected_classes & set((element.get_attribute('class') or '').split()):
+                return False
             # ! - click using JavaScript, as element.click() cannot bypass overlay element
-            self.driver.execute_script("arguments[0].click();", element)
-            time.sleep(random.randint(0, 3))
-            return True
+            _before = self._count_responses()
+            with METRICS.span('click'):
+                self.driver.execute_script("arguments[0].click();", element)
+                _answered = self._wait_ready(lambda: self._count_responses() > _before, 'grpc_response_click')
+            self.pacing.pause()
+            return bool(_answered)
         except Exception as err:
-            print(f'SecretResponseScraper.click(): An error occurred on https://hkmovie6.com/movie/{self.hkmovie6_code}/SHOWTIME: {str(err)}')
+            print(f'SecretResponseScraper.click(): An error occurred on {BASE_URL}/movie/{self.hkmovie6_code}/SHOWTIME: {str(err)}')
+
+    def _wait_ready(self, condition, label):
+        """wait for condition (see PageReadiness.wait_until), a timeout is recorded and ignored"""
+        try:
+            return wait_until(condition, timeout=self.ready_timeout, label=label)
+        except ReadinessTimeout:
+            return None
+
+    def _count_responses(self):
+        """:return: number of gRPC responses received in this scrape"""
+        if self.scoped_capture:
+            return self.num_of_resp + self.dropped_responses
+        return sum(1 for _r in self.driver.requests
+                   if _r.response and 'grpc' in (_r.response.headers['content-type'] or ''))
 
     def _fetch_secret_response(self):
+        """
+        decode every captured gRPC-web response into showtime records (see hkmovie/GrpcWebDecoder.py),
+        the records are kept in self.showtime_records
+        :return: generator of showtime_code, each code once
+        """
+        if self.scoped_capture:
+            # ! - responses are already decoded by _intercept_response
+            with self._capture_lock:
+                yield from list(self.showtime_records)
+            return
         try:
             for request in self.driver.requests:
-                # print(f'url: {request.url}\tcontent-length: {request.response.headers["content-length"]}\tdate: {request.response.headers["date"]}')
-                # print(f'CONCAT_KEYS = {str(request.response.headers["content-length"]) + "_" + request.response.headers["date"]}')
                 if request.response:
                     if request.response.headers['content-type']:
                         if 'grpc' in request.response.headers['content-type']:
-                            # print(f'QUALIFIED: url: {request.url}\tcontent-length: {request.response.headers["content-length"]}\tdate: {request.response.headers["date"]}')
-                            # print('=====================================================')
-                            secret_codes = self._regex_showtime_code(request.response.body.decode('latin-1'))
                             self.num_of_resp += 1
-                            if secret_codes:
-                                yield from secret_codes
-                            else:
-                                pass
+                            if self.record_dir:
+                                self._record(request.response.body, self.num_of_resp - 1)
+                            with METRICS.span('grpc_decode'):
+                                _records = list(self._decode_showtimes(request.response.body))
+                            for _record in _records:
+                                if _record.showtime_code not in self.showtime_records:
+                                    self.showtime_records[_record.showtime_code] = _record
+                                    yield _record.showtime_code
         except Exception as err:
             print(f'SecretResponseScraper.fetch_secret_response(): An error occurred: {str(err)}')
 
-    def _regex_showtime_code(self, body):
+    def _intercept_response(self, request, response):
+        """
+        selenium-wire response_interceptor: decode a gRPC response as it arrives, so that bodies need not be
+        buffered until the end of scrape(); bodies beyond max_capture_bytes are dropped
+        """
+        if 'grpc' not in (response.headers['content-type'] or ''):
+            return
+        _body = response.body
+        with self._capture_lock:
+            if self.captured_bytes + len(_body) > self.max_capture_bytes:
+                self.dropped_responses += 1
+                return
+            self.captured_bytes += len(_body)
+            self.num_of_resp += 1
+            _n = self.num_of_resp - 1
+        if self.record_dir:
+            self._record(_body, _n)
+        with METRICS.span('grpc_decode'):
+            _records = list(self._decode_showtimes(_body))
+        with self._capture_lock:
+            for _record in _records:
+                self.showtime_records.setdefault(_record.showtime_code, _record)
+
+    def _record(self, body, n):
+        _dir = os.path.join(self.record_dir, self.hkmovie6_code)
+        os.makedirs(_dir, exist_ok=True)
+        with open(os.path.join(_dir, f'{n}.bin'), 'wb') as f:
+            f.write(body)
+
+    def _decode_showtimes(self, body):
         try:
-            results = re.findall(r"\*\$(.{8}-.{4}-.{4}-.{4}-.{12})2", body)
-            if results:
-                return results
-            else:
-                return False
-        except Exception as err:
-            print(f'SecretResponseScraper.regex_showtime_code(): An error occurred: {str(err)}')
+            yield from decode_showtimes(body)
+        except ProtobufDecodeError as err:
+            print(f'SecretResponseScraper.decode_showtimes(): skipped a malformed response: {str(err)}')
 
     def _secret_codes_to_txt(self):
         # ! - not in use
@@ -209,8 +354,9 @@ class ShowtimeScraper:
         pass
 
     def tear_down(self):
-        self.driver.close()
-        self.driver.quit()
+        with METRICS.span('teardown'):
+            self.driver.close()
+            self.driver.quit()
 
     def action(self, url):
         self._load_url(url)
@@ -0,0 +1,22 @@
+import os
+from urllib.parse import urlparse
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Site Config |}
+#
+# Base url of hkmovie6 shared by every scraper, so that a run can be pointed at a local stand-in server
+# (see benchmarks/standin_server.py) instead of the live site.
+#
+# usage:
+#   set HKMOVIE6_BASE_URL=http://127.0.0.1:8606     (defaults to https://hkmovie6.com)
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+BASE_URL = os.environ.get('HKMOVIE6_BASE_URL', 'https://hkmovie6.com').rstrip('/')
+HOST = urlparse(BASE_URL).netloc
+
+
+def site_url(path=''):
+    """:return: BASE_URL joined with path, e.g., site_url('/showing')"""
+    return f"{BASE_URL}/{path.lstrip('/')}" if path else BASE_URL
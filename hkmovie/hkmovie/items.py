@@ -8,19 +8,20 @@ from scrapy.loader import ItemLoader
 from itemloaders.processors import TakeFirst, MapCompose
 from w3lib.html import remove_tags
 import re
+from hkmovie.SiteConfig import site_url
 
 
 def extract_hkmovie6_code(url):
     """
     extract unique hkmovie6 code assigned by hkmovie6.com to the movie from the url
-    this function expects the url to always be https://hkmovie6.com/movie/UNIQUE_HKMOVIE6_CODE
+    this function expects the url to always be {BASE_URL}/movie/UNIQUE_HKMOVIE6_CODE
 
     hkmovie6_code is used as the name instead of id, movie_id, etc. because the latter are reserved to be the
     primary key of the movie for the database.
     :param url: as parsed from response.request.url
     :return: unique hkmovie6_code
     """
-    hkmovie6_code = str(url).replace("https://hkmovie6.com/movie/", "")
+    hkmovie6_code = str(url).replace(site_url("/movie/"), "")
     return hkmovie6_code
 
 
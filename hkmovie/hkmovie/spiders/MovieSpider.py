@@ -8,6 +8,7 @@ from w3lib.html import remove_tags
 from requests_html import HTMLSession
 import re
 from datetime import datetime
+from hkmovie.SiteConfig import site_url
 
 # ! - crawl command:
 # ! - scrapy crawl MovieSpider -O hk-movies.json
@@ -21,9 +22,9 @@ def get_movie_links():
     :return: a list of absolute links pointing to hkmovie6/movie page
     """
     _session = HTMLSession()
-    _r = _session.get('https://hkmovie6.com/showing')
+    _r = _session.get(site_url('/showing'))
     _r.html.render(timeout=30)
-    _links = [__l for __l in _r.html.absolute_links if 'https://hkmovie6.com/movie' in str(__l)]
+    _links = [__l for __l in _r.html.absolute_links if site_url('/movie') in str(__l)]
     _session.close()
     return _links
 
@@ -35,7 +36,7 @@ if __name__ == "hkmovie.hkmovie.spiders.MovieSpider":
 class MoviespiderSpider(scrapy.Spider):
     name = 'MovieSpider'
     allowed_domains = ['https://hkmovie6.com/showing']
-    start_urls = ['https://hkmovie6.com/showing/']
+    start_urls = [site_url('/showing/')]
 
     def parse(self, response):
         for _link in links:
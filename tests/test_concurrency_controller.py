@@ -0,0 +1,80 @@
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from hkmovie.ConcurrencyController import AdaptiveConcurrency
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Tests - Adaptive Concurrency Controller |}
+#
+# AIMD: a healthy window adds `increase` workers up to max_workers, a window with too many errors or too slow a median
+# latency multiplies the limit by `decrease` down to min_workers; every slot is exactly one observation.
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+
+class Terminator(Exception):
+    pass
+
+
+def controller(**kwargs):
+    return AdaptiveConcurrency(**dict(dict(min_workers=1, max_workers=8, initial=4, target_latency=1.0, window=4),
+                                      **kwargs))
+
+
+class AimdTest(unittest.TestCase):
+    def test_healthy_window_increases_additively(self):
+        _controller = controller()
+        for _ in range(4 * 6):
+            _controller.observe(latency=0.5)
+        self.assertEqual([_d[1:3] for _d in _controller.decisions],
+                         [(4, 5), (5, 6), (6, 7), (7, 8), (8, 8), (8, 8)])
+
+    def test_errors_decrease_multiplicatively(self):
+        _controller = controller(initial=8)
+        for _ in range(3):
+            for _ in range(3):
+                _controller.observe(latency=0.5)
+            _controller.observe(error='Terminator')
+        self.assertEqual([_d[1:3] for _d in _controller.decisions], [(8, 4), (4, 2), (2, 1)])
+        self.assertIn('Terminator: 1', _controller.decisions[0][3])
+
+    def test_slow_median_decreases(self):
+        _controller = controller(initial=6)
+        for _latency in (0.5, 2.0, 2.0, 3.0):
+            _controller.observe(latency=_latency)
+        self.assertEqual(_controller.limit, 3)
+
+    def test_baseline_sets_target_latency(self):
+        _controller = controller(target_latency=None, slowdown=2.0)
+        for _latency in (1.0, 1.0, 1.5, 1.5):
+            _controller.observe(latency=_latency)
+        self.assertEqual((_controller.target_latency, _controller.limit), (3.0, 5))
+
+
+class SlotTest(unittest.TestCase):
+    def setUp(self):
+        self.controller = controller(window=100)
+
+    def test_handled_error_is_the_only_outcome(self):
+        # ! - e.g., automate_scrape: a Terminator, then a successful retry with another driver
+        with self.controller.slot() as _outcome:
+            _outcome.fail('Terminator')
+            _outcome.fail('RetryError')
+        self.assertEqual((self.controller._latencies, self.controller._errors), ([], {'Terminator': 1}))
+
+    def test_raised_error_is_the_only_outcome(self):
+        with self.assertRaises(Terminator), self.controller.slot():
+            raise Terminator()
+        self.assertEqual((self.controller._latencies, self.controller._errors), ([], {'Terminator': 1}))
+
+    def test_success_records_latency(self):
+        with self.controller.slot():
+            pass
+        self.assertEqual((len(self.controller._latencies), self.controller._errors, self.controller.active), (1, {}, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
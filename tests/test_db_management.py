@@ -0,0 +1,220 @@
+import os
+import sys
+import sqlite3
+import tempfile
+import unittest
+
+# ! - data.db_management creates the tables of HKMOVIES_DB when it is imported, a scratch database is used instead
+_SCRATCH_DIR = tempfile.TemporaryDirectory()
+os.environ['HKMOVIES_DB'] = os.path.join(_SCRATCH_DIR.name, 'import.db')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from data import db_management
+from hkmovie.SeatplanToolkit import SeatplanProcessor
+from benchmarks.seatplan_generator import generate_seatplan
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Tests - Schema migration |}
+#
+# A database of the schema before SalesBitmaps (Seats without seat_index, one SalesHistory row per sold seat,
+# Houses.svg, HouseLayouts.svg) is migrated by migrate_database(), and the sales read through vSalesHistory and
+# vSalesHistoryCount must be the same rows and counts as before. Importing db_management (create_tables_and_views)
+# must neither migrate nor drop a view.
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+OLD_SCHEMA = """
+CREATE TABLE Movies ( MovieID integer PRIMARY KEY, hkmovie6_code text NOT NULL UNIQUE, name text NOT NULL, name_en text,
+    synopsis text, release_date text, duration integer, category text, InTheatre integer NOT NULL,
+    ModifiedDate integer(4) NOT NULL DEFAULT (strftime('%s','now')),
+    EnteredDate integer(4) NOT NULL DEFAULT (strftime('%s','now')) );
+CREATE TABLE Showtimes (ShowtimeID integer PRIMARY KEY, showtime_code text NOT NULL UNIQUE, HouseID integer,
+    MovieID integer NOT NULL, start_time integer (4), EnteredDate integer (4) NOT NULL DEFAULT (strftime('%s', 'now')),
+    price INTEGER);
+CREATE TABLE Seats (SeatID integer PRIMARY KEY, seat_number text, HouseID integer, x INTEGER (4), y INTEGER (4),
+    EnteredDate integer (4) NOT NULL DEFAULT (strftime('%s', 'now')));
+CREATE TABLE SalesHistory ( ID INTEGER PRIMARY KEY, SeatID INTEGER, ShowtimeID INTEGER,
+    EnteredDate INTEGER (4) NOT NULL DEFAULT (strftime('%s', 'now') ), UNIQUE(SeatID, ShowtimeID) );
+CREATE TABLE Houses (HouseID integer PRIMARY KEY, name text NOT NULL, capacity INTEGER, svg TEXT, alias1,
+    TheatreID integer, EnteredDate integer (4) NOT NULL DEFAULT (strftime('%s', 'now')));
+CREATE TABLE HouseLayouts ( fingerprint text PRIMARY KEY, HouseID integer, capacity integer, slot_count integer,
+    row_labels text, svg text, x blob, y blob, col blob, row_index blob, fill_slot blob,
+    EnteredDate integer(4) NOT NULL DEFAULT (strftime('%s','now')) );
+CREATE VIEW vSalesHistoryCount AS select a.ShowtimeID, COUNT(a.ShowtimeID) as 'cnt' from SalesHistory a
+group by a.ShowtimeID;
+"""
+
+SALES_ROWS = "SELECT SeatID, ShowtimeID, EnteredDate FROM {view} ORDER BY ShowtimeID, SeatID"
+SALES_COUNTS = "SELECT ShowtimeID, cnt FROM vSalesHistoryCount ORDER BY ShowtimeID"
+
+
+def create_old_database(path):
+    """
+    2 houses (12 and 5 seats, seats of house 1 inserted after some of house 2), 4 shows:
+        show 1: 7 seats sold over 3 scrapes, show 2: 1 seat, show 3: every seat of house 2, show 4: none
+    plus one SalesHistory row of a seat that is not in Seats
+    """
+    _conn = sqlite3.connect(path)
+    _conn.executescript(OLD_SCHEMA)
+    _conn.execute("INSERT INTO Movies (hkmovie6_code, name, InTheatre) VALUES ('m1', 'movie', 1)")
+    _conn.executemany("INSERT INTO Houses (HouseID, name, capacity, svg) VALUES (?, ?, ?, ?)",
+                      [(1, 'house 1', 12, '<svg><g/></svg>'), (2, 'house 2', 5, None)])
+    _conn.executemany("INSERT INTO HouseLayouts (fingerprint, HouseID, capacity, svg) VALUES (?, ?, ?, ?)",
+                      [('a', 1, 12, '<svg><g/></svg>'), ('b', 2, 5, '<svg><g id="b"/></svg>')])
+    _seats = [(2, _i, 0) for _i in range(3)] + [(1, _i, _i // 4) for _i in range(12)] + [(2, _i, 0) for _i in (3, 4)]
+    _conn.executemany("INSERT INTO Seats (HouseID, x, y, seat_number) VALUES (?, ?, ?, 'A1')", _seats)
+    _conn.executemany("INSERT INTO Showtimes (ShowtimeID, showtime_code, HouseID, MovieID) VALUES (?, ?, ?, 1)",
+                      [(1, 's1', 1), (2, 's2', 1), (3, 's3', 2), (4, 's4', 1)])
+    _house_1 = [_id for _id, in _conn.execute("SELECT SeatID FROM Seats WHERE HouseID = 1 ORDER BY SeatID")]
+    _house_2 = [_id for _id, in _conn.execute("SELECT SeatID FROM Seats WHERE HouseID = 2 ORDER BY SeatID")]
+    _sales = [(_house_1[_i], 1, 1000) for _i in (0, 5, 11)] + [(_house_1[_i], 1, 2000) for _i in (1, 8)] + \
+             [(_house_1[_i], 1, 3000) for _i in (2, 9)] + [(_house_1[7], 2, 1500)] + \
+             [(_seat_id, 3, 1200) for _seat_id in _house_2] + [(999, 2, 1500)]
+    _conn.executemany("INSERT INTO SalesHistory (SeatID, ShowtimeID, EnteredDate) VALUES (?, ?, ?)", _sales)
+    _conn.commit()
+    return _conn
+
+
+class MigrateSchemaTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(_SCRATCH_DIR.name, f'{self.id()}.db')
+        self.conn = create_old_database(self.path)
+        # ! - the seat that is not in Seats cannot be migrated, it is left in SalesHistory
+        self.orphan = "SeatID NOT IN (SELECT SeatID FROM Seats)"
+        self.rows = self.conn.execute(
+            f"SELECT SeatID, ShowtimeID, EnteredDate FROM SalesHistory WHERE NOT {self.orphan} "
+            "ORDER BY ShowtimeID, SeatID").fetchall()
+        self.counts = self.conn.execute(
+            f"SELECT ShowtimeID, COUNT(*) FROM SalesHistory WHERE NOT {self.orphan} "
+            "GROUP BY ShowtimeID ORDER BY ShowtimeID").fetchall()
+        self.old_counts = self.conn.execute(SALES_COUNTS).fetchall()
+        self.conn.close()
+
+    def migrate(self):
+        db_management.migrate_database(self.path)
+        self.conn = sqlite3.connect(self.path)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_views_match_sales_history(self):
+        self.migrate()
+        self.assertEqual(self.conn.execute(SALES_ROWS.format(view='vSalesHistory')).fetchall(), self.rows)
+        self.assertEqual(self.conn.execute(SALES_COUNTS).fetchall(), self.counts)
+        self.assertEqual([_c for _c in self.old_counts if _c[0] != 2], [_c for _c in self.counts if _c[0] != 2])
+
+    def test_sales_history_is_folded(self):
+        self.migrate()
+        self.assertEqual(self.conn.execute("SELECT SeatID, ShowtimeID FROM SalesHistory").fetchall(), [(999, 2)])
+        # ! - one delta per scrape (EnteredDate) of a show
+        self.assertEqual(self.conn.execute(
+            "SELECT ShowtimeID, EnteredDate, ticket_sold FROM SalesDeltas ORDER BY ShowtimeID, EnteredDate").fetchall(),
+            [(1, 1000, 3), (1, 2000, 2), (1, 3000, 2), (2, 1500, 1), (3, 1200, 5)])
+        self.assertEqual(self.conn.execute("SELECT ShowtimeID, HouseID, ticket_sold FROM SalesBitmaps "
+                                           "ORDER BY ShowtimeID").fetchall(), [(1, 1, 7), (2, 1, 1), (3, 2, 5)])
+
+    def test_seat_index_numbers_each_house(self):
+        self.migrate()
+        for _house_id, _size in ((1, 12), (2, 5)):
+            self.assertEqual([_i for _i, in self.conn.execute(
+                "SELECT seat_index FROM Seats WHERE HouseID = ? ORDER BY SeatID", [_house_id])], list(range(_size)))
+
+    def test_house_svg_is_moved_to_blobs(self):
+        self.migrate()
+        _svg, _hash = self.conn.execute("SELECT svg, svg_hash FROM Houses WHERE HouseID = 1").fetchone()
+        self.assertIsNone(_svg)
+        self.assertEqual(db_management.SvgBlobStore(self.conn.cursor()).get(_hash), '<svg><g/></svg>')
+
+    def test_layout_svg_is_moved_to_blobs(self):
+        self.migrate()
+        _store = db_management.SvgBlobStore(self.conn.cursor())
+        _layouts = self.conn.execute("SELECT fingerprint, svg, svg_hash FROM HouseLayouts ORDER BY fingerprint")
+        self.assertEqual([(_fingerprint, _svg, _store.get(_hash)) for _fingerprint, _svg, _hash in _layouts],
+                         [('a', None, '<svg><g/></svg>'), ('b', None, '<svg><g id="b"/></svg>')])
+        # ! - the svg shared by house 1 and its layout is stored once
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM SvgBlobs").fetchone(), (2,))
+
+    def test_migration_runs_once(self):
+        self.migrate()
+        _deltas = self.conn.execute("SELECT COUNT(*) FROM SalesDeltas").fetchone()
+        self.conn.close()
+        self.migrate()
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM SalesDeltas").fetchone(), _deltas)
+        self.assertEqual(self.conn.execute(SALES_ROWS.format(view='vSalesHistory')).fetchall(), self.rows)
+
+    def test_tables_are_not_migrated_on_import(self):
+        with self.assertRaises(RuntimeError):
+            db_management.create_tables_and_views(self.path)
+        self.conn = sqlite3.connect(self.path)
+        self.assertEqual(self.conn.execute(SALES_COUNTS).fetchall(), self.old_counts)
+        self.assertNotIn('seat_index', [_c[1] for _c in self.conn.execute("PRAGMA table_info(Seats)")])
+
+    def test_migrated_views_are_kept_on_import(self):
+        self.migrate()
+        _views = self.conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'view' ORDER BY name").fetchall()
+        self.conn.close()
+        self.assertTrue(db_management.create_tables_and_views(self.path))
+        self.conn = sqlite3.connect(self.path)
+        self.assertEqual(self.conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'view' ORDER BY name").fetchall(), _views)
+
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Tests - Seat registry |}
+#
+# SeatRegistry numbers the seats of a house (seat_index) in the order they are first seen and never creates a seat
+# twice; seats stored without seat_number (seats for disabled, before column numbers were inferred) get the number
+# of a seat plan whose columns were inferred (SeatplanLayout), the same number as a full parse then patched.
+# (Seats are keyed on (x, y), the two halves of a double seat share one; plans without double seats are used.)
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+
+def all_seats(svg, patched):
+    """:return: every seat of a seat plan (all taken), as SeatplanProcessor.get_occupied_seats() lists them"""
+    _sp = SeatplanProcessor(svg)
+    if patched:
+        _sp.patch_missing_column()
+    return list(_sp.get_occupied_seats())
+
+
+class SeatRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(_SCRATCH_DIR.name, f'{self.id()}.db')
+        db_management.create_tables_and_views(self.path)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("INSERT INTO Houses (HouseID, name) VALUES (1, 'House 1')")
+        self.svg = generate_seatplan(120, double_rows=0, accessible=4, taken_ratio=1.0, seed=1)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def seats(self):
+        return self.conn.execute("SELECT seat_index, seat_number, x, y FROM Seats ORDER BY seat_index").fetchall()
+
+    def test_seats_are_numbered_in_order_once(self):
+        _seats = all_seats(self.svg, patched=True)
+        _registry = db_management.SeatRegistry(self.conn.cursor())
+        _resolved = _registry.resolve(1, _seats[:50])
+        self.assertEqual([_index for _id, _index in _resolved], list(range(50)))
+        # ! - a later run (new registry) continues after the last seat_index, seats already stored are not created
+        _registry = db_management.SeatRegistry(self.conn.cursor())
+        self.assertEqual(_registry.resolve(1, _seats)[:50], _resolved)
+        self.assertEqual(_registry.created, len(_seats) - 50)
+        self.assertEqual(self.seats(), [(_i, _s['seat_number'], _s['x'], _s['y']) for _i, _s in enumerate(_seats)])
+
+    def test_unnumbered_seats_get_the_inferred_number(self):
+        _unpatched, _patched = all_seats(self.svg, patched=False), all_seats(self.svg, patched=True)
+        self.assertEqual(sum(_s['seat_number'] is None for _s in _unpatched), 4)
+        db_management.SeatRegistry(self.conn.cursor()).resolve(1, _unpatched)
+        _registry = db_management.SeatRegistry(self.conn.cursor())
+        _registry.resolve(1, _patched)
+        self.assertEqual((_registry.created, _registry.renumbered), (0, 4))
+        self.assertEqual(self.seats(), [(_i, _s['seat_number'], _s['x'], _s['y']) for _i, _s in enumerate(_patched)])
+        self.assertEqual([_s['seat_number'] for _s in _patched], [_s['seat_number'] for _s in all_seats(
+            generate_seatplan(120, double_rows=0, accessible=0, taken_ratio=1.0, seed=1), patched=False)])
+
+
+if __name__ == "__main__":
+    unittest.main()
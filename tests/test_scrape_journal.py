@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import unittest
+import orjson
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from hkmovie.ScrapeJournal import ScrapeJournal
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Tests - Scrape Journal |}
+#
+# The journal of a run that crashed must survive the next run: its profiles are replayed and exported,
+# its shows are not scraped again, and a line cut short by the crash does not corrupt the lines appended after it.
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+
+def entry(showtime_code):
+    return orjson.dumps({"hkmovie6_code": 'm1', "profile": {"showtime_code": showtime_code, "house": 'House 1'}})
+
+
+class ScrapeJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'journal', 'seatplan-last_n_hour.jsonl')
+        os.makedirs(os.path.dirname(self.path))
+        # ! - a crashed run: two complete lines and one cut short
+        with open(self.path, 'wb') as f:
+            f.write(entry('s1') + b'\n' + entry('s2') + b'\n' + entry('s3')[:20])
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_crashed_journal_is_kept(self):
+        _journal = ScrapeJournal(self.path, sync=False)
+        self.assertEqual([_p["showtime_code"] for _p in _journal.profiles()], ['s1', 's2'])
+        self.assertEqual(_journal.pending({'m1': ['s1', 's2', 's3'], 'm2': ['s1']}), {'m1': ['s3']})
+        _journal.close()
+
+    def test_appends_after_partial_line(self):
+        _journal = ScrapeJournal(self.path, sync=False)
+        _journal.append('m1', {"showtime_code": 's3', "house": 'House 1'})
+        _journal.close()
+        _journal = ScrapeJournal(self.path, sync=False)
+        self.assertEqual([_p["showtime_code"] for _p in _journal.profiles()], ['s1', 's2', 's3'])
+        _journal.close(remove=True)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_new_journal_is_empty(self):
+        _journal = ScrapeJournal(os.path.join(self.dir.name, 'new', 'seatplan.jsonl'), sync=False)
+        self.assertEqual((_journal.profiles(), _journal.pending({'m1': ['s1']})), ([], {'m1': ['s1']}))
+        _journal.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
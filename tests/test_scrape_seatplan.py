@@ -0,0 +1,101 @@
+import os
+import sys
+import sqlite3
+import tempfile
+import unittest
+
+# ! - data.db_management creates the tables of HKMOVIES_DB when it is imported, a scratch database is used instead
+_SCRATCH_DIR = tempfile.TemporaryDirectory()
+os.environ['HKMOVIES_DB'] = os.path.join(_SCRATCH_DIR.name, 'import.db')
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from data import db_management
+from hkmovie.SeatplanToolkit import SeatplanProcessor
+from ScheduledTasks.scrape_seatplan import export_profile_to_db
+from benchmarks.seatplan_generator import generate_seatplan
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Tests - Export of scraped seat plans |}
+#
+# export_profile_to_db() on a scratch database, seat plans from benchmarks.seatplan_generator:
+#   a show scraped again without any change writes nothing (SalesBitmaps, SalesDeltas, Houses, Seats)
+#   only seats newly taken since the previous scrape become a SalesDeltas row, seats taken stay taken
+#   a show that moves to another house starts over in that house, nothing of the former house's bitmap is kept
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+
+def profile(showtime_code, house, seatplan):
+    return {"showtime_code": showtime_code, "house": house, "seatplan": seatplan, "start_time": 1700000000,
+            "price": 100}
+
+
+class ExportProfileTest(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(_SCRATCH_DIR.name, f'{self.id()}.db')
+        db_management.create_tables_and_views(self.path)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("INSERT INTO Movies (hkmovie6_code, name, InTheatre) VALUES ('m1', 'movie', 1)")
+        self.conn.executemany("INSERT INTO Showtimes (showtime_code, MovieID) VALUES (?, 1)", [('s1',), ('s2',)])
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def export(self, *profiles):
+        export_profile_to_db(list(profiles), max_workers=1, db_path=self.path)
+
+    def count_writes(self):
+        """log every insert and update of the sales and seat tables into Writes"""
+        self.conn.execute("CREATE TABLE Writes (name text)")
+        for _table in ('SalesBitmaps', 'SalesDeltas', 'Houses', 'Seats'):
+            for _event in ('INSERT', 'UPDATE'):
+                self.conn.execute(f"CREATE TRIGGER log_{_event}_{_table} AFTER {_event} ON {_table} "
+                                  f"BEGIN INSERT INTO Writes VALUES ('{_event} {_table}'); END")
+        self.conn.commit()
+
+    def writes(self):
+        return [_name for _name, in self.conn.execute("SELECT name FROM Writes")]
+
+    def delta_seats(self):
+        """:return: list of the (x, y) of the seats of each SalesDeltas row, in insertion order"""
+        _seats = dict(((_index, (_x, _y)) for _index, _x, _y in self.conn.execute(
+            "SELECT seat_index, x, y FROM Seats")))
+        return [sorted(_seats[_i] for _i in db_management.decode_seat_bitmap(_bitmap))
+                for _bitmap, in self.conn.execute("SELECT bitmap FROM SalesDeltas ORDER BY DeltaID")]
+
+    def test_repeated_scrape_is_skipped(self):
+        _svg = generate_seatplan(120, seed=1)
+        self.export(profile('s1', 'House 1', _svg), profile('s2', 'House 1', generate_seatplan(120, seed=2)))
+        self.count_writes()
+        self.export(profile('s1', 'House 1', _svg))
+        self.assertEqual(self.writes(), [])
+
+    def test_only_new_seats_become_deltas(self):
+        # ! - the same seed draws the same numbers, the seats taken at 0.2 are also taken at 0.5
+        _early, _late = (generate_seatplan(120, double_rows=0, taken_ratio=_r, seed=1) for _r in (0.2, 0.5))
+        _taken = [sorted((_s['x'], _s['y']) for _s in SeatplanProcessor(_svg).get_occupied_seats())
+                  for _svg in (_early, _late)]
+        self.export(profile('s1', 'House 1', _early))
+        self.export(profile('s1', 'House 1', _late))
+        self.assertEqual(self.delta_seats(), [_taken[0], sorted(set(_taken[1]) - set(_taken[0]))])
+        # ! - seats released since (fewer taken) are kept as sold, nothing is written
+        self.count_writes()
+        self.export(profile('s1', 'House 1', _early))
+        self.assertEqual(self.writes(), [])
+        self.assertEqual(self.conn.execute("SELECT ticket_sold FROM SalesBitmaps").fetchone(), (len(_taken[1]),))
+
+    def test_show_moved_to_another_house_starts_over(self):
+        _first, _second = generate_seatplan(120, seed=1), generate_seatplan(250, seed=2)
+        self.export(profile('s1', 'House 1', _first))
+        self.export(profile('s1', 'House 2', _second))
+        _taken = len(list(SeatplanProcessor(_second).get_occupied_seats()))
+        self.assertEqual(self.conn.execute(
+            "SELECT h.name, b.ticket_sold FROM SalesBitmaps AS b INNER JOIN Houses AS h ON b.HouseID = h.HouseID"
+        ).fetchall(), [('House 2', _taken)])
+        self.assertEqual(self.conn.execute("SELECT ticket_sold FROM SalesDeltas").fetchall(), [(_taken,)])
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM vSalesHistory").fetchone(), (_taken,))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import sys
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from hkmovie.SeatplanHttpFetcher import SeatplanHttpFetcher, SeatplanDecodeError
+from hkmovie.AsyncOrchestrator import AsyncOrchestrator
+from hkmovie.SeatplanToolkit import layout_fingerprint
+from benchmarks.seatplan_generator import generate_seatplan, render_showtime_page
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Tests - SeatplanHttpFetcher.decode_page |}
+#
+# A page decoded without a browser must give the same house name and layout fingerprint as SeatplanScraper,
+# so that a run mixing both fetch modes neither creates a second Houses row nor a second layout of a house.
+# A seat plan that SeatplanProcessor could not parse must be left to the browser (SeatplanDecodeError).
+# fetch_async() (aiohttp, awaited by AsyncOrchestrator) must decode the same profiles as fetch(), from a local server.
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+
+class DecodePageTest(unittest.TestCase):
+    def test_house_is_read_as_the_browser_shows_it(self):
+        _page = render_showtime_page(generate_seatplan(120, seed=1), 'House&nbsp;1\n  (Dolby &amp; Atmos)',
+                                     start_time=1700000000, price=120)
+        _profile = SeatplanHttpFetcher.decode_page(_page, 's1')
+        # ! - WebElement.text collapses the whitespace of the element
+        self.assertEqual(_profile['house'], 'House 1 (Dolby & Atmos)')
+        self.assertEqual((_profile['start_time'], _profile['price']), (1700000000, 120))
+
+    def test_house_falls_back_to_show_state(self):
+        _page = render_showtime_page(generate_seatplan(120, seed=1), 'House 1').replace(
+            '<div class="name f row wrap"><div>House 1</div></div>', '')
+        self.assertEqual(SeatplanHttpFetcher.decode_page(_page, 's1')['house'], 'House 1')
+
+    def test_seatplan_has_the_fingerprint_of_outer_html(self):
+        _svg = generate_seatplan(120, seed=1)
+        _page = render_showtime_page(_svg.replace(' xmlns:xlink="http://www.w3.org/1999/xlink"', ''), 'House 1')
+        _seatplan = SeatplanHttpFetcher.decode_page(_page, 's1')['seatplan']
+        self.assertEqual(layout_fingerprint(_seatplan), layout_fingerprint(_svg))
+
+    def test_malformed_seatplan_is_left_to_the_browser(self):
+        _svg = generate_seatplan(120, seed=1)
+        for _broken in (_svg.replace('</g>', '', 1), _svg.replace('SCREEN', 'SCREEN&nbsp;')):
+            with self.subTest(svg=_broken[-40:]), self.assertRaises(SeatplanDecodeError):
+                SeatplanHttpFetcher.decode_page(render_showtime_page(_broken, 'House 1'), 's1')
+
+
+class ShowtimePageHandler(BaseHTTPRequestHandler):
+    """serves /movie/m1/SHOWTIME/{showtime_code} for PAGES, 404 otherwise"""
+    PAGES = {'s1': render_showtime_page(generate_seatplan(120, seed=1), 'House 1', start_time=1700000000, price=120),
+             's2': render_showtime_page(generate_seatplan(250, seed=2), 'House 2', start_time=1700003600, price=95)}
+
+    def do_GET(self):
+        _page = self.PAGES.get(self.path.rsplit('/', 1)[-1]) if self.path.startswith('/movie/m1/SHOWTIME/') else None
+        self.send_response(200 if _page else 404)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.end_headers()
+        self.wfile.write((_page or '').encode('utf-8'))
+
+    def log_message(self, *args):
+        pass
+
+
+class FetchAsyncTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ShowtimePageHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.fetcher = SeatplanHttpFetcher(base_url=f'http://127.0.0.1:{self.server.server_port}', pool_size=2)
+        if not self.fetcher.async_capable:
+            self.skipTest('aiohttp is not installed')
+
+    def tearDown(self):
+        self.fetcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_profiles_match_fetch(self):
+        async def _task(_orchestrator, _code):
+            try:
+                return await _orchestrator.http('127.0.0.1', self.fetcher.fetch_async, 'm1', _code)
+            except SeatplanDecodeError:
+                return 'fallback'
+
+        _results = AsyncOrchestrator(rate=100, burst=3, browser_workers=1, http_workers=1).run(
+            _task, ['s1', 's2', 'missing'], finalize=self.fetcher.close_async)
+        self.assertEqual(_results, [self.fetcher.fetch('m1', 's1'), self.fetcher.fetch('m1', 's2'), 'fallback'])
+        self.assertIsNone(self.fetcher.async_session)
+        self.assertEqual((self.fetcher.decoded, self.fetcher.failed), (4, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import re
+import sys
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from hkmovie.SeatplanToolkit import LayoutCache, SeatplanProcessor, SeatplanSnapshot, SeatSpatialIndex, SeatTable, \
+    layout_fingerprint
+from benchmarks.seatplan_generator import generate_seatplan, DEFAULT_LAYOUTS
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Tests - Layout fingerprint |}
+#
+# SeatplanScraper reads the seat plan from the browser (outerHTML), SeatplanHttpFetcher from the page source.
+# Both serializations of the same house must give the same layout fingerprint, otherwise LayoutCache parses
+# the seat plan again and assign_house() replaces the layout of the house on every switch between them.
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+
+def page_source_form(svg):
+    """
+    :param svg: seat plan as outerHTML serializes it (benchmarks.seatplan_generator)
+    :return: the same seat plan as the server renders it: no xmlns:xlink, self-closing <rect/>, compact style
+        attributes, &#39;-style character references and line breaks between groups
+    """
+    _svg = svg.replace(' xmlns:xlink="http://www.w3.org/1999/xlink"', '')
+    _svg = re.sub(r'<rect([^>]*)></rect>', r'<rect\1/>', _svg)
+    _svg = re.sub(r'style="([^"]*)"', lambda _m: 'style="' + _m.group(1).replace(' ', '') + '"', _svg)
+    return _svg.replace('<g>', '\n  <g>').replace('SCREEN', 'SCR&#69;EN')
+
+
+class LayoutFingerprintTest(unittest.TestCase):
+    def setUp(self):
+        self.dom = generate_seatplan(120, seed=1)
+        self.source = page_source_form(generate_seatplan(120, seed=2))
+
+    def test_serializations_share_fingerprint(self):
+        self.assertNotEqual(self.dom, self.source)
+        self.assertEqual(layout_fingerprint(self.dom), layout_fingerprint(self.source))
+
+    def test_colors_only_differ(self):
+        self.assertNotEqual(layout_fingerprint(self.dom), layout_fingerprint(generate_seatplan(250, seed=1)))
+
+    def test_cached_layout_reads_other_serialization(self):
+        _cache = LayoutCache()
+        self.assertIsInstance(_cache.process(self.dom, house_id=1), SeatplanProcessor)
+        _snapshot = _cache.process(self.source, house_id=1)
+        self.assertIsInstance(_snapshot, SeatplanSnapshot)
+        self.assertEqual(_cache.house_fingerprints, {1: layout_fingerprint(self.dom)})
+        self.assertEqual(list(_snapshot.get_occupied_seats()),
+                         list(SeatplanProcessor(self.source).get_occupied_seats()))
+
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Tests - Missing column numbers |}
+#
+# Unlabelled seats (seats for disabled) get the column number they would have if labelled: the same plan generated
+# with every seat labelled is the expected result. SeatSpatialIndex must find what a scan of every row finds,
+# and a seat plan read from a cached layout must list the same seat numbers as a full parse then patched.
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+
+def nearest_columns(seats, rotation, x, row_index):
+    """:return: columns of the labelled seats at (rotation, x +/- 1) in the nearest rows, scanning every seat"""
+    _candidates = [(abs(seats.row_index[_i] - row_index), seats.col[_i]) for _i in range(len(seats))
+                   if seats.col[_i] != SeatTable.NO_COLUMN and seats.rotation[_i] == rotation
+                   and abs(seats.x[_i] - x) <= SeatSpatialIndex.X_TOLERANCE and seats.row_index[_i] != row_index]
+    return {_col for _distance, _col in _candidates if _distance == min(_candidates)[0]}
+
+
+class MissingColumnTest(unittest.TestCase):
+    def test_inferred_columns_match_labelled_plan(self):
+        for _name, _capacity, _double_rows, _accessible in DEFAULT_LAYOUTS:
+            with self.subTest(layout=_name):
+                _sp = SeatplanProcessor(generate_seatplan(_capacity, _double_rows, _accessible, seed=1))
+                self.assertEqual(_sp.patch_missing_column(), _accessible)
+                self.assertEqual(_sp.seats.col, SeatplanProcessor(
+                    generate_seatplan(_capacity, _double_rows, 0, seed=1)).seats.col)
+
+    def test_row_without_labels_is_inferred_from_nearest_row(self):
+        # ! - 10 seats per row, the whole first row is unlabelled
+        _sp = SeatplanProcessor(generate_seatplan(50, double_rows=0, accessible=10, seed=1))
+        self.assertEqual(_sp.patch_missing_column(), 10)
+        self.assertEqual(_sp.seats.col, SeatplanProcessor(generate_seatplan(50, double_rows=0, accessible=0, seed=1)
+                                                          ).seats.col)
+
+    def test_spatial_index_matches_row_scan(self):
+        _seats = SeatplanProcessor(generate_seatplan(400, double_rows=2, accessible=4, seed=1)).seats
+        _index = SeatSpatialIndex(_seats)
+        for _i in range(len(_seats)):
+            for _x in (_seats.x[_i] - 1, _seats.x[_i], _seats.x[_i] + 2):
+                _expected = nearest_columns(_seats, _seats.rotation[_i], _x, _seats.row_index[_i])
+                _column = _index.nearest_column(_seats.rotation[_i], _x, _seats.row_index[_i])
+                self.assertEqual(_column is None, not _expected)
+                if _expected:
+                    self.assertIn(_column, _expected)
+
+    def test_cached_layout_matches_patched_full_parse(self):
+        _cache = LayoutCache()
+        _cache.process(generate_seatplan(250, accessible=4, seed=1))
+        _svg = generate_seatplan(250, accessible=4, taken_ratio=0.9, seed=2)
+        _snapshot = _cache.process(_svg)
+        self.assertIsInstance(_snapshot, SeatplanSnapshot)
+        _sp = SeatplanProcessor(_svg)
+        _sp.patch_missing_column()
+        _seats = list(_sp.get_occupied_seats())
+        # ! - A1 to A4 are unlabelled, some of them are taken
+        self.assertTrue({'A3', 'A4'} <= {_s['seat_number'] for _s in _seats})
+        self.assertEqual(list(_snapshot.get_occupied_seats()), _seats)
+
+
+if __name__ == "__main__":
+    unittest.main()
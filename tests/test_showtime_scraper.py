@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+from hkmovie.ShowtimeFirefoxScraper import ShowtimeScraper
+from hkmovie.PageReadiness import PacingPolicy
+
+# =====================================================================================================================|
+# =====================================================================================================================|
+# {| Tests - ShowtimeScraper date clicks |}
+#
+# A click that cannot send a request (the date already shown) is skipped without waiting, and a click that is not
+# answered is waited for once (ready_timeout), not again by scrape(): it is not counted as an expected response.
+# No browser is started, the driver and the date buttons are stand-ins.
+# =====================================================================================================================|
+# =====================================================================================================================|
+
+
+class DateCell:
+    def __init__(self, classes, answered=True):
+        self.classes = classes
+        self.answered = answered
+
+    def get_attribute(self, name):
+        return self.classes if name == 'class' else None
+
+
+class Driver:
+    """answers execute_script("arguments[0].click();", cell) with a gRPC response if the cell is answered"""
+    def __init__(self, scraper):
+        self.scraper = scraper
+        self.clicked = list()
+
+    def execute_script(self, script, element):
+        self.clicked.append(element)
+        if element.answered:
+            self.scraper.num_of_resp += 1
+
+
+def scraper_without_browser():
+    _scraper = ShowtimeScraper.__new__(ShowtimeScraper)
+    _scraper.scoped_capture, _scraper.num_of_resp, _scraper.dropped_responses = True, 0, 0
+    _scraper.pacing, _scraper.ready_timeout, _scraper.hkmovie6_code = PacingPolicy(), 0.3, 'm1'
+    _scraper.selected_classes = {'selected'}
+    _scraper.driver = Driver(_scraper)
+    return _scraper
+
+
+class ClickTest(unittest.TestCase):
+    def setUp(self):
+        self.scraper = scraper_without_browser()
+
+    def test_answered_click_is_expected(self):
+        self.assertTrue(self.scraper._click(DateCell('swiper-slide dateCell')))
+
+    def test_date_shown_is_not_clicked(self):
+        _t0 = time.perf_counter()
+        self.assertFalse(self.scraper._click(DateCell('swiper-slide dateCell selected', answered=False)))
+        self.assertLess(time.perf_counter() - _t0, 0.1)
+        self.assertEqual(self.scraper.driver.clicked, [])
+
+    def test_unanswered_click_is_not_expected(self):
+        _cell = DateCell('swiper-slide dateCell', answered=False)
+        self.assertFalse(self.scraper._click(_cell))
+        self.assertEqual(self.scraper.driver.clicked, [_cell])
+
+
+if __name__ == "__main__":
+    unittest.main()